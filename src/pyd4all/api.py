@@ -8,6 +8,7 @@ from contextlib import asynccontextmanager
 import coloredlogs
 from fastapi import FastAPI
 
+from pyd4all.utils.compression_tools import CompressionMiddleware
 from pyd4all.utils.dir_tools import project_root_dir
 
 
@@ -26,6 +27,7 @@ async def lifespan(app: FastAPI) -> AsyncGenerator[None, None]:
 
 
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(CompressionMiddleware)
 
 
 @app.get("/compute")
@@ -6,6 +6,10 @@ class Settings(BaseSettings):
     input_channel: str = Field("input_channel", env="INPUT_CHANNEL")
     output_channel: str = Field("output_channel", env="OUTPUT_CHANNEL")
     redis_url: str = Field("redis://localhost:6379")
+    # threads sync handlers run in, anyio's default is 40
+    thread_pool_size: int = Field(40, ge=1)
+    # run sync handlers marked `cheap` on the event loop instead of in a thread
+    inline_sync_handlers: bool = Field(False)
 
     class Config:
         env_file = ".env"
@@ -1,11 +1,13 @@
 from __future__ import annotations as _annotations
 
+import asyncio
+import contextlib
 import sys
 from contextlib import asynccontextmanager
 
 import uvicorn
-from fastapi import FastAPI
-from fastapi.responses import HTMLResponse, PlainTextResponse
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse
 from fastui import prebuilt_html
 from fastui.auth import fastapi_auth_exception_handling
 from fastui.dev import dev_fastapi_app
@@ -14,16 +16,34 @@ from httpx import AsyncClient
 from pyd4all.examples.demo.auth import router as auth_router
 from pyd4all.examples.demo.components_list import router as components_router
 from pyd4all.examples.demo.forms import router as forms_router
+from pyd4all.examples.demo.jobs import JOB_WORKERS, job_queue
+from pyd4all.examples.demo.jobs import router as jobs_router
 from pyd4all.examples.demo.sse import router as sse_router
 from pyd4all.examples.demo.tables import router as table_router
+from pyd4all.utils.compression_tools import CompressionMiddleware
+from pyd4all.utils.http_tools import CachingTransport
+from pyd4all.utils.response_tools import Precompressed
 from pyd4all.utils.routing_tools import load_filesystem_routes
+from pyd4all.utils.thread_tools import thread_pool
 
 
 @asynccontextmanager
 async def lifespan(app_: FastAPI):
-    async with AsyncClient() as client:
+    transport = CachingTransport()
+    async with AsyncClient(transport=transport) as client:
         app_.state.httpx_client = client
-        yield
+        app_.state.http_metrics = transport.metrics
+        # sized before the first request; `thread_pool.stats()` shows how busy it is
+        thread_pool.limiter()
+        app_.state.thread_pool = thread_pool
+        await job_queue.start(JOB_WORKERS)
+        try:
+            yield
+        finally:
+            # jobs still running after that are cancelled, and queued again for the next start
+            with contextlib.suppress(TimeoutError):
+                async with asyncio.timeout(10):
+                    await job_queue.stop()
 
 
 frontend_reload = '--reload' in sys.argv
@@ -34,11 +54,13 @@ else:
     app = FastAPI(lifespan=lifespan)
 
 fastapi_auth_exception_handling(app)
+app.add_middleware(CompressionMiddleware)
 app.include_router(components_router, prefix='/api/components')
 app.include_router(sse_router, prefix='/api/components')
 app.include_router(table_router, prefix='/api/table')
 app.include_router(forms_router, prefix='/api/forms')
 app.include_router(auth_router, prefix='/api/auth')
+app.include_router(jobs_router, prefix='/api/jobs')
 # app.include_router(main_router, prefix='/api')
 
 
@@ -52,14 +74,52 @@ async def favicon_ico() -> str:
     return 'page not found'
 
 
+# the same page for every path the React app handles, so it is rendered and compressed once
+landing_html = Precompressed(prebuilt_html(title='FastUI Demo').encode(), 'text/html')
+
+
 @app.get('/{path:path}')
-async def html_landing() -> HTMLResponse:
-    return HTMLResponse(prebuilt_html(title='FastUI Demo'))
+async def html_landing(request: Request) -> Response:
+    return landing_html.respond(request)
+
+
+def benchmark_compression(repeat: int = 20) -> None:
+    """Compare bytes sent and compression CPU per request of each coding on demo pages and SSE streams."""
+    from time import process_time
+
+    from fastapi.testclient import TestClient
+
+    from pyd4all.examples.demo.sse import canned_ai_delta_generator, canned_ai_response_generator
+    from pyd4all.utils.compression_tools import CODINGS, StreamEncoder, compress
+
+    async def collect(events) -> list[bytes]:
+        return [event.encode() async for event in events]
+
+    with TestClient(app) as client:
+        payloads = {
+            path: [client.get(path, headers={'Accept-Encoding': 'identity'}).content]
+            for path in ('/api/table/cities', '/api/table/stats/countries', '/api/components')
+        }
+    payloads['sse snapshot'] = asyncio.run(collect(canned_ai_response_generator(delay=False)))
+    payloads['sse delta'] = asyncio.run(collect(canned_ai_delta_generator(delay=False)))
+
+    for name, chunks in payloads.items():
+        print(f'{name}: {sum(map(len, chunks)) / 1024:.1f} KiB identity')
+        for coding in CODINGS:
+            start = process_time()
+            for _ in range(repeat):
+                if len(chunks) == 1:
+                    size = len(compress(chunks[0], coding))
+                else:
+                    encoder = StreamEncoder(coding)
+                    size = sum(len(encoder.chunk(chunk)) for chunk in chunks) + len(encoder.finish())
+            cpu = (process_time() - start) / repeat * 1e3
+            print(f'{coding:>8}: {size / 1024:8.1f} KiB, {cpu:6.2f} ms CPU per request')
 
 
 def main():
     """Main function"""
-    from dslmodel import init_lm, init_instant, init_text
+    from dslmodel import init_instant, init_lm, init_text
     init_instant()
     load_filesystem_routes(app, "fastapi", config_path="watcher_config.yaml")
 
@@ -67,4 +127,7 @@ def main():
 
 
 if __name__ == '__main__':
-    main()
+    if sys.argv[1:] == ['benchmark']:
+        benchmark_compression()
+    else:
+        main()
@@ -6,7 +6,7 @@ import os
 from dataclasses import asdict
 from typing import Annotated, Literal, TypeAlias
 
-from fastapi import APIRouter, Depends, Request
+from fastapi import APIRouter, Depends, Header, Request
 from fastui import AnyComponent, FastUI
 from fastui import components as c
 from fastui.auth import AuthRedirect, GitHubAuthProvider
@@ -15,10 +15,13 @@ from fastui.forms import fastui_form
 from httpx import AsyncClient
 from pydantic import BaseModel, EmailStr, Field, SecretStr
 
-from .auth_user import User
+from pyd4all.utils.response_tools import fastui_response
+from pyd4all.utils.thread_tools import ThreadPoolRoute, cheap
+
+from .auth_user import User, bearer_token, token_cache
 from .shared import demo_page
 
-router = APIRouter()
+router = APIRouter(route_class=ThreadPoolRoute)
 
 GITHUB_CLIENT_ID = os.getenv('GITHUB_CLIENT_ID', '0d0315f9c2e055d032e2')
 # this will give an error when making requests to GitHub, but at least the app will run
@@ -42,6 +45,7 @@ LoginKind: TypeAlias = Literal['password', 'github']
 
 
 @router.get('/login/{kind}', response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
 def auth_login(
     kind: LoginKind,
     user: Annotated[User | None, Depends(User.from_request_opt)],
@@ -70,13 +74,15 @@ def auth_login(
         c.ServerLoad(
             path='/auth/login/content/{kind}',
             load_trigger=PageEvent(name='tab'),
-            components=auth_login_content(kind),
+            components=auth_login_content.__wrapped__(kind),
         ),
         title='Authentication',
     )
 
 
 @router.get('/login/content/{kind}', response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
+@cheap
 def auth_login_content(kind: LoginKind) -> list[AnyComponent]:
     match kind:
         case 'password':
@@ -114,6 +120,7 @@ class LoginForm(BaseModel):
 
 
 @router.post('/login', response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
 async def login_form_post(form: Annotated[LoginForm, fastui_form(LoginForm)]) -> list[AnyComponent]:
     user = User(email=form.email, extra={})
     token = user.encode_token()
@@ -121,6 +128,7 @@ async def login_form_post(form: Annotated[LoginForm, fastui_form(LoginForm)]) ->
 
 
 @router.get('/profile', response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
 async def profile(user: Annotated[User, Depends(User.from_request)]) -> list[AnyComponent]:
     return demo_page(
         c.Paragraph(text=f'You are logged in as "{user.email}".'),
@@ -138,17 +146,22 @@ async def profile(user: Annotated[User, Depends(User.from_request)]) -> list[Any
 
 
 @router.post('/logout', response_model=FastUI, response_model_exclude_none=True)
-async def logout_form_post() -> list[AnyComponent]:
+@fastui_response
+async def logout_form_post(authorization: Annotated[str, Header()] = '') -> list[AnyComponent]:
+    if token := bearer_token(authorization):
+        token_cache.invalidate(token)
     return [c.FireEvent(event=AuthEvent(token=False, url='/auth/login/password'))]
 
 
 @router.get('/login/github/gen', response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
 async def auth_github_gen(github_auth: Annotated[GitHubAuthProvider, Depends(get_github_auth)]) -> list[AnyComponent]:
     auth_url = await github_auth.authorization_url()
     return [c.FireEvent(event=GoToEvent(url=auth_url))]
 
 
 @router.get('/login/github/redirect', response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
 async def github_redirect(
     code: str,
     state: str | None,
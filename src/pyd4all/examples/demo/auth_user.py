@@ -1,4 +1,9 @@
+import hashlib
 import json
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable
 from dataclasses import asdict, dataclass
 from datetime import datetime, timedelta
 from typing import Annotated, Any
@@ -31,10 +36,11 @@ class User:
 
     @classmethod
     def from_request_opt(cls, authorization: Annotated[str, Header()] = '') -> Self | None:
-        try:
-            token = authorization.split(' ', 1)[1]
-        except IndexError:
+        token = bearer_token(authorization)
+        if token is None:
             return None
+        if (user := token_cache.get(token)) is not None:
+            return user
 
         try:
             payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
@@ -44,8 +50,10 @@ class User:
             raise HTTPException(status_code=401, detail='Invalid token')
         else:
             # existing token might not have 'exp' field
-            payload.pop('exp', None)
-            return cls(**payload)
+            exp = payload.pop('exp', None)
+            user = cls(**payload)
+            token_cache.put(token, user, exp)
+            return user
 
 
 class CustomJsonEncoder(json.JSONEncoder):
@@ -54,3 +62,80 @@ class CustomJsonEncoder(json.JSONEncoder):
             return obj.isoformat()
         else:
             return super().default(obj)
+
+
+@dataclass
+class TokenCacheStats:
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    invalidated: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class VerifiedTokenCache:
+    """Bounded LRU of users from tokens whose signature was already verified.
+
+    Entries are keyed by the SHA-256 digest of the token, so raw tokens are
+    not kept, and are dropped once the token's `exp` has passed. Cached users
+    are shared between requests and must not be modified.
+    """
+
+    def __init__(self, maxsize: int = 1024, clock: Callable[[], float] = time.time) -> None:
+        self.maxsize = maxsize
+        self.clock = clock
+        self.stats = TokenCacheStats()
+        self._entries: OrderedDict[bytes, tuple[User, float | None]] = OrderedDict()
+        # dependencies declared with `def` run on the thread pool
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> User | None:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            user, exp = entry
+            if exp is not None and exp <= self.clock():
+                # same outcome as `jwt.decode`, which rejects the token from now on
+                del self._entries[key]
+                self.stats.expired += 1
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return user
+
+    def put(self, token: str, user: User, exp: float | None) -> None:
+        with self._lock:
+            self._entries[self._key(token)] = (user, exp)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: str) -> bool:
+        with self._lock:
+            removed = self._entries.pop(self._key(token), None) is not None
+            self.stats.invalidated += removed
+            return removed
+
+
+def bearer_token(authorization: str) -> str | None:
+    try:
+        return authorization.split(' ', 1)[1]
+    except IndexError:
+        return None
+
+
+token_cache = VerifiedTokenCache()
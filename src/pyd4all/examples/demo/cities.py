@@ -0,0 +1,482 @@
+from __future__ import annotations as _annotations
+
+import hashlib
+import json
+import math
+import mmap
+import re
+import struct
+import unicodedata
+from collections.abc import Iterable
+from dataclasses import dataclass
+from functools import cache
+from pathlib import Path
+from time import perf_counter
+from types import NoneType, UnionType
+from typing import get_args
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+CITIES_FILE = Path(__file__).parent / "cities.json"
+CITIES_SNAPSHOT = CITIES_FILE.with_suffix(".bin")
+
+# snapshot layout: magic, little-endian u32 header length and a small JSON header
+# listing each column's dtype and offset, then the raw column arrays, each padded
+# to a 64-byte boundary; offsets count from the end of the padded header
+SNAPSHOT_MAGIC = b"PYDCITY1"
+SNAPSHOT_ALIGN = 64
+
+
+def _aligned(size: int) -> int:
+    return -(-size // SNAPSHOT_ALIGN) * SNAPSHOT_ALIGN
+
+
+class City(BaseModel):
+    id: int = Field(title="ID")
+    city: str = Field(title="Name")
+    city_ascii: str = Field(title="City Ascii")
+    lat: float = Field(title="Latitude")
+    lng: float = Field(title="Longitude")
+    country: str = Field(title="Country")
+    iso2: str = Field(title="ISO2")
+    iso3: str = Field(title="ISO3")
+    admin_name: str | None = Field(title="Admin Name")
+    capital: str | None = Field(title="Capital")
+    population: float = Field(title="Population")
+
+
+def column_dtype(name: str) -> np.dtype:
+    """NumPy dtype used to store a `City` field, strings are fixed-width UTF-8 bytes."""
+    annotation = City.model_fields[name].annotation
+    if isinstance(annotation, UnionType):
+        (annotation,) = (arg for arg in get_args(annotation) if arg is not NoneType)
+    return np.dtype({int: np.int64, float: np.float64, str: np.bytes_}[annotation])
+
+
+# empty strings stand for `None` in the byte columns of these fields
+NULLABLE_FIELDS = frozenset(name for name, field in City.model_fields.items() if NoneType in get_args(field.annotation))
+
+
+class CityTable:
+    """The cities dataset held as one typed NumPy array per `City` field.
+
+    Rows are sorted by population, largest first, so a row id is also the
+    population rank. `City` models are only built for the rows asked for.
+    """
+
+    def __init__(self, columns: dict[str, np.ndarray]) -> None:
+        self.columns = columns
+
+    @classmethod
+    def from_json(cls, path: Path = CITIES_FILE) -> CityTable:
+        records = json.loads(path.read_bytes())
+        columns = {}
+        for name in City.model_fields:
+            dtype = column_dtype(name)
+            if dtype.kind == "S":
+                columns[name] = np.array([(r[name] or "").encode() for r in records], dtype=dtype)
+            else:
+                columns[name] = np.array([r[name] for r in records], dtype=dtype)
+        order = np.argsort(-columns["population"], kind="stable")
+        return cls({name: column[order] for name, column in columns.items()})
+
+    @classmethod
+    def from_snapshot(cls, path: Path = CITIES_SNAPSHOT, source: Path = CITIES_FILE) -> CityTable | None:
+        """Map a snapshot written by `write_snapshot` into memory.
+
+        The columns are read-only views of the mapped file, so processes
+        opening the same snapshot share its pages. Returns `None` when the
+        snapshot is missing, unreadable or was compiled from a different source.
+        """
+        try:
+            with path.open("rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+        prefix = len(SNAPSHOT_MAGIC) + 4
+        if buffer[: len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+            return None
+        try:
+            (header_size,) = struct.unpack("<I", buffer[len(SNAPSHOT_MAGIC) : prefix])
+            header = json.loads(buffer[prefix : prefix + header_size])
+            if header["source_sha256"] != source_digest(source):
+                return None
+            data_start = _aligned(prefix + header_size)
+            columns = {
+                column["name"]: np.frombuffer(
+                    buffer, np.dtype(column["dtype"]), header["rows"], data_start + column["offset"]
+                )
+                for column in header["columns"]
+            }
+        except (KeyError, TypeError, ValueError, struct.error):
+            return None
+        if columns.keys() != City.model_fields.keys():
+            return None
+        return cls(columns)
+
+    def write_snapshot(self, path: Path = CITIES_SNAPSHOT, source: Path = CITIES_FILE) -> None:
+        """Write the columns in the fixed layout read by `from_snapshot`."""
+        columns, offset = [], 0
+        for name, column in self.columns.items():
+            columns.append({"name": name, "dtype": column.dtype.str, "offset": offset})
+            offset += _aligned(column.nbytes)
+        header = json.dumps({"source_sha256": source_digest(source), "rows": len(self), "columns": columns}).encode()
+        prefix = SNAPSHOT_MAGIC + struct.pack("<I", len(header)) + header
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with tmp.open("wb") as f:
+            f.write(prefix.ljust(_aligned(len(prefix)), b"\0"))
+            for column in self.columns.values():
+                data = np.ascontiguousarray(column).tobytes()
+                f.write(data.ljust(_aligned(len(data)), b"\0"))
+        # workers may still be mapping the old file, so swap the new one in atomically
+        tmp.replace(path)
+
+    def __len__(self) -> int:
+        return len(self.columns["id"])
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def _values(self, name: str, row_ids: np.ndarray | list[int]) -> list:
+        values = self.columns[name][row_ids].tolist()
+        if self.columns[name].dtype.kind != "S":
+            return values
+        if name in NULLABLE_FIELDS:
+            return [v.decode() or None for v in values]
+        return [v.decode() for v in values]
+
+    def rows(self, row_ids: Iterable[int] | np.ndarray) -> list[City]:
+        """Build `City` models for `row_ids`, in the order given."""
+        row_ids = np.asarray(row_ids if isinstance(row_ids, np.ndarray) else list(row_ids), dtype=np.intp)
+        values = {name: self._values(name, row_ids) for name in self.columns}
+        # the columns already hold validated, correctly typed values
+        return [City.model_construct(**dict(zip(values, row, strict=True))) for row in zip(*values.values(), strict=True)]
+
+    def row(self, row_id: int) -> City:
+        return self.rows([row_id])[0]
+
+    # leading quotes, as in the transliterated names starting with an opening quote,
+    # would otherwise sort after every letter
+    SORT_IGNORED = '\'\u2018\u2019"\u201c\u201d '
+
+    def sort_key(self, name: str) -> np.ndarray:
+        """Dense rank of each row's value, equal values sharing a rank; strings compare folded."""
+        column = self.columns[name]
+        if column.dtype.kind == "S":
+            folded = [fold_name(value.decode()).lstrip(self.SORT_IGNORED) for value in column.tolist()]
+            column = np.array(folded, dtype=str)
+        return np.unique(column, return_inverse=True)[1].astype(np.intp)
+
+    def _group_codes(self, names: tuple[str, ...]) -> np.ndarray:
+        codes = np.zeros(len(self), dtype=np.int64)
+        for name in names:
+            values, inverse = np.unique(self.columns[name], return_inverse=True)
+            codes = codes * len(values) + inverse
+        return codes
+
+    def _keys(self, names: tuple[str, ...], row_ids: np.ndarray) -> list:
+        keys = zip(*(self._values(name, row_ids) for name in names), strict=True)
+        if len(names) == 1:
+            return [key for (key,) in keys]
+        return list(keys)
+
+    def group_rows(self, *names: str) -> dict:
+        """Row ids for each distinct value of the `names` columns, in population order.
+
+        Keys are plain values for one column and tuples for several.
+        """
+        codes = self._group_codes(names)
+        # a stable sort keeps the population order inside each group
+        order = np.argsort(codes, kind="stable")
+        starts = np.flatnonzero(np.diff(codes[order], prepend=-1))
+        groups = np.split(order, starts[1:])
+        return dict(zip(self._keys(names, order[starts]), groups, strict=True))
+
+    def group_totals(self, *names: str) -> GroupTotals:
+        """City counts and population totals for each distinct value of the `names` columns."""
+        _, firsts, inverse = np.unique(self._group_codes(names), return_index=True, return_inverse=True)
+        cities = np.bincount(inverse)
+        population = np.bincount(inverse, weights=self.columns["population"])
+        order = np.argsort(-population, kind="stable")
+        return GroupTotals(
+            keys=self._keys(names, firsts[order]),
+            rows=firsts[order],
+            cities=cities[order],
+            population=population[order],
+        )
+
+    def top_rows(self, n: int, *names: str) -> tuple[np.ndarray, np.ndarray]:
+        """The `n` most populous rows of each group with their 1-based rank inside it.
+
+        Groups follow the sorted order of their keys.
+        """
+        codes = self._group_codes(names)
+        order = np.argsort(codes, kind="stable")
+        starts = np.flatnonzero(np.diff(codes[order], prepend=-1))
+        ranks = np.arange(len(order)) - np.repeat(starts, np.diff(starts, append=len(order)))
+        keep = ranks < n
+        return order[keep], ranks[keep] + 1
+
+
+@dataclass(frozen=True)
+class GroupTotals:
+    """Per-group aggregates from `CityTable.group_totals`, most populous group first.
+
+    `rows` holds the row id of the largest city in each group.
+    """
+
+    keys: list
+    rows: np.ndarray
+    cities: np.ndarray
+    population: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+def fold_name(name: str) -> str:
+    """Case- and accent-insensitive form of a name used for searching."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).casefold()
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+# shorter queries share too few trigrams with a name for fuzzy matches to mean much
+FUZZY_MIN_QUERY = 3
+
+
+class NameIndex:
+    """Search index over the `city` and `city_ascii` columns.
+
+    Every word of a folded name starts an entry that runs to the end of the
+    name, and the entries are kept in one sorted array, so prefix lookups are
+    two binary searches. Trigram postings find names that are misspelled.
+    Matches rank whole-name prefixes first, then word prefixes, then fuzzy
+    matches, and by population inside each rank.
+    """
+
+    WORD_START = re.compile(r"\b\w")
+
+    def __init__(self, cities: CityTable) -> None:
+        keys, rows, ranks = [], [], []
+        postings: dict[str, list[int]] = {}
+        for row, names in enumerate(zip(cities["city"].tolist(), cities["city_ascii"].tolist(), strict=True)):
+            folded = {fold_name(name.decode()) for name in names}
+            for name in folded:
+                for match in self.WORD_START.finditer(name):
+                    keys.append(name[match.start() :].encode())
+                    rows.append(row)
+                    ranks.append(0 if match.start() == 0 else 1)
+            for trigram in set().union(*map(_trigrams, folded)):
+                postings.setdefault(trigram, []).append(row)
+        order = np.argsort(np.array(keys, dtype=np.bytes_), kind="stable")
+        self.keys = np.array(keys, dtype=np.bytes_)[order]
+        self.rows = np.array(rows, dtype=np.intp)[order]
+        self.ranks = np.array(ranks, dtype=np.int8)[order]
+        self.postings = {trigram: np.array(ids, dtype=np.intp) for trigram, ids in postings.items()}
+        self.size = len(cities)
+
+    def prefix(self, query: str) -> tuple[np.ndarray, np.ndarray]:
+        """Rows with a word starting with `query`, and whether it starts the name."""
+        key = fold_name(query).encode()
+        # 0xff never occurs in UTF-8, so it sorts after every key starting with `key`
+        lo, hi = np.searchsorted(self.keys, [key, key + b"\xff"])
+        return self.rows[lo:hi], self.ranks[lo:hi]
+
+    def fuzzy(self, query: str, min_similarity: float = 0.5) -> tuple[np.ndarray, np.ndarray]:
+        """Rows sharing at least `min_similarity` of the query's trigrams, best first."""
+        trigrams = _trigrams(fold_name(query))
+        hits = [self.postings[t] for t in trigrams if t in self.postings]
+        if not hits:
+            return np.empty(0, dtype=np.intp), np.empty(0)
+        scores = np.bincount(np.concatenate(hits), minlength=self.size) / len(trigrams)
+        rows = np.flatnonzero(scores >= min_similarity)
+        return rows, scores[rows]
+
+    def search(self, query: str, limit: int = 10) -> list[int]:
+        """Row ids of the best `limit` matches for `query`, most relevant first."""
+        if not query.strip():
+            return list(range(min(limit, self.size)))
+        rows, ranks = self.prefix(query.strip())
+        candidates = [(rank, row) for row, rank in zip(rows.tolist(), ranks.tolist(), strict=True)]
+        if len(set(rows.tolist())) < limit and len(query.strip()) >= FUZZY_MIN_QUERY:
+            fuzzy_rows, scores = self.fuzzy(query.strip())
+            candidates += [(3 - score, row) for row, score in zip(fuzzy_rows.tolist(), scores.tolist(), strict=True)]
+        best: dict[int, float] = {}
+        for rank, row in sorted(candidates):
+            best.setdefault(row, rank)
+        return sorted(best, key=lambda row: (best[row], row))[:limit]
+
+
+EARTH_RADIUS_KM = 6371.0088
+MAX_LNG = 180.0
+
+
+def haversine_km(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """Great-circle distances in km from one point to arrays of points, all in degrees."""
+    lat, lng, lats, lngs = map(np.radians, (lat, lng, lats, lngs))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+class GeoIndex:
+    """Grid of `cell`-degree squares over the `lat`/`lng` columns.
+
+    Rows are sorted by cell, latitude band first, so the cells of one band
+    that a bounding box covers form a single contiguous slice. Distances are
+    computed from precomputed unit vectors, which avoids trigonometry per query.
+    """
+
+    def __init__(self, cities: CityTable, cell: float = 2.0) -> None:
+        self.cell = cell
+        self.lat = np.asarray(cities["lat"])
+        self.lng = np.asarray(cities["lng"])
+        self.xyz = _unit_vectors(self.lat, self.lng)
+        self.bands = int(np.ceil(180 / cell))
+        self.columns = int(np.ceil(360 / cell))
+        codes = self._band(self.lat) * self.columns + self._column(self.lng)
+        self.order = np.argsort(codes, kind="stable")
+        self.starts = np.searchsorted(codes[self.order], np.arange(self.bands * self.columns + 1))
+
+    def _band(self, lat: np.ndarray) -> np.ndarray:
+        return np.clip(((lat + 90) // self.cell).astype(np.intp), 0, self.bands - 1)
+
+    def _column(self, lng: np.ndarray) -> np.ndarray:
+        return np.clip(((lng + 180) // self.cell).astype(np.intp), 0, self.columns - 1)
+
+    def _cell(self, degrees: float, count: int) -> int:
+        return min(max(int(degrees // self.cell), 0), count - 1)
+
+    def _candidates(self, min_lat: float, max_lat: float, min_lng: float, max_lng: float) -> np.ndarray:
+        first_band, last_band = self._cell(min_lat + 90, self.bands), self._cell(max_lat + 90, self.bands)
+        bands = np.arange(first_band * self.columns, (last_band + 1) * self.columns, self.columns)
+        lo, hi = self._cell(min_lng + 180, self.columns), self._cell(max_lng + 180, self.columns)
+        spans = 1
+        if min_lng > max_lng:
+            if lo <= hi:
+                # a box crossing the antimeridian whose ends share a column covers every column
+                lo, hi = 0, self.columns - 1
+            else:
+                spans = 2
+        if spans == 1:
+            starts, stops = self.starts[bands + lo], self.starts[bands + hi + 1]
+        else:
+            starts = np.concatenate([self.starts[bands + lo], self.starts[bands]])
+            stops = np.concatenate([self.starts[bands + self.columns], self.starts[bands + hi + 1]])
+        lengths = stops - starts
+        # positions of all the slices at once, without a Python loop over bands
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self.order[offsets + np.arange(lengths.sum())]
+
+    def within(self, min_lat: float, max_lat: float, min_lng: float, max_lng: float) -> np.ndarray:
+        """Row ids inside the box in population order; `min_lng > max_lng` wraps around 180°."""
+        rows = self._candidates(min_lat, max_lat, min_lng, max_lng)
+        lat, lng = self.lat[rows], self.lng[rows]
+        in_lng = (lng >= min_lng) & (lng <= max_lng) if min_lng <= max_lng else (lng >= min_lng) | (lng <= max_lng)
+        return np.sort(rows[(lat >= min_lat) & (lat <= max_lat) & in_lng])
+
+    def nearest(self, lat: float, lng: float, k: int = 10) -> tuple[np.ndarray, np.ndarray]:
+        """Row ids of the `k` cities closest to the point, with their distances in km."""
+        k = min(k, len(self.lat))
+        point = _unit_vectors(lat, lng)
+        radius = self.cell * 111.0
+        while True:
+            rows = self._candidates(*bounding_box(lat, lng, radius))
+            distances = _chord_to_km(np.linalg.norm(self.xyz[rows] - point, axis=1))
+            # every city within `radius` is in the box, so once k of them are, they are the closest
+            if np.count_nonzero(distances <= radius) >= k or radius >= np.pi * EARTH_RADIUS_KM:
+                nearest = np.argsort(distances, kind="stable")[:k]
+                return rows[nearest], distances[nearest]
+            # with k candidates in hand, the k-th closest bounds the answer, so one more pass is enough
+            radius = np.partition(distances, k - 1)[k - 1] if len(rows) >= k else radius * 4
+
+
+def _unit_vectors(lat: np.ndarray | float, lng: np.ndarray | float) -> np.ndarray:
+    lat, lng = np.radians(lat), np.radians(lng)
+    return np.stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)], axis=-1)
+
+
+def _chord_to_km(chord: np.ndarray) -> np.ndarray:
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def bounding_box(lat: float, lng: float, radius_km: float) -> tuple[float, float, float, float]:
+    """Smallest lat/lng box holding every point within `radius_km` of the given point.
+
+    See http://janmatuschek.de/LatitudeLongitudeBoundingCoordinates.
+    """
+    angle = radius_km / EARTH_RADIUS_KM
+    lat_r = math.radians(lat)
+    min_lat, max_lat = lat_r - angle, lat_r + angle
+    if min_lat <= -math.pi / 2 or max_lat >= math.pi / 2:
+        # the circle covers a pole, so every longitude is in range
+        return math.degrees(max(min_lat, -math.pi / 2)), math.degrees(min(max_lat, math.pi / 2)), -180.0, 180.0
+    delta = math.degrees(math.asin(math.sin(angle) / math.cos(lat_r)))
+    min_lng, max_lng = lng - delta, lng + delta
+    if min_lng < -MAX_LNG:
+        min_lng += 2 * MAX_LNG
+    if max_lng > MAX_LNG:
+        max_lng -= 2 * MAX_LNG
+    return math.degrees(min_lat), math.degrees(max_lat), min_lng, max_lng
+
+
+def source_digest(source: Path = CITIES_FILE) -> str:
+    return hashlib.sha256(source.read_bytes()).hexdigest()
+
+
+def compile_snapshot(source: Path = CITIES_FILE, target: Path = CITIES_SNAPSHOT) -> CityTable:
+    """Parse `source` once and write it to `target` for `load_cities` to map."""
+    cities = CityTable.from_json(source)
+    cities.write_snapshot(target, source)
+    return cities
+
+
+@cache
+def load_cities() -> CityTable:
+    """The cities table, mapped from the snapshot when it is up to date, else parsed from JSON."""
+    cities = CityTable.from_snapshot()
+    if cities is None:
+        cities = CityTable.from_json()
+    return cities
+
+
+def benchmark_geo(queries: int = 2000, k: int = 10) -> None:
+    """Compare `GeoIndex` with a brute-force scan over the full dataset."""
+    cities = load_cities()
+    index = GeoIndex(cities)
+    lat, lng = np.asarray(cities["lat"]), np.asarray(cities["lng"])
+    rng = np.random.default_rng(0)
+    # half the queries near real cities, half anywhere on the globe
+    near = rng.integers(0, len(cities), queries // 2)
+    points = np.concatenate(
+        [
+            np.stack([lat[near], lng[near]], axis=1) + rng.normal(0, 1, (len(near), 2)),
+            np.stack([rng.uniform(-90, 90, queries - len(near)), rng.uniform(-180, 180, queries - len(near))], axis=1),
+        ]
+    )
+    points[:, 0] = np.clip(points[:, 0], -90, 90)
+    points[:, 1] = (points[:, 1] + 180) % 360 - 180
+
+    def timed(fn) -> float:
+        start = perf_counter()
+        for point_lat, point_lng in points.tolist():
+            fn(point_lat, point_lng)
+        return (perf_counter() - start) / len(points) * 1e6
+
+    brute_near = timed(lambda a, b: np.argsort(haversine_km(a, b, lat, lng), kind="stable")[:k])
+    index_near = timed(lambda a, b: index.nearest(a, b, k))
+    box = 5
+    brute_box = timed(lambda a, b: np.flatnonzero((abs(lat - a) <= box) & (abs(lng - b) <= box)))
+    index_box = timed(lambda a, b: index.within(a - box, a + box, b - box, b + box))
+    print(f"{len(cities)} cities, {len(points)} queries, mean µs per query")
+    print(f"nearest k={k}: index {index_near:.0f}, brute force {brute_near:.0f}")
+    print(f"10° box:      index {index_box:.0f}, brute force {brute_box:.0f}")
+
+
+if __name__ == "__main__":
+    benchmark_geo()
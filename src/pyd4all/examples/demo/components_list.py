@@ -7,9 +7,12 @@ from fastui import AnyComponent, FastUI
 from fastui import components as c
 from fastui.events import GoToEvent, PageEvent
 
+from pyd4all.utils.response_tools import fastui_response
+from pyd4all.utils.thread_tools import ThreadPoolRoute
+
 from .shared import demo_page
 
-router = APIRouter()
+router = APIRouter(route_class=ThreadPoolRoute)
 
 
 def panel(*components: AnyComponent) -> AnyComponent:
@@ -17,6 +20,7 @@ def panel(*components: AnyComponent) -> AnyComponent:
 
 
 @router.get('', response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
 def components_view() -> list[AnyComponent]:
     return demo_page(
         c.Div(
@@ -301,18 +305,21 @@ The statement spoken by the famous cow is provided by the backend."""
 
 
 @router.get('/dynamic-content', response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
 async def modal_view() -> list[AnyComponent]:
     await asyncio.sleep(0.5)
     return [c.Paragraph(text='This is some dynamic content. Open devtools to see me being fetched from the server.')]
 
 
 @router.post('/modal-form', response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
 async def modal_form_submit() -> list[AnyComponent]:
     await asyncio.sleep(0.5)
     return [c.FireEvent(event=PageEvent(name='modal-form', clear=True))]
 
 
 @router.post('/modal-prompt', response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
 async def modal_prompt_submit() -> list[AnyComponent]:
     await asyncio.sleep(0.5)
     return [c.FireEvent(event=PageEvent(name='modal-prompt', clear=True))]
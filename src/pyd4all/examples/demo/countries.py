@@ -0,0 +1,86 @@
+from __future__ import annotations as _annotations
+
+from functools import cache
+
+import numpy as np
+from pydantic import BaseModel
+
+from pyd4all.examples.demo.cities import CityTable, fold_name, load_cities
+
+# cities.json has no region field, so regions follow restcountries.com for every
+# country in the dataset; a country missing here is listed under 'Other'
+COUNTRY_REGIONS = {
+    iso3: region
+    for region, codes in {
+        "Africa": (
+            "AGO BDI BEN BFA CAF CIV CMR COD COG DJI DZA EGY ERI ETH GAB GHA GIN GMB GNB KEN LBR LBY LSO MAR "
+            "MDG MLI MOZ MRT MWI NER NGA RWA SDN SEN SLE SOM SSD TCD TGO TUN TZA UGA ZAF ZMB ZWE"
+        ),
+        "Americas": "ARG BOL BRA CAN CHL COL CRI CUB DOM ECU GTM HND HTI JAM MEX NIC PAN PER PRI PRY SLV URY USA VEN",
+        "Asia": (
+            "AFG ARE ARM AZE BGD BHR CHN GEO HKG IDN IND IRN IRQ ISR JOR JPN KAZ KGZ KHM KOR KWT LAO LBN LKA "
+            "MAC MMR MNG MYS NPL OMN PAK PHL PRK QAT SAU SGP SYR THA TJK TKM TUR TWN UZB VNM XGZ YEM"
+        ),
+        "Europe": (
+            "ALB AUT BEL BGR BIH BLR CHE CZE DEU DNK ESP EST FIN FRA GBR GRC HRV HUN IRL ITA LTU LVA MDA MKD "
+            "MLT NLD NOR POL PRT ROU RUS SRB SVK SWE UKR"
+        ),
+        "Oceania": "AUS NZL PNG",
+    }.items()
+    for iso3 in codes.split()
+}
+
+
+class Country(BaseModel):
+    iso3: str
+    name: str
+    region: str
+    rank: int
+
+
+class CountryIndex:
+    """Countries of the cities dataset, ranked by the population of their cities.
+
+    Folded country names, every word start of them and the lower-case iso3
+    codes are kept in one sorted array, so a search is two binary searches.
+    """
+
+    def __init__(self, cities: CityTable) -> None:
+        totals = cities.group_totals("iso3")
+        self.countries = [
+            Country(iso3=iso3, name=largest.country, region=COUNTRY_REGIONS.get(iso3, "Other"), rank=rank)
+            for rank, (iso3, largest) in enumerate(zip(totals.keys, cities.rows(totals.rows), strict=True), 1)
+        ]
+        keys, positions = [], []
+        for position, country in enumerate(self.countries):
+            name = fold_name(country.name)
+            words = {name[i:] for i in range(len(name)) if name[i].isalnum() and (i == 0 or not name[i - 1].isalnum())}
+            for key in words | {country.iso3.casefold()}:
+                keys.append(key.encode())
+                positions.append(position)
+        order = np.argsort(np.array(keys, dtype=np.bytes_), kind="stable")
+        self.keys = np.array(keys, dtype=np.bytes_)[order]
+        self.positions = np.array(positions, dtype=np.intp)[order]
+
+    def search(self, query: str, limit: int = 20) -> list[Country]:
+        """Countries matching `query` ordered by name, or the `limit` most populous ones for an empty query."""
+        key = fold_name(query.strip()).encode()
+        if not key:
+            found = self.countries[:limit]
+        else:
+            # 0xff never occurs in UTF-8, so it sorts after every key starting with `key`
+            lo, hi = np.searchsorted(self.keys, [key, key + b"\xff"])
+            found = [self.countries[p] for p in sorted(set(self.positions[lo:hi].tolist()))][:limit]
+        return sorted(found, key=lambda country: country.name)
+
+    def options(self, query: str, limit: int = 20) -> list[dict]:
+        """Search results grouped by region, as a `SelectSearchResponse` expects them."""
+        regions: dict[str, list[dict]] = {}
+        for country in self.search(query, limit):
+            regions.setdefault(country.region, []).append({"value": country.iso3, "label": country.name})
+        return [{"label": region, "options": options} for region, options in regions.items()]
+
+
+@cache
+def country_index() -> CountryIndex:
+    return CountryIndex(load_cities())
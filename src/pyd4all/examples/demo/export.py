@@ -0,0 +1,87 @@
+from __future__ import annotations as _annotations
+
+import io
+from collections.abc import Iterable, Iterator
+from functools import cache
+from typing import Literal, TypeAlias
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from pyd4all.examples.demo.cities import NULLABLE_FIELDS, City, CityTable, column_dtype
+
+ExportFormat: TypeAlias = Literal["csv", "parquet", "arrow"]
+
+EXPORT_MEDIA_TYPES: dict[ExportFormat, str] = {
+    "csv": "text/csv; charset=utf-8",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+EXPORT_SUFFIXES: dict[ExportFormat, str] = {"csv": "csv", "parquet": "parquet", "arrow": "arrows"}
+
+_ARROW_TYPES = {"i": pa.int64(), "f": pa.float64(), "S": pa.string()}
+
+
+@cache
+def arrow_schema() -> pa.Schema:
+    """Arrow schema of the `City` columns, nullable where the model is."""
+    return pa.schema(
+        [pa.field(name, _ARROW_TYPES[column_dtype(name).kind], nullable=name in NULLABLE_FIELDS) for name in City.model_fields]
+    )
+
+
+def _arrow_column(column: np.ndarray, nullable: bool) -> pa.Array:
+    if column.dtype.kind != "S":
+        # a contiguous slice of a numeric column is wrapped without copying
+        return pa.array(column)
+    mask = column == b"" if nullable else None
+    return pa.array(column, type=pa.binary(), mask=mask).cast(pa.string())
+
+
+def record_batches(
+    cities: CityTable, row_ids: np.ndarray | None = None, batch_size: int = 1024
+) -> Iterator[pa.RecordBatch]:
+    """The rows of `cities` as record batches of at most `batch_size` rows.
+
+    Without `row_ids` every row is exported, in population order, by slicing
+    the columns. Otherwise only the requested rows are gathered, one batch at
+    a time, so memory stays bounded by the batch size.
+    """
+    schema = arrow_schema()
+    total = len(cities) if row_ids is None else len(row_ids)
+    for start in range(0, total, batch_size):
+        rows = slice(start, start + batch_size) if row_ids is None else row_ids[start : start + batch_size]
+        arrays = [_arrow_column(cities[field.name][rows], field.nullable) for field in schema]
+        yield pa.record_batch(arrays, schema=schema)
+
+
+def _drain(sink: io.BytesIO) -> bytes:
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+
+def encode_batches(batches: Iterable[pa.RecordBatch], fmt: ExportFormat) -> Iterator[bytes]:
+    """Encode record batches as they come, yielding whatever each batch added to the output.
+
+    CSV and Arrow IPC streams grow by one block per batch; Parquet writes one
+    row group per batch and its footer once the last batch is written.
+    """
+    schema = arrow_schema()
+    sink = io.BytesIO()
+    if fmt == "csv":
+        writer = pa_csv.CSVWriter(sink, schema)
+    elif fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema)
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    with writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            if chunk := _drain(sink):
+                yield chunk
+    if chunk := _drain(sink):
+        yield chunk
@@ -1,51 +1,42 @@
 from __future__ import annotations as _annotations
 
 import enum
-from collections import defaultdict
+import tempfile
 from datetime import date
+from pathlib import Path
 from typing import Annotated, Literal, TypeAlias
 
-from fastapi import APIRouter, Request, UploadFile
+from fastapi import APIRouter, UploadFile
+from fastapi.encoders import jsonable_encoder
 from fastui import AnyComponent, FastUI
 from fastui import components as c
 from fastui.events import GoToEvent, PageEvent
 from fastui.forms import FormFile, SelectSearchResponse, Textarea, fastui_form
-from httpx import AsyncClient
 from pydantic import BaseModel, EmailStr, Field, SecretStr, field_validator
 from pydantic_core import PydanticCustomError
 
+from pyd4all.utils.response_tools import fastui_response
+from pyd4all.utils.thread_tools import ThreadPoolRoute
+from pyd4all.utils.upload_tools import expire_uploads, store_uploads, upload_form
+
+from .countries import country_index
+from .jobs import job_queue
 from .shared import demo_page
 
-router = APIRouter()
+router = APIRouter(route_class=ThreadPoolRoute)
 
 
 @router.get('/search', response_model=SelectSearchResponse)
-async def search_view(request: Request, q: str) -> SelectSearchResponse:
-    path_ends = f'name/{q}' if q else 'all'
-    client: AsyncClient = request.app.state.httpx_client
-    r = await client.get(f'https://restcountries.com/v3.1/{path_ends}')
-    if r.status_code == 404:
-        options = []
-    else:
-        r.raise_for_status()
-        data = r.json()
-        if path_ends == 'all':
-            # if we got all, filter to the 20 most populous countries
-            data.sort(key=lambda x: x['population'], reverse=True)
-            data = data[0:20]
-            data.sort(key=lambda x: x['name']['common'])
-
-        regions = defaultdict(list)
-        for co in data:
-            regions[co['region']].append({'value': co['cca3'], 'label': co['name']['common']})
-        options = [{'label': k, 'options': v} for k, v in regions.items()]
-    return SelectSearchResponse(options=options)
+async def search_view(q: str) -> SelectSearchResponse:
+    # answered from the countries in cities.json, no request leaves the process
+    return SelectSearchResponse(options=country_index().options(q))
 
 
 FormKind: TypeAlias = Literal['login', 'select', 'big']
 
 
 @router.get('/{kind}', response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
 def forms_view(kind: FormKind) -> list[AnyComponent]:
     return demo_page(
         c.LinkList(
@@ -72,13 +63,14 @@ def forms_view(kind: FormKind) -> list[AnyComponent]:
         c.ServerLoad(
             path='/forms/content/{kind}',
             load_trigger=PageEvent(name='change-form'),
-            components=form_content(kind),
+            components=form_content.__wrapped__(kind),
         ),
         title='Forms',
     )
 
 
 @router.get('/content/{kind}', response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
 def form_content(kind: FormKind):
     match kind:
         case 'login':
@@ -108,9 +100,15 @@ class LoginForm(BaseModel):
     password: SecretStr
 
 
+@job_queue.task()
+def process_login(form: dict) -> None:
+    print(form)
+
+
 @router.post('/login', response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
 async def login_form_post(form: Annotated[LoginForm, fastui_form(LoginForm)]):
-    print(form)
+    await job_queue.enqueue(process_login, form.model_dump(mode='json'))
     return [c.FireEvent(event=GoToEvent(url='/'))]
 
 
@@ -137,11 +135,18 @@ class SelectForm(BaseModel):
 
 
 @router.post('/select', response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
 async def select_form_post(form: Annotated[SelectForm, fastui_form(SelectForm)]):
     # print(form)
     return [c.FireEvent(event=GoToEvent(url='/'))]
 
 
+MAX_PROFILE_PICS = 8
+UPLOAD_DIR = Path(tempfile.gettempdir()) / 'pyd4all-uploads'
+# stored images are only kept for the follow-up work, they are deleted a day later
+UPLOAD_TTL = 24 * 60 * 60
+
+
 class SizeModel(BaseModel):
     width: int = Field(description='This is a field of a nested model')
     height: int = Field(description='This is a field of a nested model')
@@ -156,8 +161,8 @@ class BigModel(BaseModel):
     profile_pic: Annotated[UploadFile, FormFile(accept='image/*', max_size=16_000)] = Field(
         description='Upload a profile picture, must not be more than 16kb'
     )
-    profile_pics: Annotated[list[UploadFile], FormFile(accept='image/*')] | None = Field(
-        None, description='Upload multiple images'
+    profile_pics: Annotated[list[UploadFile], FormFile(accept='image/*', max_size=1_000_000)] | None = Field(
+        None, description=f'Upload up to {MAX_PROFILE_PICS} images, each not more than 1MB'
     )
     dob: date = Field(title='Date of Birth', description='Your date of birth, this is required hence bold')
     human: bool | None = Field(
@@ -177,7 +182,21 @@ class BigModel(BaseModel):
         return v
 
 
+@job_queue.task()
+def process_big_form(form: dict, images: list[dict]) -> dict:
+    # stands in for the slow follow-up work of a submitted form, its result is kept on the job
+    expired = expire_uploads(UPLOAD_DIR, UPLOAD_TTL)
+    return {'fields': sorted(form), 'images': [image['sha256'] for image in images], 'expired': expired}
+
+
 @router.post('/big', response_model=FastUI, response_model_exclude_none=True)
-async def big_form_post(form: Annotated[BigModel, fastui_form(BigModel)]):
-    print(form)
+@fastui_response
+async def big_form_post(
+    form: Annotated[BigModel, upload_form(BigModel, max_body_size=10_000_000, max_files=MAX_PROFILE_PICS + 1)],
+):
+    # limits are checked while the body streams in, so an oversized upload is never read in full;
+    # the files are kept before the response, the rest of the work runs after it
+    stored = await store_uploads([form.profile_pic, *(form.profile_pics or [])], UPLOAD_DIR)
+    data = form.model_dump(mode='json', exclude={'profile_pic', 'profile_pics'})
+    await job_queue.enqueue(process_big_form, data, jsonable_encoder(stored))
     return [c.FireEvent(event=GoToEvent(url='/'))]
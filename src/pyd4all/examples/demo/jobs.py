@@ -0,0 +1,94 @@
+from __future__ import annotations as _annotations
+
+import asyncio
+import sys
+import tempfile
+from pathlib import Path
+
+from fastapi import APIRouter, HTTPException
+from fastapi import Path as PathParam
+from fastui import AnyComponent, FastUI
+from fastui import components as c
+from fastui.components.display import DisplayLookup, DisplayMode
+from fastui.events import GoToEvent
+
+from pyd4all.utils.job_tools import Job, JobQueue
+from pyd4all.utils.response_tools import fastui_response
+
+from .shared import demo_page
+
+# post-processing of form submissions, run after the response is sent
+job_queue = JobQueue(Path(tempfile.gettempdir()) / 'pyd4all-jobs.sqlite3')
+JOB_WORKERS = 4
+
+router = APIRouter()
+
+
+@router.get('/{job_id}/status', response_model=Job)
+async def job_status(job_id: int = PathParam(..., ge=1, le=2**63 - 1)) -> Job:
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail='Job not found')
+    return job
+
+
+@router.get('', response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
+async def jobs_view() -> list[AnyComponent]:
+    counts = await job_queue.counts()
+    return demo_page(
+        c.Paragraph(
+            text=', '.join(f'{counts.get(status, 0)} {status}' for status in ('queued', 'running', 'done', 'failed'))
+        ),
+        c.Link(components=[c.Text(text='Refresh')], on_click=GoToEvent(url='/jobs')),
+        c.Table(
+            data=await job_queue.recent(),
+            data_model=Job,
+            columns=[
+                DisplayLookup(field='id', table_width_percent=5),
+                DisplayLookup(field='task'),
+                DisplayLookup(field='status'),
+                DisplayLookup(field='attempts'),
+                DisplayLookup(field='updated_at', mode=DisplayMode.datetime),
+                DisplayLookup(field='error'),
+            ],
+        ),
+        title='Jobs',
+    )
+
+
+def benchmark_jobs(n: int = 5000, workers: int = JOB_WORKERS, concurrency: int = 100) -> None:
+    """Measure how fast jobs are enqueued, one at a time and by concurrent requests, and run."""
+    from time import perf_counter
+
+    async def run(concurrent: bool) -> None:
+        with tempfile.TemporaryDirectory() as directory:
+            queue = JobQueue(Path(directory) / 'jobs.sqlite3')
+
+            @queue.task()
+            async def noop(i: int) -> int:
+                return i
+
+            await queue.start(workers)
+            start = perf_counter()
+            if concurrent:
+                for first in range(0, n, concurrency):
+                    await asyncio.gather(*(queue.enqueue(noop, i) for i in range(first, first + concurrency)))
+            else:
+                for i in range(n):
+                    await queue.enqueue(noop, i)
+            enqueued = perf_counter() - start
+            await queue.join()
+            finished = perf_counter() - start
+            await queue.stop()
+        name = f'{concurrency} concurrent' if concurrent else 'sequential'
+        print(f'{name:>14}: enqueue {n / enqueued:7.0f} jobs/s ({enqueued / n * 1e6:5.1f} us per job),', end=' ')
+        print(f'run {n / finished:7.0f} jobs/s end to end with {workers} workers')
+
+    asyncio.run(run(concurrent=False))
+    asyncio.run(run(concurrent=True))
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['benchmark']:
+        benchmark_jobs()
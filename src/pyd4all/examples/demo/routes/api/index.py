@@ -5,11 +5,13 @@ from fastui import AnyComponent, FastUI
 from fastui import components as c
 
 from pyd4all.examples.demo.shared import demo_page
+from pyd4all.utils.response_tools import fastui_response
 
 router = APIRouter()
 
 
 @router.get('', response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
 def api_index() -> list[AnyComponent]:
     print("index getting called.")
     # language=markdown
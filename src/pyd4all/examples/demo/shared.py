@@ -4,50 +4,100 @@ from fastui import AnyComponent
 from fastui import components as c
 from fastui.events import GoToEvent
 
+from pyd4all.utils.response_tools import fastui_json, prebuilt
+
+
+def demo_navbar() -> c.Navbar:
+    return c.Navbar(
+        title='FastUI Demo',
+        title_event=GoToEvent(url='/'),
+        start_links=[
+            c.Link(
+                components=[c.Text(text='Components')],
+                on_click=GoToEvent(url='/components'),
+                active='startswith:/components',
+            ),
+            c.Link(
+                components=[c.Text(text='Tables')],
+                on_click=GoToEvent(url='/table/cities'),
+                active='startswith:/table',
+            ),
+            c.Link(
+                components=[c.Text(text='Auth')],
+                on_click=GoToEvent(url='/auth/login/password'),
+                active='startswith:/auth',
+            ),
+            c.Link(
+                components=[c.Text(text='Forms')],
+                on_click=GoToEvent(url='/forms/login'),
+                active='startswith:/forms',
+            ),
+            c.Link(
+                components=[c.Text(text='Jobs')],
+                on_click=GoToEvent(url='/jobs'),
+                active='startswith:/jobs',
+            ),
+        ],
+    )
+
+
+def demo_footer() -> c.Footer:
+    return c.Footer(
+        extra_text='FastUI Demo',
+        links=[
+            c.Link(components=[c.Text(text='Github')], on_click=GoToEvent(url='https://github.com/pydantic/FastUI')),
+            c.Link(components=[c.Text(text='PyPI')], on_click=GoToEvent(url='https://pypi.org/project/fastui/')),
+            c.Link(components=[c.Text(text='NPM')], on_click=GoToEvent(url='https://www.npmjs.com/org/pydantic/')),
+        ],
+    )
+
+
+# the same on every page, so built and serialized once
+NAVBAR = prebuilt(demo_navbar())
+FOOTER = prebuilt(demo_footer())
+
 
 def demo_page(*components: AnyComponent, title: str | None = None) -> list[AnyComponent]:
     return [
         c.PageTitle(text=f'FastUI Demo — {title}' if title else 'FastUI Demo'),
-        c.Navbar(
-            title='FastUI Demo',
-            title_event=GoToEvent(url='/'),
-            start_links=[
-                c.Link(
-                    components=[c.Text(text='Components')],
-                    on_click=GoToEvent(url='/components'),
-                    active='startswith:/components',
-                ),
-                c.Link(
-                    components=[c.Text(text='Tables')],
-                    on_click=GoToEvent(url='/table/cities'),
-                    active='startswith:/table',
-                ),
-                c.Link(
-                    components=[c.Text(text='Auth')],
-                    on_click=GoToEvent(url='/auth/login/password'),
-                    active='startswith:/auth',
-                ),
-                c.Link(
-                    components=[c.Text(text='Forms')],
-                    on_click=GoToEvent(url='/forms/login'),
-                    active='startswith:/forms',
-                ),
-            ],
-        ),
+        NAVBAR,
         c.Page(
             components=[
                 *((c.Heading(text=title),) if title else ()),
                 *components,
             ],
         ),
-        c.Footer(
-            extra_text='FastUI Demo',
-            links=[
-                c.Link(
-                    components=[c.Text(text='Github')], on_click=GoToEvent(url='https://github.com/pydantic/FastUI')
-                ),
-                c.Link(components=[c.Text(text='PyPI')], on_click=GoToEvent(url='https://pypi.org/project/fastui/')),
-                c.Link(components=[c.Text(text='NPM')], on_click=GoToEvent(url='https://www.npmjs.com/org/pydantic/')),
-            ],
-        ),
+        FOOTER,
     ]
+
+
+def benchmark_layout(repeat: int = 2000) -> None:
+    """Compare building and serializing a page with a fresh layout and with the prebuilt one."""
+    import tracemalloc
+    from time import perf_counter
+
+    from fastui import FastUI
+
+    def fresh() -> bytes:
+        page = [c.PageTitle(text='FastUI Demo — Bench'), demo_navbar(), c.Page(components=body), demo_footer()]
+        return FastUI(root=page).model_dump_json(by_alias=True, exclude_none=True).encode()
+
+    def spliced() -> bytes:
+        return fastui_json(demo_page(*body[1:], title='Bench'))
+
+    body = [c.Heading(text='Bench'), c.Paragraph(text='Some text on the page.')]
+    assert fresh() == spliced()
+    for name, render in (('fresh', fresh), ('prebuilt', spliced)):
+        start = perf_counter()
+        for _ in range(repeat):
+            render()
+        elapsed = (perf_counter() - start) / repeat * 1e6
+        tracemalloc.start()
+        render()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'{name:>8}: {elapsed:6.1f} µs per page, {peak / 1024:5.1f} KiB allocated at peak')
+
+
+if __name__ == '__main__':
+    benchmark_layout()
@@ -1,28 +1,173 @@
 import asyncio
+import json
+import secrets
+import sys
 from itertools import chain
-from typing import AsyncIterable
+from typing import Annotated, AsyncIterable, Literal
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Header
 from fastui import FastUI
 from fastui import components as c
-from starlette.responses import StreamingResponse
+from starlette.responses import Response, StreamingResponse
+
+from pyd4all.utils.sse_tools import BroadcastHub
 
 router = APIRouter()
 
+PROMPT = '**User:** What is SSE? Please include a javascript code example.\n\n**AI:** '
+
+SSEMode = Literal['snapshot', 'delta']
+
+# in delta mode a full snapshot follows every this many deltas, so a client that
+# missed or misapplied an event is back in sync within a few hundred milliseconds
+SNAPSHOT_EVERY = 50
+
+
+async def canned_tokens(delay: bool = True) -> AsyncIterable[str]:
+    for time, text in chain([(0.5, PROMPT)], CANNED_RESPONSE):
+        if delay:
+            await asyncio.sleep(time)
+        yield text
+
+
+def markdown_snapshot(output: str) -> str:
+    m = FastUI(root=[c.Markdown(text=output)])
+    return m.model_dump_json(by_alias=True, exclude_none=True)
+
+
+async def canned_ai_response_generator(delay: bool = True) -> AsyncIterable[str]:
+    output = ''
+    async for text in canned_tokens(delay):
+        output += text
+        yield f'data: {markdown_snapshot(output)}\n\n'
+
+
+async def canned_ai_delta_generator(delay: bool = True, snapshot_every: int = SNAPSHOT_EVERY) -> AsyncIterable[str]:
+    """Stream `delta` events holding only the appended text, and a `snapshot` event now and then.
 
-async def canned_ai_response_generator() -> AsyncIterable[str]:
-    prompt = '**User:** What is SSE? Please include a javascript code example.\n\n**AI:** '
+    A delta is `{"offset": <length of the text before it>, "text": <appended text>}`;
+    a client whose text has a different length drops deltas until the next
+    snapshot, which holds the whole FastUI page as the default mode sends it.
+    """
     output = ''
-    for time, text in chain([(0.5, prompt)], CANNED_RESPONSE):
-        await asyncio.sleep(time)
+    deltas = 0
+    async for text in canned_tokens(delay):
+        if not text:
+            continue
+        yield f'event: delta\ndata: {json.dumps({"offset": len(output), "text": text})}\n\n'
         output += text
-        m = FastUI(root=[c.Markdown(text=output)])
-        yield f'data: {m.model_dump_json(by_alias=True, exclude_none=True)}\n\n'
+        deltas += 1
+        if deltas % snapshot_every == 0:
+            yield f'event: snapshot\ndata: {markdown_snapshot(output)}\n\n'
+    yield f'event: snapshot\ndata: {markdown_snapshot(output)}\n\n'
+
+
+async def publish_canned_answer(
+    hub: BroadcastHub, mode: SSEMode, stop_when_idle: bool = False, idle_grace: float = 0.0
+) -> None:
+    """Publish the canned answer to `hub` once, each event encoded a single time for every subscriber.
+
+    With `stop_when_idle` it stops once the hub has had no subscribers for `idle_grace` seconds.
+    """
+    output = ''
+    async for text in canned_tokens():
+        if stop_when_idle and not hub.subscribers and hub.idle_seconds >= idle_grace:
+            return
+        before, output = output, output + text
+        if mode == 'snapshot':
+            hub.publish(f'data: {markdown_snapshot(output)}\n\n'.encode())
+        elif text:
+            delta = json.dumps({'offset': len(before), 'text': text})
+            # slow subscribers skip ahead to this state, encoded only if one of them needs it
+            hub.publish(
+                f'event: delta\ndata: {delta}\n\n'.encode(),
+                snapshot=lambda output=output: f'event: snapshot\ndata: {markdown_snapshot(output)}\n\n'.encode(),
+            )
+
+
+# streams are kept after their connection drops, so that a reconnect with
+# Last-Event-ID only gets the events it missed; a stream without a client
+# stops producing after RECONNECT_GRACE seconds, and only streams without a
+# client are evicted, the longest idle first
+RESUMABLE_STREAMS = 256
+RECONNECT_GRACE = 30.0
+STREAM_IDLE_TTL = 300.0
+REPLAY_BYTES = 64 * 1024
+sse_streams: dict[str, BroadcastHub] = {}
+
+
+def evict_idle_streams() -> None:
+    """Drop streams idle for `STREAM_IDLE_TTL` seconds, and the longest idle over `RESUMABLE_STREAMS`."""
+    idle = [hub for hub in sse_streams.values() if not hub.subscribers]
+    idle.sort(key=lambda hub: hub.idle_seconds, reverse=True)
+    excess = len(sse_streams) - RESUMABLE_STREAMS
+    for i, hub in enumerate(idle):
+        if i >= excess and hub.idle_seconds < STREAM_IDLE_TTL:
+            break
+        del sse_streams[hub.stream_id]
+        hub.stop()
+
+
+def start_sse_stream(mode: SSEMode) -> BroadcastHub:
+    hub = BroadcastHub(maxsize=64, replay_bytes=REPLAY_BYTES, stream_id=secrets.token_hex(8))
+
+    async def produce(hub: BroadcastHub) -> None:
+        await publish_canned_answer(hub, mode, stop_when_idle=True, idle_grace=RECONNECT_GRACE)
+        hub.close()
+
+    sse_streams[hub.stream_id] = hub
+    evict_idle_streams()
+    hub.ensure_running(produce)
+    return hub
 
 
 @router.get('/sse')
-async def sse_ai_response() -> StreamingResponse:
-    return StreamingResponse(canned_ai_response_generator(), media_type='text/event-stream')
+async def sse_ai_response(
+    mode: SSEMode = 'snapshot', last_event_id: Annotated[str | None, Header()] = None
+) -> StreamingResponse:
+    # FastUI's ServerLoad renders every message as a full page, so it keeps the default mode
+    hub = sse_streams.get((last_event_id or '').rpartition('-')[0])
+    if hub is None:
+        hub = start_sse_stream(mode)
+    elif hub.is_done_for(last_event_id):
+        # the stream is over and nothing was missed, 204 stops EventSource from reconnecting
+        return Response(status_code=204)
+    return StreamingResponse(hub.listen(last_event_id), media_type='text/event-stream')
+
+
+broadcast_hubs: dict[SSEMode, BroadcastHub] = {'snapshot': BroadcastHub(), 'delta': BroadcastHub()}
+
+
+def canned_broadcast(mode: SSEMode):
+    """Producer replaying the canned answer to a hub for as long as it has subscribers."""
+
+    async def produce(hub: BroadcastHub) -> None:
+        while hub.subscribers:
+            await publish_canned_answer(hub, mode, stop_when_idle=True)
+
+    return produce
+
+
+@router.get('/sse/broadcast')
+async def sse_broadcast(mode: SSEMode = 'snapshot') -> StreamingResponse:
+    # one producer serves every connection, each event is encoded once for all of them
+    hub = broadcast_hubs[mode]
+    return StreamingResponse(hub.listen(producer=canned_broadcast(mode)), media_type='text/event-stream')
+
+
+def benchmark_sse(repeat: int = 20) -> None:
+    """Compare bytes sent and CPU time per stream of the snapshot and delta modes."""
+    from time import process_time
+
+    async def measure(events: AsyncIterable[str]) -> int:
+        return sum([len(event.encode()) async for event in events])
+
+    for name, generator in (('snapshot', canned_ai_response_generator), ('delta', canned_ai_delta_generator)):
+        start = process_time()
+        for _ in range(repeat):
+            size = asyncio.run(measure(generator(delay=False)))
+        cpu = (process_time() - start) / repeat * 1e3
+        print(f'{name:>8}: {size / 1024:8.1f} KiB, {cpu:6.2f} ms CPU per stream')
 
 
 async def run_openai():
@@ -59,10 +204,6 @@ async def run_openai():
     print(text)
 
 
-if __name__ == '__main__':
-    asyncio.run(run_openai())
-
-
 CANNED_RESPONSE: list[tuple[float, str]] = [
     (0.00000, ''),
     (0.07685, 'Server'),
@@ -386,3 +527,10 @@ CANNED_RESPONSE: list[tuple[float, str]] = [
     (0.00046, ' Event'),
     (0.00026, '.'),
 ]
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['benchmark']:
+        benchmark_sse()
+    else:
+        asyncio.run(run_openai())
@@ -1,46 +1,215 @@
 from datetime import date
-from functools import cache
-from pathlib import Path
+from functools import cache, lru_cache
+from typing import Literal, TypeAlias
 
+import numpy as np
 import pydantic
-from fastapi import APIRouter
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
 from fastui import AnyComponent, FastUI
 from fastui import components as c
 from fastui.components.display import DisplayLookup, DisplayMode
 from fastui.events import BackEvent, GoToEvent
-from pydantic import BaseModel, Field, TypeAdapter
+from fastui.forms import SelectSearchResponse
+from pydantic import BaseModel, Field
 
+from pyd4all.utils.response_tools import ResponseCache, fastui_response, prebuilt
+from pyd4all.utils.thread_tools import ThreadPoolRoute, cheap
+
+from .cities import City, GeoIndex, NameIndex, load_cities
+from .countries import country_index
+from .export import (
+    EXPORT_MEDIA_TYPES,
+    EXPORT_SUFFIXES,
+    ExportFormat,
+    encode_batches,
+    record_batches,
+)
 from .shared import demo_page
 
-router = APIRouter()
+router = APIRouter(route_class=ThreadPoolRoute)
 
+# serialized table pages; the dataset is read-only, so entries only leave by LRU eviction
+table_cache = ResponseCache(maxsize=512)
 
-class City(BaseModel):
-    id: int = Field(title='ID')
-    city: str = Field(title='Name')
-    city_ascii: str = Field(title='City Ascii')
-    lat: float = Field(title='Latitude')
-    lng: float = Field(title='Longitude')
+
+@cache
+def cities_lookup() -> dict[int, int]:
+    return {city_id: row for row, city_id in enumerate(load_cities()['id'].tolist())}
+
+
+@cache
+def cities_by_iso3() -> dict[str, np.ndarray]:
+    return load_cities().group_rows('iso3')
+
+
+@cache
+def cities_by_country_name() -> dict[str, np.ndarray]:
+    return load_cities().group_rows('country')
+
+
+@cache
+def cities_by_admin_region() -> dict[tuple[str, str | None], np.ndarray]:
+    # admin region names are only unique within a country
+    return load_cities().group_rows('iso3', 'admin_name')
+
+
+@cache
+def cities_name_index() -> NameIndex:
+    return NameIndex(load_cities())
+
+
+@cache
+def cities_geo_index() -> GeoIndex:
+    return GeoIndex(load_cities())
+
+
+NO_CITIES = np.empty(0, dtype=np.intp)
+
+CitySortField: TypeAlias = Literal[
+    'id', 'city', 'city_ascii', 'lat', 'lng', 'country', 'iso2', 'iso3', 'admin_name', 'capital', 'population'
+]
+SortOrder: TypeAlias = Literal['asc', 'desc']
+
+
+@cache
+def cities_sort_keys() -> dict[str, np.ndarray]:
+    cities = load_cities()
+    return {name: cities.sort_key(name) for name in City.model_fields}
+
+
+@cache
+def cities_sort_orders() -> dict[tuple[str, str], np.ndarray]:
+    # stable sorts keep ties in population order, so population/desc is the table's own order
+    orders = {}
+    for name, key in cities_sort_keys().items():
+        orders[name, 'asc'] = np.argsort(key, kind='stable')
+        orders[name, 'desc'] = np.argsort(-key, kind='stable')
+    return orders
+
+
+def country_rows(country: str) -> np.ndarray:
+    """Rows of a country given by iso3 code or name, in population order."""
+    row_ids = cities_by_iso3().get(country)
+    if row_ids is None:
+        row_ids = cities_by_country_name().get(country, NO_CITIES)
+    return row_ids
+
+
+def filter_cities(country: str | None, region: str | None) -> np.ndarray | None:
+    """Rows matching the filters in population order, or `None` when nothing is filtered."""
+    if not country:
+        return None
+    row_ids = country_rows(country)
+    if region and len(row_ids):
+        iso3 = load_cities().row(row_ids[0]).iso3
+        row_ids = cities_by_admin_region().get((iso3, region), NO_CITIES)
+    return row_ids
+
+
+@lru_cache(maxsize=1024)
+def sorted_cities(sort: CitySortField, order: SortOrder, country: str | None, region: str | None) -> np.ndarray:
+    """Rows matching the filters in the requested order, sorted once per combination."""
+    row_ids = filter_cities(country, region)
+    if row_ids is None:
+        return cities_sort_orders()[sort, order]
+    key = cities_sort_keys()[sort][row_ids]
+    return row_ids[np.argsort(key if order == 'asc' else -key, kind='stable')]
+
+
+class CountryTotal(BaseModel):
+    iso3: str = Field(title='ISO3')
     country: str = Field(title='Country')
-    iso2: str = Field(title='ISO2')
+    cities: int = Field(title='Cities')
+    population: float = Field(title='Population')
+
+
+class RegionTotal(BaseModel):
     iso3: str = Field(title='ISO3')
     admin_name: str | None = Field(title='Admin Name')
-    capital: str | None = Field(title='Capital')
+    cities: int = Field(title='Cities')
     population: float = Field(title='Population')
 
 
+class RankedCity(City):
+    rank: int = Field(title='Rank')
+
+
 @cache
-def cities_list() -> list[City]:
-    cities_adapter = TypeAdapter(list[City])
-    cities_file = Path(__file__).parent / 'cities.json'
-    cities = cities_adapter.validate_json(cities_file.read_bytes())
-    cities.sort(key=lambda city: city.population, reverse=True)
-    return cities
+def country_totals() -> list[CountryTotal]:
+    cities = load_cities()
+    totals = cities.group_totals('iso3')
+    return [
+        CountryTotal(iso3=iso3, country=largest.country, cities=count, population=population)
+        for iso3, largest, count, population in zip(
+            totals.keys, cities.rows(totals.rows), totals.cities.tolist(), totals.population.tolist(), strict=True
+        )
+    ]
 
 
 @cache
-def cities_lookup() -> dict[id, City]:
-    return {city.id: city for city in cities_list()}
+def region_totals() -> dict[str | None, list[RegionTotal]]:
+    """Admin region totals keyed by iso3, and by `None` for all of them, most populous region first."""
+    totals = load_cities().group_totals('iso3', 'admin_name')
+    regions = {None: []}
+    for (iso3, admin_name), count, population in zip(
+        totals.keys, totals.cities.tolist(), totals.population.tolist(), strict=True
+    ):
+        total = RegionTotal(iso3=iso3, admin_name=admin_name, cities=count, population=population)
+        regions[None].append(total)
+        regions.setdefault(iso3, []).append(total)
+    return regions
+
+
+def regions_of(country: str | None) -> list[RegionTotal]:
+    if not country:
+        return region_totals()[None]
+    row_ids = country_rows(country)
+    return region_totals()[load_cities().row(row_ids[0]).iso3] if len(row_ids) else []
+
+
+@lru_cache(maxsize=256)
+def top_cities(n: int, country: str | None = None) -> list[RankedCity]:
+    """The `n` most populous cities of one country, or of every country ordered by iso3."""
+    cities = load_cities()
+    if country:
+        row_ids = country_rows(country)[:n]
+        ranks = range(1, len(row_ids) + 1)
+    else:
+        row_ids, ranks = cities.top_rows(n, 'iso3')
+        ranks = ranks.tolist()
+    return [RankedCity(**city.model_dump(), rank=rank) for city, rank in zip(cities.rows(row_ids), ranks, strict=True)]
+
+
+def reload_cities() -> bool:
+    """Load the dataset again, e.g. after `pyd data compile`, and report whether it changed.
+
+    Indexes, aggregates and cached pages are only dropped when the data did
+    change; they are then rebuilt lazily on the next request that needs them.
+    """
+    previous = load_cities()
+    load_cities.cache_clear()
+    cities = load_cities()
+    if all(np.array_equal(previous[name], cities[name]) for name in City.model_fields):
+        return False
+    for derived in (
+        cities_lookup,
+        cities_by_iso3,
+        cities_by_country_name,
+        cities_by_admin_region,
+        cities_name_index,
+        cities_geo_index,
+        cities_sort_keys,
+        cities_sort_orders,
+        sorted_cities,
+        country_totals,
+        region_totals,
+        top_cities,
+        country_index,
+    ):
+        derived.cache_clear()
+    table_cache.clear()
+    return True
 
 
 class FilterForm(pydantic.BaseModel):
@@ -48,13 +217,26 @@ class FilterForm(pydantic.BaseModel):
 
 
 @router.get('/cities', response_model=FastUI, response_model_exclude_none=True)
-def cities_view(page: int = 1, country: str | None = None) -> list[AnyComponent]:
-    cities = cities_list()
+@table_cache.fastui
+def cities_view(
+    page: int = 1,
+    country: str | None = None,
+    region: str | None = None,
+    sort: CitySortField = 'population',
+    order: SortOrder | None = None,
+) -> list[AnyComponent]:
+    cities = load_cities()
+    order = order or ('desc' if sort == 'population' else 'asc')
+    row_ids = sorted_cities(sort, order, country or None, region if country else None)
     page_size = 50
     filter_form_initial = {}
     if country:
-        cities = [city for city in cities if city.iso3 == country]
-        country_name = cities[0].country if cities else country
+        country_rows = filter_cities(country, None)
+        if len(country_rows):
+            first = cities.row(country_rows[0])
+            country, country_name = first.iso3, first.country
+        else:
+            country_name = country
         filter_form_initial['country'] = {'value': country, 'label': country_name}
     return demo_page(
         *tabs(),
@@ -67,7 +249,7 @@ def cities_view(page: int = 1, country: str | None = None) -> list[AnyComponent]
             display_mode='inline',
         ),
         c.Table(
-            data=cities[(page - 1) * page_size : page * page_size],
+            data=cities.rows(row_ids[(page - 1) * page_size : page * page_size]),
             data_model=City,
             columns=[
                 DisplayLookup(field='city', on_click=GoToEvent(url='./{id}'), table_width_percent=33),
@@ -75,14 +257,87 @@ def cities_view(page: int = 1, country: str | None = None) -> list[AnyComponent]
                 DisplayLookup(field='population', table_width_percent=33),
             ],
         ),
-        c.Pagination(page=page, page_size=page_size, total=len(cities)),
+        c.Pagination(page=page, page_size=page_size, total=len(row_ids)),
         title='Cities',
     )
 
 
+# declared before `/cities/{city_id}` so that 'search' is not taken for an id
+@router.get('/cities/search', response_model=SelectSearchResponse)
+def cities_search(q: str = '', limit: int = Query(20, ge=1, le=100)) -> SelectSearchResponse:
+    cities = load_cities().rows(cities_name_index().search(q, limit))
+    options = [{'value': str(city.id), 'label': f'{city.city}, {city.country}'} for city in cities]
+    return SelectSearchResponse(options=options)
+
+
+class NearbyCity(City):
+    distance_km: float = Field(title='Distance (km)')
+
+
+@router.get('/cities/near', response_model=list[NearbyCity])
+def cities_near(
+    lat: float = Query(ge=-90, le=90),
+    lng: float = Query(ge=-180, le=180),
+    k: int = Query(10, ge=1, le=100),
+) -> list[NearbyCity]:
+    row_ids, distances = cities_geo_index().nearest(lat, lng, k)
+    cities = load_cities().rows(row_ids)
+    return [NearbyCity(**city.model_dump(), distance_km=d) for city, d in zip(cities, distances.tolist(), strict=True)]
+
+
+@router.get('/cities/within', response_model=list[City])
+def cities_within(
+    min_lat: float = Query(ge=-90, le=90),
+    max_lat: float = Query(ge=-90, le=90),
+    min_lng: float = Query(ge=-180, le=180, description='Greater than max_lng for boxes crossing 180°'),
+    max_lng: float = Query(ge=-180, le=180),
+    limit: int = Query(50, ge=1, le=1000),
+) -> list[City]:
+    row_ids = cities_geo_index().within(min_lat, max_lat, min_lng, max_lng)
+    return load_cities().rows(row_ids[:limit])
+
+
+@router.get('/cities/export/{fmt}', response_class=StreamingResponse)
+def cities_export(
+    fmt: ExportFormat,
+    country: str | None = None,
+    region: str | None = None,
+    batch_size: int = Query(1024, ge=1, le=65536),
+) -> StreamingResponse:
+    row_ids = filter_cities(country or None, region if country else None)
+    return StreamingResponse(
+        encode_batches(record_batches(load_cities(), row_ids, batch_size), fmt),
+        media_type=EXPORT_MEDIA_TYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename="cities.{EXPORT_SUFFIXES[fmt]}"'},
+    )
+
+
+@router.post('/cities/reload')
+def cities_reload() -> dict[str, bool]:
+    """Pick up a snapshot rewritten by `pyd data compile` without restarting the server."""
+    return {'changed': reload_cities()}
+
+
+@router.get('/cities/stats/countries', response_model=list[CountryTotal])
+def cities_country_totals() -> list[CountryTotal]:
+    return country_totals()
+
+
+@router.get('/cities/stats/regions', response_model=list[RegionTotal])
+def cities_region_totals(country: str | None = None) -> list[RegionTotal]:
+    return regions_of(country)
+
+
+@router.get('/cities/stats/top', response_model=list[RankedCity])
+def cities_top(n: int = Query(3, ge=1, le=100), country: str | None = None) -> list[RankedCity]:
+    return top_cities(n, country)
+
+
 @router.get('/cities/{city_id}', response_model=FastUI, response_model_exclude_none=True)
+@table_cache.fastui
+@cheap
 def city_view(city_id: int) -> list[AnyComponent]:
-    city = cities_lookup()[city_id]
+    city = load_cities().row(cities_lookup()[city_id])
     return demo_page(
         *tabs(),
         c.Link(components=[c.Text(text='Back')], on_click=BackEvent()),
@@ -91,6 +346,89 @@ def city_view(city_id: int) -> list[AnyComponent]:
     )
 
 
+@router.get('/stats/countries', response_model=FastUI, response_model_exclude_none=True)
+@table_cache.fastui
+def country_totals_view(page: int = 1) -> list[AnyComponent]:
+    totals = country_totals()
+    page_size = 50
+    return demo_page(
+        *tabs(),
+        *stats_links(),
+        c.Table(
+            data=totals[(page - 1) * page_size : page * page_size],
+            data_model=CountryTotal,
+            columns=[
+                DisplayLookup(field='country', on_click=GoToEvent(url='./regions?country={iso3}')),
+                DisplayLookup(field='cities'),
+                DisplayLookup(field='population'),
+            ],
+        ),
+        c.Pagination(page=page, page_size=page_size, total=len(totals)),
+        title='Population by Country',
+    )
+
+
+@router.get('/stats/regions', response_model=FastUI, response_model_exclude_none=True)
+@table_cache.fastui
+def region_totals_view(page: int = 1, country: str | None = None) -> list[AnyComponent]:
+    regions = regions_of(country)
+    page_size = 50
+    return demo_page(
+        *tabs(),
+        *stats_links(),
+        c.Table(
+            data=regions[(page - 1) * page_size : page * page_size],
+            data_model=RegionTotal,
+            columns=[
+                DisplayLookup(field='admin_name'),
+                DisplayLookup(field='iso3'),
+                DisplayLookup(field='cities'),
+                DisplayLookup(field='population'),
+            ],
+        ),
+        c.Pagination(page=page, page_size=page_size, total=len(regions)),
+        title=f'Cities per Region of {country}' if country else 'Cities per Region',
+    )
+
+
+@router.get('/stats/top', response_model=FastUI, response_model_exclude_none=True)
+@table_cache.fastui
+def top_cities_view(page: int = 1, n: int = Query(3, ge=1, le=100), country: str | None = None) -> list[AnyComponent]:
+    cities = top_cities(n, country)
+    page_size = 50
+    return demo_page(
+        *tabs(),
+        *stats_links(),
+        c.Table(
+            data=cities[(page - 1) * page_size : page * page_size],
+            data_model=RankedCity,
+            columns=[
+                DisplayLookup(field='country'),
+                DisplayLookup(field='rank'),
+                DisplayLookup(field='city', on_click=GoToEvent(url='/table/cities/{id}')),
+                DisplayLookup(field='population'),
+            ],
+        ),
+        c.Pagination(page=page, page_size=page_size, total=len(cities)),
+        title=f'Top {n} Cities per Country',
+    )
+
+
+@cache
+def stats_links() -> list[AnyComponent]:
+    return [
+        prebuilt(
+            c.LinkList(
+                links=[
+                    c.Link(components=[c.Text(text=text)], on_click=GoToEvent(url=f'/table/stats/{path}'))
+                    for text, path in (('Countries', 'countries'), ('Regions', 'regions'), ('Top Cities', 'top'))
+                ],
+                class_name='+ mb-4',
+            )
+        ),
+    ]
+
+
 class User(BaseModel):
     id: int = Field(title='ID')
     name: str = Field(title='Name')
@@ -107,6 +445,8 @@ users: list[User] = [
 
 
 @router.get('/users', response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
+@cheap
 def users_view() -> list[AnyComponent]:
     return demo_page(
         *tabs(),
@@ -123,28 +463,39 @@ def users_view() -> list[AnyComponent]:
     )
 
 
+@cache
 def tabs() -> list[AnyComponent]:
+    # the same on every table page, so built and serialized once
     return [
-        c.LinkList(
-            links=[
-                c.Link(
-                    components=[c.Text(text='Cities')],
-                    on_click=GoToEvent(url='/table/cities'),
-                    active='startswith:/table/cities',
-                ),
-                c.Link(
-                    components=[c.Text(text='Users')],
-                    on_click=GoToEvent(url='/table/users'),
-                    active='startswith:/table/users',
-                ),
-            ],
-            mode='tabs',
-            class_name='+ mb-4',
+        prebuilt(
+            c.LinkList(
+                links=[
+                    c.Link(
+                        components=[c.Text(text='Cities')],
+                        on_click=GoToEvent(url='/table/cities'),
+                        active='startswith:/table/cities',
+                    ),
+                    c.Link(
+                        components=[c.Text(text='Stats')],
+                        on_click=GoToEvent(url='/table/stats/countries'),
+                        active='startswith:/table/stats',
+                    ),
+                    c.Link(
+                        components=[c.Text(text='Users')],
+                        on_click=GoToEvent(url='/table/users'),
+                        active='startswith:/table/users',
+                    ),
+                ],
+                mode='tabs',
+                class_name='+ mb-4',
+            )
         ),
     ]
 
 
 @router.get('/users/{id}/', response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
+@cheap
 def user_profile(id: int) -> list[AnyComponent]:
     user: User | None = users[id - 1] if id <= len(users) else None
     return demo_page(
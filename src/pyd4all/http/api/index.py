@@ -9,6 +9,8 @@ from pydantic import BaseModel, Field
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
+from pyd4all.utils.response_tools import fastui_response
+
 # Define the router for this endpoint
 router = APIRouter()
 
@@ -39,6 +41,7 @@ users = [
 
 
 @router.get("", response_model=FastUI, response_model_exclude_none=True)
+@fastui_response
 def users_table() -> list[AnyComponent]:
     """
     Show a table of four users, `/api` is the endpoint the frontend will connect to
@@ -2,6 +2,8 @@
 
 from fastapi import APIRouter, Path
 
+from pyd4all.http.api.v1.users.index import user_loader, user_response
+
 # Define the router for this endpoint
 router = APIRouter()
 
@@ -11,7 +13,5 @@ async def get_user(user_id: int = Path(..., title="User ID", description="The ID
     """
     Endpoint to retrieve a user by user ID.
     """
-    # Dummy user data
-    user_data = {"user_id": user_id, "name": "John Doe", "email": "johndoe@example.com"}
-
-    return user_data
+    # batched with the lookups of other requests arriving at the same time
+    return user_response(user_id, await user_loader.load(user_id))
@@ -1,8 +1,12 @@
 # src/pyd4all/http/api/v1/users/index.py
 
-from fastapi import APIRouter, HTTPException
+from typing import Annotated
+
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
 
+from pyd4all.utils.batch_tools import BatchLoader
+
 # Define the router for this endpoint
 router = APIRouter()
 
@@ -16,6 +20,42 @@ class UserCreateRequest(BaseModel):
 # Example of in-memory storage for simplicity (use a database in real applications)
 fake_user_db = []
 
+# most users one `?ids=` request may ask for
+MAX_IDS = 100
+
+
+async def fetch_users(user_ids: list[int]) -> dict[int, dict]:
+    """
+    Fetch several users in one query of the storage, e.g. `SELECT ... WHERE id IN (...)` with a database.
+    """
+    wanted = set(user_ids)
+    return {user["id"]: user for user in fake_user_db if user["id"] in wanted}
+
+
+# lookups of concurrent requests are fetched together, never one query per user
+user_loader = BatchLoader(fetch_users, max_batch_size=MAX_IDS)
+
+
+def user_response(user_id: int, user: dict | None) -> dict:
+    if user is None:
+        # Dummy user data for users that were never created
+        return {"user_id": user_id, "name": "John Doe", "email": "johndoe@example.com"}
+    return {"user_id": user_id, "name": user["name"], "email": user["email"]}
+
+
+@router.get("")
+async def get_users(
+    ids: Annotated[str, Query(pattern=r"^\d+(,\d+)*$", description="Comma-separated user IDs, e.g. `1,2,3`")],
+):
+    """
+    Endpoint to retrieve several users by ID with one request, in the order they were asked for.
+    """
+    user_ids = [int(user_id) for user_id in ids.split(",")]
+    if len(user_ids) > MAX_IDS:
+        raise HTTPException(status_code=422, detail=f"At most {MAX_IDS} IDs can be requested at once.")
+    users = await user_loader.load_many(user_ids)
+    return [user_response(user_id, user) for user_id, user in zip(user_ids, users, strict=True)]
+
 
 @router.post("")
 async def create_user(user: UserCreateRequest):
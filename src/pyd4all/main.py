@@ -2,9 +2,14 @@ import os
 import subprocess
 from pathlib import Path
 
+import httpx
 import typer
 
+from pyd4all.examples.demo.cities import CITIES_FILE, CITIES_SNAPSHOT, compile_snapshot
+
 app = typer.Typer()
+data_app = typer.Typer(help="Build data files used by the demos.")
+app.add_typer(data_app, name="data")
 
 
 @app.command(name="start")
@@ -29,3 +34,17 @@ def start_service(module_name="streamer",
     print(command)
 
     subprocess.run(command)
+
+
+@data_app.command(name="compile")
+def compile_data(source: Path = CITIES_FILE, target: Path = CITIES_SNAPSHOT, server: str | None = None):
+    """Compile cities.json into the binary snapshot the table demo maps into memory.
+
+    With --server, the demo running at that URL is told to reload it.
+    """
+    cities = compile_snapshot(source, target)
+    print(f"Wrote {len(cities)} cities to {target}")
+    if server:
+        response = httpx.post(f"{server.rstrip('/')}/api/table/cities/reload")
+        response.raise_for_status()
+        print("Reloaded by the server" if response.json()["changed"] else "The server already had this data")
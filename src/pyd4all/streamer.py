@@ -1,8 +1,17 @@
+import asyncio
+import inspect
 import os
+import time
+from array import array
+from collections import deque
+from collections.abc import AsyncIterable, AsyncIterator, Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any
 
 from faststream import FastStream
 from faststream.redis import RedisBroker, TestRedisBroker
 from pydantic import BaseModel, Field, PositiveInt
+
 from pyd4all.config import settings
 
 
@@ -34,3 +43,375 @@ def create_app() -> FastStream:
         return processed_message
 
     return app
+
+
+# --- In-process pipelines ---
+
+Stage = Callable[[AsyncIterator[Any]], AsyncIterator[Any]]
+
+_DONE = object()
+
+
+@dataclass
+class StageStats:
+    """Number of items a stage emitted and how fast it emitted them."""
+
+    name: str
+    items: int = 0
+    first_at: float | None = None
+    last_at: float | None = None
+
+    def record(self) -> None:
+        now = time.perf_counter()
+        if self.first_at is None:
+            self.first_at = now
+        self.last_at = now
+        self.items += 1
+
+    @property
+    def throughput(self) -> float:
+        """Items per second between the first and the last emitted item."""
+        if self.first_at is None or self.last_at == self.first_at:
+            return 0.0
+        return (self.items - 1) / (self.last_at - self.first_at)
+
+
+async def _resolve(value: Any) -> Any:
+    return await value if inspect.isawaitable(value) else value
+
+
+async def iter_queue(queue: asyncio.Queue) -> AsyncIterator[Any]:
+    """Yield items from a queue until `close_queue` is called on it."""
+    while (item := await queue.get()) is not _DONE:
+        yield item
+
+
+async def close_queue(queue: asyncio.Queue) -> None:
+    """Signal `iter_queue` consumers that no more items will arrive."""
+    await queue.put(_DONE)
+
+
+async def _feed(items: AsyncIterator[Any], inboxes: list[asyncio.Queue]) -> None:
+    async for item in items:
+        for inbox in inboxes:
+            await inbox.put(item)
+    for inbox in inboxes:
+        await close_queue(inbox)
+
+
+async def _drain(branch: "Pipeline", inbox: asyncio.Queue, merged: asyncio.Queue) -> None:
+    async for item in branch(iter_queue(inbox)):
+        await merged.put(item)
+
+
+async def _merge(merged: asyncio.Queue, pending: set[asyncio.Task]) -> AsyncIterator[Any]:
+    """Yield from `merged` until every task in `pending` is done, re-raising their errors."""
+    while pending or not merged.empty():
+        if not merged.empty():
+            yield merged.get_nowait()
+            continue
+        getter = asyncio.ensure_future(merged.get())
+        done, _ = await asyncio.wait({getter, *pending}, return_when=asyncio.FIRST_COMPLETED)
+        for task in done - {getter}:
+            pending.discard(task)
+            task.result()
+        if getter in done:
+            yield getter.result()
+        else:
+            getter.cancel()
+
+
+class Pipeline:
+    """Chain of async-generator stages that runs in a single process.
+
+    Stages hand items to each other directly, so intermediate steps never go
+    through the broker. Only the sink passed to `run` publishes anything.
+
+    >>> async def numbers():
+    ...     for i in range(10):
+    ...         yield i
+    >>> pipeline = Pipeline().filter(lambda i: i % 2).map(lambda i: i * 10).batch(2)
+    >>> async def collect():
+    ...     return [batch async for batch in pipeline(numbers())]
+    >>> asyncio.run(collect())
+    [[10, 30], [50, 70], [90]]
+    >>> pipeline.stats["2:batch"].items
+    3
+    """
+
+    def __init__(self) -> None:
+        self.stages: list[tuple[str, Stage]] = []
+        self.stats: dict[str, StageStats] = {}
+
+    def pipe(self, stage: Stage, name: str | None = None) -> "Pipeline":
+        """Append a stage, a callable turning an async iterator into another one."""
+        name = name or f"{len(self.stages)}:{stage.__name__.lstrip('_')}"
+        if name in self.stats:
+            raise ValueError(f"Duplicate stage name: {name}")
+        self.stages.append((name, stage))
+        self.stats[name] = StageStats(name)
+        return self
+
+    def map(self, fn: Callable[[Any], Any], name: str | None = None) -> "Pipeline":
+        """Transform each item with `fn`, which may be sync or async."""
+
+        async def _map(items: AsyncIterator[Any]) -> AsyncIterator[Any]:
+            async for item in items:
+                yield await _resolve(fn(item))
+
+        return self.pipe(_map, name)
+
+    def filter(self, predicate: Callable[[Any], Any], name: str | None = None) -> "Pipeline":
+        """Drop items for which `predicate`, sync or async, is falsy."""
+
+        async def _filter(items: AsyncIterator[Any]) -> AsyncIterator[Any]:
+            async for item in items:
+                if await _resolve(predicate(item)):
+                    yield item
+
+        return self.pipe(_filter, name)
+
+    def batch(self, size: int, name: str | None = None) -> "Pipeline":
+        """Group items into lists of `size`; the last list may be shorter."""
+        if size < 1:
+            raise ValueError("Batch size must be positive")
+
+        async def _batch(items: AsyncIterator[Any]) -> AsyncIterator[list[Any]]:
+            current: list[Any] = []
+            async for item in items:
+                current.append(item)
+                if len(current) == size:
+                    yield current
+                    current = []
+            if current:
+                yield current
+
+        return self.pipe(_batch, name)
+
+    def window(self, size: int, step: int = 1, name: str | None = None) -> "Pipeline":
+        """Yield the last `size` items as a tuple every `step` items once `size` have arrived."""
+        if size < 1 or step < 1:
+            raise ValueError("Window size and step must be positive")
+
+        async def _window(items: AsyncIterator[Any]) -> AsyncIterator[tuple[Any, ...]]:
+            recent: deque[Any] = deque(maxlen=size)
+            seen = 0
+            async for item in items:
+                recent.append(item)
+                seen += 1
+                if seen >= size and (seen - size) % step == 0:
+                    yield tuple(recent)
+
+        return self.pipe(_window, name)
+
+    def fan_out(self, *branches: "Pipeline", maxsize: int = 64, name: str | None = None) -> "Pipeline":
+        """Send every item through each branch concurrently and merge their outputs."""
+        if not branches:
+            raise ValueError("fan_out needs at least one branch")
+
+        async def _fan_out(items: AsyncIterator[Any]) -> AsyncIterator[Any]:
+            merged: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+            inboxes = [asyncio.Queue(maxsize=maxsize) for _ in branches]
+            tasks = [asyncio.create_task(_feed(items, inboxes))]
+            tasks += [
+                asyncio.create_task(_drain(branch, inbox, merged))
+                for branch, inbox in zip(branches, inboxes, strict=True)
+            ]
+            try:
+                async for item in _merge(merged, set(tasks)):
+                    yield item
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+        return self.pipe(_fan_out, name)
+
+    def aggregate(self, window: "SlidingWindow", name: str | None = None) -> "Pipeline":
+        """Count items into `window`, yielding each aggregate as its window closes.
+
+        The window still open when the source ends is yielded last.
+        """
+
+        async def _aggregate(items: AsyncIterator[Any]) -> AsyncIterator["WindowAggregate"]:
+            async for _ in items:
+                for aggregate in window.add():
+                    yield aggregate
+            yield window.flush()
+
+        return self.pipe(_aggregate, name)
+
+    def __call__(self, source: AsyncIterable[Any]) -> AsyncIterator[Any]:
+        """Compose the stages over `source`, counting what each one emits."""
+        items = aiter(source)
+        for name, stage in self.stages:
+            items = self._counted(stage(items), self.stats[name])
+        return items
+
+    @staticmethod
+    async def _counted(items: AsyncIterator[Any], stats: StageStats) -> AsyncIterator[Any]:
+        async for item in items:
+            stats.record()
+            yield item
+
+    async def run(self, source: AsyncIterable[Any], sink: Callable[[Any], Awaitable[Any]]) -> int:
+        """Push everything the final stage emits into `sink` and return the count."""
+        published = 0
+        async for item in self(source):
+            await sink(item)
+            published += 1
+        return published
+
+    def report(self) -> str:
+        """One line per stage with its item count and throughput."""
+        return "\n".join(
+            f"{stats.name}: {stats.items} items, {stats.throughput:.1f}/s" for stats in self.stats.values()
+        )
+
+
+def registration_message(data: User) -> dict:
+    return {"message": f"User: {data.user_id} - {data.user} registered."}
+
+
+def create_pipeline_app() -> FastStream:
+    """Like `create_app`, but enrichment runs as in-process pipeline stages."""
+    broker = RedisBroker(settings.redis_url)
+    app = FastStream(broker)
+    inbox: asyncio.Queue = asyncio.Queue(maxsize=1024)
+    publisher = broker.publisher(settings.output_channel)
+    pipeline = (
+        Pipeline()
+        .map(lambda data: data.model_copy(update={"user": data.user.strip().title()}), name="normalise")
+        .filter(lambda data: bool(data.user), name="non_empty")
+        .map(registration_message, name="message")
+    )
+    running: list[asyncio.Task] = []
+
+    @broker.subscriber(settings.input_channel)
+    async def receive(data: User) -> None:
+        await inbox.put(data)
+
+    @app.after_startup
+    async def start_pipeline() -> None:
+        running.append(asyncio.create_task(pipeline.run(iter_queue(inbox), publisher.publish)))
+
+    @app.on_shutdown
+    async def stop_pipeline() -> None:
+        await close_queue(inbox)
+        await asyncio.gather(*running)
+        print(pipeline.report())
+
+    return app
+
+
+# --- Windowed aggregation ---
+
+
+class WindowAggregate(BaseModel):
+    window_start: float = Field(..., description="Window start, seconds since the epoch.")
+    window_end: float = Field(..., description="Window end, seconds since the epoch.")
+    count: int = Field(..., description="Events seen in the window.")
+    rate: float = Field(..., description="Events per second over the window.")
+
+
+class SlidingWindow:
+    """Event count over the last `size` seconds, emitted every `slide` seconds.
+
+    The state is a fixed ring of `size / slide` counters, one per slide, so
+    memory stays the same whatever the event rate. Windows are aligned to
+    multiples of `slide` since the epoch.
+
+    >>> window = SlidingWindow(size=3, slide=1, clock=lambda: 100.0)
+    >>> window.add(n=2, at=100.5), window.add(at=101.2)
+    ([], [WindowAggregate(window_start=98.0, window_end=101.0, count=2, rate=0.6666666666666666)])
+    >>> [a.count for a in window.advance(now=103.5)]
+    [3, 3]
+    """
+
+    def __init__(self, size: float, slide: float | None = None, clock: Callable[[], float] = time.time) -> None:
+        slide = slide or size
+        buckets = round(size / slide)
+        if slide <= 0 or buckets < 1 or abs(buckets * slide - size) > 1e-9:
+            raise ValueError("Window size must be a positive multiple of the slide")
+        self.size = size
+        self.slide = slide
+        self.clock = clock
+        self._counts = array("Q", bytes(8 * buckets))
+        self._head = 0
+        self._slot = int(clock() // slide)
+
+    @property
+    def window_end(self) -> float:
+        """End of the window currently being filled."""
+        return (self._slot + 1) * self.slide
+
+    def _aggregate(self) -> WindowAggregate:
+        count = sum(self._counts)
+        end = self.window_end
+        return WindowAggregate(window_start=end - self.size, window_end=end, count=count, rate=count / self.size)
+
+    def advance(self, now: float | None = None) -> list[WindowAggregate]:
+        """Close every window that ended by `now` and return their aggregates.
+
+        After a gap longer than `size` the ring is all zeros, so only the
+        windows that still contained events are returned.
+        """
+        now = self.clock() if now is None else now
+        steps = int(now // self.slide) - self._slot
+        closed = []
+        for _ in range(min(steps, len(self._counts))):
+            closed.append(self._aggregate())
+            self._head = (self._head + 1) % len(self._counts)
+            self._counts[self._head] = 0
+            self._slot += 1
+        self._slot += max(steps - len(self._counts), 0)
+        return closed
+
+    def add(self, n: int = 1, at: float | None = None) -> list[WindowAggregate]:
+        """Count `n` events and return the aggregates of windows closed before them."""
+        closed = self.advance(at)
+        self._counts[self._head] += n
+        return closed
+
+    def flush(self) -> WindowAggregate:
+        """Aggregate of the window still open, without closing it."""
+        return self._aggregate()
+
+
+class TumblingWindow(SlidingWindow):
+    """Event count over consecutive, non-overlapping windows of `size` seconds."""
+
+    def __init__(self, size: float, clock: Callable[[], float] = time.time) -> None:
+        super().__init__(size, size, clock)
+
+
+async def emit_windows(window: SlidingWindow, sink: Callable[[Any], Awaitable[Any]]) -> None:
+    """Publish each window as it closes, including windows without any events."""
+    while True:
+        await asyncio.sleep(max(window.window_end - window.clock(), 0))
+        for aggregate in window.advance():
+            await sink(aggregate.model_dump())
+
+
+def create_window_app(window: SlidingWindow | None = None) -> FastStream:
+    """Publish rolling registration counts from `input_channel` to `output_channel`."""
+    window = window or SlidingWindow(size=60, slide=10)
+    broker = RedisBroker(settings.redis_url)
+    app = FastStream(broker)
+    publisher = broker.publisher(settings.output_channel)
+    running: list[asyncio.Task] = []
+
+    @broker.subscriber(settings.input_channel)
+    async def count_registration(data: User) -> None:
+        for aggregate in window.add():
+            await publisher.publish(aggregate.model_dump())
+
+    @app.after_startup
+    async def start_ticker() -> None:
+        running.append(asyncio.create_task(emit_windows(window, publisher.publish)))
+
+    @app.on_shutdown
+    async def stop_ticker() -> None:
+        for task in running:
+            task.cancel()
+
+    return app
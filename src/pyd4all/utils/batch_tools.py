@@ -0,0 +1,97 @@
+"""Batched lookups: the keys asked for during one event loop tick are fetched together."""
+
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable, Iterable, Mapping
+from dataclasses import asdict, dataclass, field
+from typing import Any
+
+
+@dataclass
+class BatchStats:
+    """Counters of a `BatchLoader`; `loads` per `fetches` is how much batching saves."""
+
+    loads: int = 0
+    fetches: int = 0
+    keys: int = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return asdict(self)
+
+
+@dataclass
+class _Batch:
+    loop: asyncio.AbstractEventLoop
+    futures: dict[Hashable, asyncio.Future] = field(default_factory=dict)
+
+
+class BatchLoader:
+    """Load values by key, gathering the loads of concurrent tasks into one call of `fetch`.
+
+    `fetch` gets a list of distinct keys, at most `max_batch_size` of them,
+    and returns the values it found by key; keys it leaves out load as
+    `None`. Loads made before the event loop gets back to its queue of
+    callbacks, usually those of every request that arrived together, share
+    one fetch, so a backend behind `fetch` is queried once instead of once
+    per key. Nothing is cached between batches.
+    """
+
+    def __init__(
+        self, fetch: Callable[[list[Hashable]], Awaitable[Mapping[Hashable, Any]]], max_batch_size: int = 100
+    ) -> None:
+        self.fetch = fetch
+        self.max_batch_size = max_batch_size
+        self.stats = BatchStats()
+        self._batch: _Batch | None = None
+        # the event loop only keeps weak references to tasks
+        self._fetching: set[asyncio.Task] = set()
+
+    def _future(self, key: Hashable) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        batch = self._batch
+        if batch is None or batch.loop is not loop:
+            batch = self._batch = _Batch(loop)
+            loop.call_soon(self._dispatch, batch)
+        future = batch.futures.get(key)
+        if future is None:
+            future = batch.futures[key] = loop.create_future()
+        return future
+
+    async def load(self, key: Hashable) -> Any:
+        self.stats.loads += 1
+        # the future is shared by every load of the key, cancelling one load must not cancel the others
+        return await asyncio.shield(self._future(key))
+
+    async def load_many(self, keys: Iterable[Hashable]) -> list[Any]:
+        """The values of `keys` in order, fetched in the same batch as the other loads of this tick."""
+        keys = list(keys)
+        self.stats.loads += len(keys)
+        return list(await asyncio.gather(*(asyncio.shield(self._future(key)) for key in keys)))
+
+    def _dispatch(self, batch: _Batch) -> None:
+        if self._batch is batch:
+            self._batch = None
+        keys = list(batch.futures)
+        for start in range(0, len(keys), self.max_batch_size):
+            chunk = keys[start : start + self.max_batch_size]
+            task = batch.loop.create_task(self._fetch(chunk, batch.futures))
+            self._fetching.add(task)
+            task.add_done_callback(self._fetching.discard)
+
+    async def _fetch(self, keys: list[Hashable], futures: dict[Hashable, asyncio.Future]) -> None:
+        self.stats.fetches += 1
+        self.stats.keys += len(keys)
+        try:
+            try:
+                values = await self.fetch(keys)
+            except Exception as exc:
+                for key in keys:
+                    if not futures[key].done():
+                        futures[key].set_exception(exc)
+                return
+            for key in keys:
+                if not futures[key].done():
+                    futures[key].set_result(values.get(key))
+        finally:
+            # loads of a fetch that was cancelled, e.g. at shutdown, are cancelled instead of left waiting
+            for key in keys:
+                futures[key].cancel()
@@ -0,0 +1,217 @@
+"""Compression of responses negotiated per request, one-shot for bodies and flushed per chunk for streams."""
+
+import gzip
+import zlib
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from http import HTTPStatus
+
+import brotli
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from pyd4all.utils.response_tools import negotiate_encoding
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, install the `zstd` extra to offer it
+    zstandard = None
+
+# levels cheap enough to run on every dynamic response
+LEVELS = {"br": 4, "zstd": 3, "gzip": 6}
+# most preferred first, when a client accepts several with the same q-value; at these levels zstd
+# is about as small as the others on FastUI JSON for a quarter of the CPU
+CODINGS = ("zstd", "br", "gzip") if zstandard is not None else ("br", "gzip")
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+
+
+def compressible(content_type: str | None) -> bool:
+    """Whether a response of `content_type` is worth compressing; already compressed formats are not.
+
+    >>> compressible("application/json"), compressible("application/vnd.apache.parquet")
+    (True, False)
+    """
+    media_type = (content_type or "").partition(";")[0].strip().lower()
+    return media_type.startswith(COMPRESSIBLE_TYPES) or media_type.endswith(("+json", "+xml"))
+
+
+def compress(body: bytes, coding: str, level: int | None = None) -> bytes:
+    level = LEVELS[coding] if level is None else level
+    if coding == "br":
+        return brotli.compress(body, quality=level)
+    if coding == "zstd":
+        return zstandard.ZstdCompressor(level=level).compress(body)
+    return gzip.compress(body, compresslevel=level, mtime=0)
+
+
+class StreamEncoder:
+    """Incremental compressor whose output is flushed after every chunk, so each event arrives on its own."""
+
+    def __init__(self, coding: str, level: int | None = None) -> None:
+        level = LEVELS[coding] if level is None else level
+        self.process: Callable[[bytes], bytes]
+        self.flush: Callable[[], bytes]
+        self.finish: Callable[[], bytes]
+        if coding == "br":
+            compressor = brotli.Compressor(quality=level)
+            self.process, self.flush, self.finish = compressor.process, compressor.flush, compressor.finish
+        elif coding == "zstd":
+            compressor = zstandard.ZstdCompressor(level=level).compressobj()
+            self.process, self.finish = compressor.compress, compressor.flush
+            self.flush = lambda: compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        else:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self.process, self.finish = compressor.compress, compressor.flush
+            self.flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def chunk(self, data: bytes) -> bytes:
+        return self.process(data) + self.flush()
+
+
+class CompressedCache:
+    """LRU cache of compressed bodies keyed by the ETag of the uncompressed body and the coding.
+
+    A response with a strong ETag is the same bytes every time it is sent, so
+    it only needs compressing once, whichever route or app sends it.
+    """
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, bytes] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def compress(self, etag: str, body: bytes, coding: str) -> bytes:
+        key = (etag, coding)
+        compressed = self._entries.get(key)
+        if compressed is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return compressed
+        self.misses += 1
+        compressed = self._entries[key] = compress(body, coding)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return compressed
+
+
+# shared by every `CompressionMiddleware` that is not given its own cache
+compressed_cache = CompressedCache()
+
+
+class CompressionMiddleware:
+    """Compress responses with the best coding of `codings` the client accepts.
+
+    Complete bodies shorter than `minimum_size` are sent as they are. Bodies
+    with a strong ETag are compressed once through `cache`, and their ETag,
+    like that of a 304, is made weak, as the compressed bytes differ but
+    mean the same.
+    Streaming responses, such as server-sent events, are compressed as they
+    are sent with a flush after every chunk, so no event waits for the next
+    one. Responses that already have a `Content-Encoding`, are marked
+    `no-transform` or are not of a `compressible` type are left alone.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = 500,
+        codings: tuple[str, ...] = CODINGS,
+        cache: CompressedCache | None = None,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.codings = tuple(coding for coding in codings if coding in CODINGS)
+        self.cache = compressed_cache if cache is None else cache
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        coding = negotiate_encoding(Headers(scope=scope).get("accept-encoding"), self.codings)
+        if coding == "identity":
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _Responder(self, coding, send).send)
+
+
+def _negotiated(headers: MutableHeaders) -> None:
+    # the representation depends on Accept-Encoding, and compressed bytes only mean the same as the body
+    vary = headers.get("vary")
+    if not vary:
+        headers["Vary"] = "Accept-Encoding"
+    elif "accept-encoding" not in vary.lower():
+        headers["Vary"] = f"{vary}, Accept-Encoding"
+    if (etag := headers.get("etag")) and not etag.startswith("W/"):
+        headers["ETag"] = f"W/{etag}"
+
+
+class _Responder:
+    """Holds back the start of a response until its first body chunk shows how to send it."""
+
+    def __init__(self, middleware: CompressionMiddleware, coding: str, send: Send) -> None:
+        self.middleware = middleware
+        self.coding = coding
+        self._send = send
+        self.start: Message | None = None
+        self.encoder: StreamEncoder | None = None
+        self.passthrough = False
+
+    def _headers(self, content_length: int | None) -> None:
+        # edits the raw header list of the held back start message in place
+        headers = MutableHeaders(raw=self.start["headers"])
+        headers["Content-Encoding"] = self.coding
+        if content_length is None:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(content_length)
+        _negotiated(headers)
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if message["status"] == HTTPStatus.NOT_MODIFIED and "content-encoding" not in headers:
+                # a 304 has no type or body to decide by, it gets the weak ETag a compressed 200 is sent with
+                _negotiated(MutableHeaders(raw=message["headers"]))
+            self.passthrough = (
+                "content-encoding" in headers
+                or "no-transform" in headers.get("cache-control", "")
+                or not compressible(headers.get("content-type"))
+            )
+            if self.passthrough:
+                await self._send(message)
+            else:
+                self.start = message
+            return
+        if self.passthrough or message["type"] != "http.response.body":
+            await self._send(message)
+            return
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.encoder is not None:
+            data = self.encoder.chunk(body) if body else b""
+            if not more_body:
+                data += self.encoder.finish()
+            await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
+            return
+        if more_body:
+            self._headers(None)
+            await self._send(self.start)
+            self.encoder = StreamEncoder(self.coding)
+            await self._send({"type": "http.response.body", "body": self.encoder.chunk(body), "more_body": True})
+            return
+        if len(body) < self.middleware.minimum_size:
+            await self._send(self.start)
+            await self._send(message)
+            return
+        etag = Headers(raw=self.start["headers"]).get("etag")
+        if etag and not etag.startswith("W/"):
+            compressed = self.middleware.cache.compress(etag, body, self.coding)
+        else:
+            compressed = compress(body, self.coding)
+        self._headers(len(compressed))
+        await self._send(self.start)
+        await self._send({"type": "http.response.body", "body": compressed})
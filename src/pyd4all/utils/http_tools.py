@@ -0,0 +1,300 @@
+"""Shared outbound HTTP client with a response cache and request coalescing."""
+
+import asyncio
+import time
+from collections import OrderedDict
+from collections.abc import AsyncIterator, Callable
+from dataclasses import asdict, dataclass
+from functools import partial
+
+import httpx
+
+# statuses a cache may store when the response gives explicit freshness, RFC 9111 §3
+CACHEABLE_STATUS = frozenset({200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501})
+
+
+def parse_cache_control(value: str | None) -> dict[str, str | None]:
+    """Directives of a `Cache-Control` header, lower-cased, with their argument if they have one.
+
+    >>> parse_cache_control('public, max-age=60, stale-while-revalidate="30"')
+    {'public': None, 'max-age': '60', 'stale-while-revalidate': '30'}
+    """
+    directives: dict[str, str | None] = {}
+    for part in (value or "").split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') if argument else None
+    return directives
+
+
+def _seconds(value: str | None) -> float:
+    try:
+        return max(float(value), 0.0) if value is not None else 0.0
+    except ValueError:
+        return 0.0
+
+
+@dataclass
+class HttpMetrics:
+    """Counters of a `CachingTransport`; every GET that may be cached is a hit, a stale hit or a miss."""
+
+    hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    revalidated: int = 0
+    coalesced: int = 0
+    bypassed: int = 0
+    streamed: int = 0
+    pool_waits: int = 0
+    pool_wait_seconds: float = 0.0
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.stale_hits + self.misses
+        return (self.hits + self.stale_hits) / lookups if lookups else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        return {**asdict(self), "hit_ratio": self.hit_ratio}
+
+
+@dataclass
+class _Stored:
+    status_code: int
+    headers: httpx.Headers
+    body: bytes
+    stored_at: float = 0.0
+    fresh_for: float = 0.0
+    stale_for: float = 0.0
+    vary: tuple[tuple[str, str | None], ...] = ()
+
+    def matches(self, request: httpx.Request) -> bool:
+        return all(request.headers.get(name) == value for name, value in self.vary)
+
+    def response(self, request: httpx.Request, now: float | None = None) -> httpx.Response:
+        headers = self.headers.copy()
+        if now is not None:
+            headers["Age"] = str(int(now - self.stored_at))
+        return httpx.Response(
+            self.status_code, headers=headers, stream=httpx.ByteStream(self.body), request=request
+        )
+
+
+class _Prefixed(httpx.AsyncByteStream):
+    """The chunks already read from a response, then the rest of its raw stream."""
+
+    def __init__(self, chunks: list[bytes], rest: AsyncIterator[bytes], response: httpx.Response) -> None:
+        self._chunks = chunks
+        self._rest = rest
+        self._response = response
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        for chunk in self._chunks:
+            yield chunk
+        async for chunk in self._rest:
+            yield chunk
+
+    async def aclose(self) -> None:
+        await self._response.aclose()
+
+
+class CachingTransport(httpx.AsyncBaseTransport):
+    """Transport that caches GET responses as `Cache-Control` allows and coalesces identical GETs.
+
+    The cache is shared by everyone using the client, so it behaves as a
+    shared cache: `private` and `no-store` responses and requests carrying
+    `Authorization` or `Cookie` headers go straight to the network. Stale
+    responses inside their `stale-while-revalidate` window are served while a
+    single background request refreshes them, and expired responses with an
+    `ETag` or `Last-Modified` are revalidated with a conditional request.
+    Only responses that may be cached and are at most `max_body` bytes are
+    read into memory; any other response is streamed to the caller.
+    At most `max_per_host` requests run against one host at a time, and the
+    time spent waiting for a slot is counted in `metrics`.
+    """
+
+    def __init__(
+        self,
+        transport: httpx.AsyncBaseTransport | None = None,
+        *,
+        maxsize: int = 512,
+        max_body: int = 1 << 20,
+        max_per_host: int = 20,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._transport = transport or httpx.AsyncHTTPTransport(
+            http2=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=40, keepalive_expiry=30),
+            retries=1,
+        )
+        self.maxsize = maxsize
+        self.max_body = max_body
+        self.max_per_host = max_per_host
+        self.clock = clock
+        self.metrics = HttpMetrics()
+        self._entries: OrderedDict[str, _Stored] = OrderedDict()
+        self._in_flight: dict[tuple, asyncio.Task[_Stored | httpx.Response]] = {}
+        self._host_slots: dict[str, asyncio.Semaphore] = {}
+        self._background: set[asyncio.Task] = set()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "GET" or "authorization" in request.headers or "cookie" in request.headers:
+            self.metrics.bypassed += 1
+            return await self._send(request)
+        key = str(request.url)
+        entry = self._entries.get(key)
+        now = self.clock()
+        if entry is not None and entry.matches(request) and "no-cache" not in parse_cache_control(
+            request.headers.get("cache-control")
+        ):
+            age = now - entry.stored_at
+            if age < entry.fresh_for:
+                self.metrics.hits += 1
+                self._entries.move_to_end(key)
+                return entry.response(request, now)
+            if age < entry.fresh_for + entry.stale_for:
+                self.metrics.stale_hits += 1
+                task = asyncio.create_task(self._refresh(request, entry))
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+                return entry.response(request, now)
+        self.metrics.misses += 1
+        return await self._coalesced(request, entry if entry is not None and entry.matches(request) else None)
+
+    async def aclose(self) -> None:
+        for task in self._background:
+            task.cancel()
+        await self._transport.aclose()
+
+    async def _refresh(self, request: httpx.Request, stale: _Stored) -> None:
+        try:
+            response = await self._coalesced(request, stale)
+            await response.aclose()
+        except httpx.HTTPError:
+            pass  # the stale copy is served until its window closes, then fetched again
+
+    async def _coalesced(self, request: httpx.Request, stale: _Stored | None) -> httpx.Response:
+        """Fetch `request`, sharing one network round trip between identical concurrent GETs.
+
+        The fetch runs in its own task, so a caller that is cancelled does not
+        cancel it for the others.
+        """
+        key = (str(request.url), tuple(request.headers.multi_items()))
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.metrics.coalesced += 1
+            result = await asyncio.shield(task)
+            if isinstance(result, _Stored):
+                return result.response(request)
+            # the response was too large or not cacheable, and streams to the caller that sent it
+            return await self._send(request)
+        task = asyncio.create_task(self._fetch(request, stale))
+        self._in_flight[key] = task
+        task.add_done_callback(partial(self._fetched, key))
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            task.add_done_callback(self._close_unread)
+            raise
+        return result.response(request) if isinstance(result, _Stored) else result
+
+    def _fetched(self, key: tuple, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # the waiters see the error, this marks it retrieved when there are none
+            task.exception()
+
+    def _close_unread(self, task: asyncio.Task) -> None:
+        # a streamed response whose caller was cancelled before it got it
+        if not task.cancelled() and task.exception() is None and isinstance(task.result(), httpx.Response):
+            closing = asyncio.create_task(task.result().aclose())
+            self._background.add(closing)
+            closing.add_done_callback(self._background.discard)
+
+    async def _fetch(self, request: httpx.Request, stale: _Stored | None) -> _Stored | httpx.Response:
+        headers = request.headers.copy()
+        if stale is not None:
+            if etag := stale.headers.get("etag"):
+                headers["If-None-Match"] = etag
+            if last_modified := stale.headers.get("last-modified"):
+                headers["If-Modified-Since"] = last_modified
+        response = await self._send(httpx.Request("GET", request.url, headers=headers, extensions=request.extensions))
+        now = self.clock()
+        if response.status_code == httpx.codes.NOT_MODIFIED and stale is not None:
+            await response.aclose()
+            self.metrics.revalidated += 1
+            stale.headers.update({k: v for k, v in response.headers.items() if k != "content-length"})
+            self._store(str(request.url), request, stale, now)
+            return stale
+        length = response.headers.get("content-length", "")
+        if not self._cacheable(response.status_code, response.headers) or (
+            length.isdigit() and int(length) > self.max_body
+        ):
+            return self._streamed(str(request.url), response)
+        chunks, size = [], 0
+        raw = response.aiter_raw()
+        try:
+            async for chunk in raw:
+                chunks.append(chunk)
+                size += len(chunk)
+                if size > self.max_body:
+                    prefixed = _Prefixed(chunks, raw, response)
+                    return self._streamed(
+                        str(request.url),
+                        httpx.Response(response.status_code, headers=response.headers, stream=prefixed),
+                    )
+        except BaseException:
+            await response.aclose()
+            raise
+        await response.aclose()
+        stored = _Stored(response.status_code, response.headers, b"".join(chunks))
+        self._store(str(request.url), request, stored, now)
+        return stored
+
+    def _streamed(self, key: str, response: httpx.Response) -> httpx.Response:
+        self.metrics.streamed += 1
+        self._entries.pop(key, None)
+        return response
+
+    @staticmethod
+    def _cacheable(status_code: int, headers: httpx.Headers) -> bool:
+        """Whether a shared cache may store a response with this status and headers."""
+        directives = parse_cache_control(headers.get("cache-control"))
+        validator = "etag" in headers or "last-modified" in headers
+        max_age = directives.get("s-maxage", directives.get("max-age"))
+        return not (
+            status_code not in CACHEABLE_STATUS
+            or "no-store" in directives
+            or "private" in directives
+            or headers.get("vary", "").strip() == "*"
+            or (max_age is None and not ("no-cache" in directives and validator))
+        )
+
+    def _store(self, key: str, request: httpx.Request, stored: _Stored, now: float) -> None:
+        if not self._cacheable(stored.status_code, stored.headers) or len(stored.body) > self.max_body:
+            self._entries.pop(key, None)
+            return
+        directives = parse_cache_control(stored.headers.get("cache-control"))
+        vary = stored.headers.get("vary", "")
+        max_age = directives.get("s-maxage", directives.get("max-age"))
+        stored.stored_at = now
+        age = _seconds(stored.headers.get("age"))
+        stored.fresh_for = 0.0 if "no-cache" in directives else max(_seconds(max_age) - age, 0.0)
+        revalidate = "must-revalidate" in directives or "proxy-revalidate" in directives
+        stored.stale_for = 0.0 if revalidate else _seconds(directives.get("stale-while-revalidate"))
+        names = [name.strip().lower() for name in vary.split(",") if name.strip()]
+        stored.vary = tuple((name, request.headers.get(name)) for name in names)
+        self._entries[key] = stored
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def _send(self, request: httpx.Request) -> httpx.Response:
+        slots = self._host_slots.setdefault(request.url.netloc.decode(), asyncio.Semaphore(self.max_per_host))
+        if slots.locked():
+            self.metrics.pool_waits += 1
+        start = time.perf_counter()
+        async with slots:
+            self.metrics.pool_wait_seconds += time.perf_counter() - start
+            return await self._transport.handle_async_request(request)
+
@@ -0,0 +1,337 @@
+"""In-process background jobs with bounded workers, retries and SQLite persistence."""
+
+import asyncio
+import contextlib
+import inspect
+import json
+import logging
+import os
+import queue
+import secrets
+import sqlite3
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, Literal
+
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+JobStatus = Literal["queued", "running", "done", "failed"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    task TEXT NOT NULL,
+    args TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    error TEXT,
+    result TEXT,
+    locked_by TEXT,
+    locked_until REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, run_at);
+"""
+# added after the first release of the schema, to databases that predate them
+LEASE_COLUMNS = {"locked_by": "TEXT", "locked_until": "REAL"}
+
+
+class Job(BaseModel):
+    id: int
+    task: str
+    status: JobStatus
+    attempts: int
+    max_attempts: int
+    created_at: datetime
+    updated_at: datetime
+    error: str | None = None
+    result: Any = None
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Job":
+        return cls(
+            id=row["id"],
+            task=row["task"],
+            status=row["status"],
+            attempts=row["attempts"],
+            max_attempts=row["max_attempts"],
+            created_at=datetime.fromtimestamp(row["created_at"], UTC),
+            updated_at=datetime.fromtimestamp(row["updated_at"], UTC),
+            error=row["error"],
+            result=json.loads(row["result"]) if row["result"] is not None else None,
+        )
+
+
+def _resolve(future: asyncio.Future, rows: list[sqlite3.Row] | None, exc: Exception | None) -> None:
+    if future.cancelled():
+        return
+    if exc is not None:
+        future.set_exception(exc)
+    else:
+        future.set_result(rows)
+
+
+@dataclass
+class _Task:
+    fn: Callable[..., Any]
+    max_attempts: int
+    backoff: float
+
+
+class JobQueue:
+    """Jobs stored in SQLite and run by at most `workers` tasks of the running event loop.
+
+    Register job functions with `task`, async or sync (sync ones run in a
+    thread), and `enqueue` calls to them with JSON-serializable arguments. A
+    job that raises is retried after `backoff * 2 ** (attempt - 1)` seconds
+    until it has been tried `max_attempts` times. Jobs survive restarts:
+    queued ones are picked up again. A running job holds a lease on its row
+    for `lease` seconds, renewed while it runs, so one left running by a
+    crashed process is run again once its lease expires, while the jobs of
+    other processes sharing the database are left to them.
+
+    The SQLite connection lives in one thread, so the event loop never waits
+    on the disk. That thread runs every statement waiting for it in a single
+    transaction, so concurrent enqueues and workers share one commit.
+    """
+
+    def __init__(self, path: str | Path, poll_interval: float = 1.0, lease: float = 30.0) -> None:
+        self.path = str(path)
+        self.poll_interval = poll_interval
+        self.lease = lease
+        # unique per queue, as several can share a database, even in one process
+        self.owner = f"{os.getpid()}-{secrets.token_hex(4)}"
+        self.tasks: dict[str, _Task] = {}
+        self._statements: queue.SimpleQueue[tuple[str, tuple, asyncio.Future] | None] = queue.SimpleQueue()
+        self._db_thread: threading.Thread | None = None
+        self._ready = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._workers: list[asyncio.Task] = []
+        self._renewing: asyncio.Task | None = None
+        # ids of the jobs the workers are running, only their leases are renewed
+        self._running: set[int] = set()
+        self._stopping = False
+
+    def task(
+        self, name: str | None = None, *, max_attempts: int = 3, backoff: float = 1.0
+    ) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+        """Register a job function under `name`, by default its qualified name."""
+
+        def register(fn: Callable[..., Any]) -> Callable[..., Any]:
+            fn.job_name = name or f"{fn.__module__}.{fn.__qualname__}"
+            self.tasks[fn.job_name] = _Task(fn, max_attempts, backoff)
+            return fn
+
+        return register
+
+    def _serve(self) -> None:
+        db = sqlite3.connect(self.path)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        # commits survive a crash of the process, only a power loss can drop the last ones
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(SCHEMA)
+        columns = {row["name"] for row in db.execute("PRAGMA table_info(jobs)")}
+        for name, kind in LEASE_COLUMNS.items():
+            if name not in columns:
+                db.execute(f"ALTER TABLE jobs ADD COLUMN {name} {kind}")
+        stopping = False
+        while not stopping:
+            batch = [self._statements.get()]
+            while not self._statements.empty():
+                batch.append(self._statements.get_nowait())
+            done = []
+            with db:
+                for statement in batch:
+                    if statement is None:
+                        stopping = True
+                        continue
+                    sql, parameters, future = statement
+                    try:
+                        done.append((future, db.execute(sql, parameters).fetchall(), None))
+                    except Exception as exc:
+                        # any error, such as an integer too large for SQLite, goes to its caller;
+                        # raised here it would end this thread and leave later statements waiting
+                        done.append((future, None, exc))
+            # answered after the commit, so a caller never sees a change that could still be lost
+            for future, rows, exc in done:
+                future.get_loop().call_soon_threadsafe(_resolve, future, rows, exc)
+        db.close()
+
+    async def _execute(self, sql: str, parameters: tuple = ()) -> list[sqlite3.Row]:
+        if self._db_thread is None:
+            self._db_thread = threading.Thread(target=self._serve, name="jobs-db", daemon=True)
+            self._db_thread.start()
+        future = asyncio.get_running_loop().create_future()
+        self._statements.put((sql, parameters, future))
+        return await future
+
+    async def enqueue(self, task: str | Callable[..., Any], *args: Any, **kwargs: Any) -> Job:
+        name = task if isinstance(task, str) else task.job_name
+        if name not in self.tasks:
+            raise KeyError(f"Unknown task {name!r}")
+        now = time.time()
+        [row] = await self._execute(
+            "INSERT INTO jobs (task, args, max_attempts, run_at, created_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?) RETURNING *",
+            (name, json.dumps([args, kwargs]), self.tasks[name].max_attempts, now, now, now),
+        )
+        self._idle.clear()
+        self._ready.set()
+        return Job.from_row(row)
+
+    async def get(self, job_id: int) -> Job | None:
+        rows = await self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        return Job.from_row(rows[0]) if rows else None
+
+    async def recent(self, limit: int = 50) -> list[Job]:
+        rows = await self._execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,))
+        return [Job.from_row(row) for row in rows]
+
+    async def counts(self) -> dict[str, int]:
+        rows = await self._execute("SELECT status, count(*) FROM jobs GROUP BY status")
+        return dict(rows)
+
+    async def start(self, workers: int = 4) -> None:
+        """Start the workers, and the task renewing the leases of the jobs they run."""
+        self._stopping = False
+        # created here, as an event belongs to the loop that first waits on it
+        self._ready = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._workers = [asyncio.create_task(self._work(), name=f"job-worker-{i}") for i in range(workers)]
+        self._renewing = asyncio.create_task(self._renew_leases(), name="job-leases")
+
+    async def stop(self) -> None:
+        """Let the workers finish the jobs they are running, then close the database.
+
+        Bound the wait with `asyncio.timeout`; the jobs still running when it
+        runs out are cancelled and queued again.
+        """
+        self._stopping = True
+        self._ready.set()
+        tasks = self._workers + ([self._renewing] if self._renewing is not None else [])
+        try:
+            if self._workers:
+                await asyncio.wait(self._workers)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._workers, self._renewing = [], None
+            if self._db_thread is not None:
+                await self._execute(
+                    "UPDATE jobs SET status = 'queued', locked_by = NULL, locked_until = NULL"
+                    " WHERE status = 'running' AND locked_by = ?",
+                    (self.owner,),
+                )
+                self._statements.put(None)
+                await asyncio.to_thread(self._db_thread.join)
+                self._db_thread = None
+
+    async def join(self) -> None:
+        """Wait until the workers run no job and find none queued or to take over."""
+        await self._idle.wait()
+
+    async def _claim(self) -> sqlite3.Row | None:
+        now = time.time()
+        # a running job whose lease expired was left by a process that is gone, or is stuck
+        rows = await self._execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = ?,"
+            " locked_by = ?, locked_until = ?"
+            " WHERE id = (SELECT id FROM jobs WHERE (status = 'queued' AND run_at <= ?)"
+            " OR (status = 'running' AND coalesce(locked_until, 0) < ?) ORDER BY run_at, id LIMIT 1)"
+            " RETURNING *",
+            (now, self.owner, now + self.lease, now, now),
+        )
+        return rows[0] if rows else None
+
+    async def _renew_leases(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if not self._running:
+                continue
+            ids = list(self._running)
+            try:
+                await self._execute(
+                    "UPDATE jobs SET locked_until = ? WHERE status = 'running' AND locked_by = ?"
+                    f" AND id IN ({', '.join('?' * len(ids))})",
+                    (time.time() + self.lease, self.owner, *ids),
+                )
+            except Exception:
+                logger.exception("Renewing the job leases of %s failed", self.owner)
+
+    async def _idle_wait(self) -> None:
+        # a job of this queue whose worker failed to record it is run again when its lease expires
+        [(next_run,)] = await self._execute(
+            "SELECT min(CASE status WHEN 'queued' THEN run_at ELSE locked_until END) FROM jobs"
+            " WHERE status = 'queued' OR (status = 'running' AND locked_by = ?)",
+            (self.owner,),
+        )
+        if next_run is None and not self._running:
+            self._idle.set()
+        timeout = self.poll_interval if next_run is None else min(max(next_run - time.time(), 0), self.poll_interval)
+        with contextlib.suppress(TimeoutError):
+            await asyncio.wait_for(self._ready.wait(), timeout)
+
+    async def _work(self) -> None:
+        while not self._stopping:
+            try:
+                await self._work_once()
+            except Exception:
+                # the worker carries on; a job it could not finish is taken over once its lease expires
+                logger.exception("Job worker of %s failed", self.owner)
+                await asyncio.sleep(self.poll_interval)
+
+    async def _work_once(self) -> None:
+        # cleared before looking, so an enqueue after the look still wakes this worker
+        self._ready.clear()
+        row = await self._claim()
+        if row is None:
+            await self._idle_wait()
+            return
+        self._running.add(row["id"])
+        self._idle.clear()
+        try:
+            await self._run(row)
+        finally:
+            self._running.discard(row["id"])
+
+    async def _run(self, row: sqlite3.Row) -> None:
+        task = self.tasks.get(row["task"])
+        try:
+            if task is None:
+                raise LookupError(f"Unknown task {row['task']!r}")
+            args, kwargs = json.loads(row["args"])
+            if inspect.iscoroutinefunction(task.fn):
+                result = await task.fn(*args, **kwargs)
+            else:
+                result = await asyncio.to_thread(task.fn, *args, **kwargs)
+        except Exception as exc:
+            now = time.time()
+            error = f"{type(exc).__name__}: {exc}"
+            if task is not None and row["attempts"] < row["max_attempts"]:
+                retry_at = now + task.backoff * 2 ** (row["attempts"] - 1)
+                await self._finish(row, "queued", run_at=retry_at, updated_at=now, error=error)
+            else:
+                await self._finish(row, "failed", updated_at=now, error=error)
+        else:
+            result = json.dumps(result, default=str)
+            await self._finish(row, "done", updated_at=time.time(), error=None, result=result)
+
+    async def _finish(self, row: sqlite3.Row, status: JobStatus, **columns: Any) -> None:
+        # only while this queue holds the lease, a job another queue took over is theirs to finish
+        assignments = "".join(f", {name} = ?" for name in columns)
+        await self._execute(
+            f"UPDATE jobs SET status = ?, locked_by = NULL, locked_until = NULL{assignments}"
+            " WHERE id = ? AND locked_by = ?",
+            (status, *columns.values(), row["id"], self.owner),
+        )
@@ -0,0 +1,274 @@
+"""Serialized FastUI responses and precompressed static bodies, with ETag support."""
+
+import gzip
+import hashlib
+import inspect
+import threading
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterable
+from dataclasses import dataclass
+from functools import lru_cache, wraps
+from typing import Any
+
+import brotli
+from fastapi import Request, Response
+from fastui import AnyComponent
+from fastui import components as c
+
+# component instances serialized once by `prebuilt`, by id; the instance is kept so its id stays unique
+_prebuilt: dict[int, tuple[AnyComponent, bytes]] = {}
+
+
+def prebuilt(component: AnyComponent) -> AnyComponent:
+    """Serialize an invariant component once; `fastui_json` splices these bytes wherever the instance is used.
+
+    The component is shared by every response it appears in, so it must not be modified.
+    """
+    _prebuilt[id(component)] = (component, component.model_dump_json(by_alias=True, exclude_none=True).encode())
+    return component
+
+
+def component_json(component: AnyComponent) -> bytes:
+    if (entry := _prebuilt.get(id(component))) is not None:
+        return entry[1]
+    if isinstance(component, c.Page):
+        # pages wrap the per-request body, so their children are spliced into the page's own
+        # JSON in place of an empty list; an escaped string value cannot contain the placeholder
+        shell = component.model_copy(update={"components": []})
+        return shell.model_dump_json(by_alias=True, exclude_none=True).encode().replace(
+            b'"components":[]', b'"components":' + fastui_json(component.components), 1
+        )
+    return component.model_dump_json(by_alias=True, exclude_none=True).encode()
+
+
+def fastui_json(components: list[AnyComponent]) -> bytes:
+    """Serialize components exactly as a `response_model=FastUI, response_model_exclude_none=True` route does."""
+    return b"[" + b",".join([component_json(component) for component in components]) + b"]"
+
+
+def route_signature(fn: Callable[..., Any]) -> inspect.Signature:
+    """The signature of `fn` with its annotations evaluated.
+
+    FastAPI resolves string annotations in the globals of the endpoint it is
+    given, which for a wrapper are not those of the module defining `fn`.
+    """
+    return inspect.signature(fn, eval_str=True)
+
+
+class FastUIResponse(Response):
+    """Response rendering a list of FastUI components to JSON with `fastui_json`."""
+
+    media_type = "application/json"
+
+    def render(self, content: list[AnyComponent]) -> bytes:
+        return fastui_json(content)
+
+
+def fastui_response(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Return the components of a FastUI route as a `FastUIResponse`.
+
+    The handler builds its components from the FastUI models, so validating
+    them again against `response_model=FastUI` only repeats that work. The
+    wrapper returns a `Response`, which FastAPI sends as is; keep
+    `response_model=FastUI` on the route for the OpenAPI schema.
+    """
+    if inspect.iscoroutinefunction(fn):
+
+        @wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> Response:
+            return FastUIResponse(await fn(*args, **kwargs))
+
+    else:
+
+        @wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Response:
+            return FastUIResponse(fn(*args, **kwargs))
+
+    wrapper.__signature__ = route_signature(fn)
+    return wrapper
+
+
+def strong_etag(body: bytes) -> str:
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Whether an `If-None-Match` header matches `etag`, using weak comparison as RFC 9110 asks."""
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+@dataclass(frozen=True)
+class CachedBody:
+    body: bytes
+    etag: str
+
+
+# content codings `Precompressed` produces, most preferred first
+CODINGS = ("br", "gzip")
+
+
+def negotiate_encoding(accept_encoding: str | None, available: Iterable[str]) -> str:
+    """The preferred coding of `available` that `accept_encoding` allows, else `"identity"`.
+
+    >>> negotiate_encoding("gzip, br;q=0.5", ["br", "gzip"])
+    'gzip'
+    >>> negotiate_encoding("br;q=0, *", ["br"])
+    'identity'
+    """
+    qualities: dict[str, float] = {}
+    for part in (accept_encoding or "").split(","):
+        coding, *params = [item.strip() for item in part.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding:
+            qualities[coding.lower()] = q
+    best, best_q = "identity", 0.0
+    for coding in available:
+        q = qualities.get(coding, qualities.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+# browsers send a handful of distinct Accept-Encoding values, so parsing each once is enough
+_negotiate = lru_cache(maxsize=256)(negotiate_encoding)
+
+
+class Precompressed:
+    """A static body compressed once with every coding in `CODINGS`, served by content negotiation.
+
+    Each coding is a separate representation, so each gets its own strong
+    ETag, and a client holding the one it would be sent gets a 304.
+    """
+
+    def __init__(self, body: bytes, media_type: str, cache_control: str = "no-cache") -> None:
+        self.media_type = media_type
+        self.cache_control = cache_control
+        etag = strong_etag(body)
+        self.variants = {"identity": CachedBody(body, etag)}
+        for coding, compressed in (
+            ("br", brotli.compress(body, quality=11)),
+            # mtime=0 keeps the bytes, and so the ETag, the same across restarts
+            ("gzip", gzip.compress(body, compresslevel=9, mtime=0)),
+        ):
+            if len(compressed) < len(body):
+                self.variants[coding] = CachedBody(compressed, f'{etag[:-1]}-{coding}"')
+        self._available = tuple(coding for coding in CODINGS if coding in self.variants)
+        self._headers = {
+            coding: {"ETag": entry.etag, "Vary": "Accept-Encoding", "Cache-Control": cache_control}
+            | ({"Content-Encoding": coding} if coding != "identity" else {})
+            for coding, entry in self.variants.items()
+        }
+
+    def respond(self, request: Request) -> Response:
+        coding = _negotiate(request.headers.get("accept-encoding"), self._available)
+        entry = self.variants[coding]
+        if etag_matches(request.headers.get("if-none-match"), entry.etag):
+            return Response(status_code=304, headers=self._headers[coding])
+        return Response(entry.body, media_type=self.media_type, headers=self._headers[coding])
+
+
+class ResponseCache:
+    """LRU cache of fully serialized response bodies, each with a strong ETag.
+
+    A repeated request costs a dictionary lookup, or a body-less 304 when the
+    client already holds the same ETag.
+    """
+
+    def __init__(self, maxsize: int = 256, media_type: str = "application/json") -> None:
+        self.maxsize = maxsize
+        self.media_type = media_type
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Hashable, CachedBody] = OrderedDict()
+        # sync routes run on the thread pool, so entries are shared between threads
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_ratio(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def lookup(self, key: Hashable) -> CachedBody | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return entry
+
+    def store(self, key: Hashable, body: bytes) -> CachedBody:
+        entry = CachedBody(body, strong_etag(body))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def respond(self, request: Request, entry: CachedBody) -> Response:
+        headers = {"ETag": entry.etag}
+        if etag_matches(request.headers.get("if-none-match"), entry.etag):
+            return Response(status_code=304, headers=headers)
+        return Response(entry.body, media_type=self.media_type, headers=headers)
+
+    def fastui(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        """Cache a FastUI route, keyed by the route and every argument it is called with.
+
+        Keep `response_model=FastUI` on the route for the OpenAPI schema. The
+        wrapper returns a `Response`, so FastAPI does not validate it again.
+        """
+        signature = route_signature(fn)
+        wants_request = "request" in signature.parameters
+
+        def key_of(args: tuple, kwargs: dict) -> Hashable:
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            return fn.__qualname__, *((k, v) for k, v in bound.arguments.items() if k != "request")
+
+        if inspect.iscoroutinefunction(fn):
+
+            @wraps(fn)
+            async def wrapper(*args: Any, request: Request, **kwargs: Any) -> Response:
+                if wants_request:
+                    kwargs["request"] = request
+                key = key_of(args, kwargs)
+                entry = self.lookup(key)
+                if entry is None:
+                    entry = self.store(key, fastui_json(await fn(*args, **kwargs)))
+                return self.respond(request, entry)
+
+        else:
+
+            @wraps(fn)
+            def wrapper(*args: Any, request: Request, **kwargs: Any) -> Response:
+                if wants_request:
+                    kwargs["request"] = request
+                key = key_of(args, kwargs)
+                entry = self.lookup(key)
+                if entry is None:
+                    entry = self.store(key, fastui_json(fn(*args, **kwargs)))
+                return self.respond(request, entry)
+
+        parameters = [p for p in signature.parameters.values() if p.name != "request"]
+        request_parameter = inspect.Parameter("request", inspect.Parameter.KEYWORD_ONLY, annotation=Request)
+        wrapper.__signature__ = signature.replace(parameters=[*parameters, request_parameter])
+        return wrapper
@@ -171,17 +171,25 @@ def main():
     """
     app = FastAPI()
 
+    from pyd4all.utils.compression_tools import CompressionMiddleware
+
+    app.add_middleware(CompressionMiddleware)
+
     # Load routes dynamically from the filesystem
     load_filesystem_routes(app, "fastapi", config_path="watcher_config.yaml")
 
     from fastui import FastUI, AnyComponent, prebuilt_html, components as c
 
-    from fastapi.responses import HTMLResponse
+    from fastapi import Request, Response
+
+    from pyd4all.utils.response_tools import Precompressed
+
+    landing_html = Precompressed(prebuilt_html(title='FastUI Demo').encode(), 'text/html')
 
     @app.get('/{path:path}')
-    async def html_landing() -> HTMLResponse:
+    async def html_landing(request: Request) -> Response:
         """Simple HTML page which serves the React app, comes last as it matches all paths."""
-        return HTMLResponse(prebuilt_html(title='FastUI Demo'))
+        return landing_html.respond(request)
     # Print all registered routes
     print_registered_routes(app)
 
@@ -0,0 +1,239 @@
+"""Fan-out of server-sent events from one producer to many subscribers."""
+
+import asyncio
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Callable
+from dataclasses import dataclass
+from typing import Literal
+
+# an SSE comment line, ignored by EventSource but it keeps proxies from closing idle connections
+HEARTBEAT = b": ping\n\n"
+
+
+@dataclass
+class HubStats:
+    published: int = 0
+    delivered: int = 0
+    skipped: int = 0
+    dropped: int = 0
+    heartbeats: int = 0
+
+
+class Subscriber:
+    """One client of a `BroadcastHub`, holding at most `maxsize` encoded events."""
+
+    def __init__(self, maxsize: int, backlog: list[bytes] | None = None) -> None:
+        self.queue: asyncio.Queue[bytes | None] = asyncio.Queue(maxsize)
+        # replayed or snapshot events sent before anything from the queue
+        self.backlog = backlog or []
+        self.skipped = 0
+        self.closed = False
+
+    def _clear(self) -> None:
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+
+class BroadcastHub:
+    """Send each event, encoded once by the producer, to every subscriber.
+
+    `publish` never waits for a subscriber. When a subscriber's queue is full
+    it is either dropped, or with `on_overflow='skip'` its backlog is
+    replaced by a snapshot of the current state, so it skips ahead instead of
+    replaying events it is too slow to use. A snapshot is also the first
+    event a new subscriber receives. When nothing was published for
+    `heartbeat` seconds a comment line is sent to every subscriber.
+
+    With `replay_bytes` set, events get an `id: <stream_id>-<n>` line and the
+    most recent events, up to that many bytes, are kept, so a client
+    reconnecting with `Last-Event-ID` is sent only what it missed.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 32,
+        on_overflow: Literal["skip", "drop"] = "skip",
+        heartbeat: float = 15.0,
+        replay_bytes: int = 0,
+        stream_id: str = "",
+    ) -> None:
+        self.maxsize = maxsize
+        self.on_overflow = on_overflow
+        self.heartbeat = heartbeat
+        self.stream_id = stream_id
+        self.replay_bytes = replay_bytes
+        self.subscribers: set[Subscriber] = set()
+        self.stats = HubStats()
+        self.closed = False
+        self._seq = 0
+        self._ring: deque[tuple[int, bytes]] | None = deque() if replay_bytes else None
+        self._ring_bytes = 0
+        # when the last subscriber left, `None` while there are subscribers
+        self._idle_since: float | None = time.monotonic()
+        self._snapshot: Callable[[], bytes] | None = None
+        self._last_publish = time.monotonic()
+        self._task: asyncio.Task | None = None
+
+    @property
+    def finished(self) -> bool:
+        """Whether the producer ran and has returned."""
+        return self._task is not None and self._task.done()
+
+    @property
+    def idle_seconds(self) -> float:
+        """How long the hub has been without subscribers, 0 while it has some."""
+        return 0.0 if self._idle_since is None else time.monotonic() - self._idle_since
+
+    def _event_id(self, seq: int) -> str:
+        return f"{self.stream_id}-{seq}"
+
+    def _replay_after(self, last_event_id: str | None) -> list[bytes] | None:
+        """Events after `last_event_id`, or `None` when it is not from this stream or no longer kept."""
+        if self._ring is None or not last_event_id:
+            return None
+        stream_id, _, seq = last_event_id.rpartition("-")
+        if stream_id != self.stream_id or not seq.isdigit():
+            return None
+        seq = int(seq)
+        if seq > self._seq or (self._ring and seq < self._ring[0][0] - 1):
+            return None
+        return [event for n, event in self._ring if n > seq]
+
+    def is_done_for(self, last_event_id: str | None) -> bool:
+        """Whether the stream is over and a client that saw `last_event_id` missed nothing."""
+        return self.closed and self._replay_after(last_event_id) == []
+
+    def subscribe(self, last_event_id: str | None = None) -> Subscriber:
+        backlog = self._replay_after(last_event_id)
+        if backlog is None:
+            backlog = [self._snapshot()] if self._snapshot is not None else []
+        subscriber = Subscriber(self.maxsize, backlog)
+        if self.closed:
+            subscriber.closed = True
+            subscriber.queue.put_nowait(None)
+        else:
+            self.subscribers.add(subscriber)
+            self._idle_since = None
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self.subscribers.discard(subscriber)
+        if not self.subscribers and self._idle_since is None:
+            self._idle_since = time.monotonic()
+
+    def publish(self, event: bytes, snapshot: bytes | Callable[[], bytes] | None = None) -> None:
+        """Queue `event` for every subscriber.
+
+        `snapshot` is the full state after `event`, or a function encoding it
+        that runs at most once, and only if a subscriber needs it. Leave it
+        out when `event` is itself a complete snapshot.
+        """
+        id_line = b""
+        if self._ring is not None:
+            self._seq += 1
+            # the snapshot carries the same id, it is the state right after this event
+            id_line = f"id: {self._event_id(self._seq)}\n".encode()
+            event = id_line + event
+            self._ring.append((self._seq, event))
+            self._ring_bytes += len(event)
+            # the latest event is kept however large it is
+            while self._ring_bytes > self.replay_bytes and len(self._ring) > 1:
+                self._ring_bytes -= len(self._ring.popleft()[1])
+        encoded: bytes | None = None
+
+        def current() -> bytes:
+            nonlocal encoded
+            if encoded is None:
+                encoded = event if snapshot is None else id_line + (snapshot() if callable(snapshot) else snapshot)
+            return encoded
+
+        self._snapshot = current
+        self._last_publish = time.monotonic()
+        self.stats.published += 1
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.queue.put_nowait(event)
+                self.stats.delivered += 1
+            except asyncio.QueueFull:
+                self._overflow(subscriber, current)
+
+    def _overflow(self, subscriber: Subscriber, current: Callable[[], bytes]) -> None:
+        subscriber._clear()
+        if self.on_overflow == "drop":
+            self.stats.dropped += 1
+            self.close(subscriber)
+        else:
+            self.stats.skipped += 1
+            subscriber.skipped += 1
+            subscriber.queue.put_nowait(current())
+
+    def close(self, subscriber: Subscriber | None = None) -> None:
+        """End the stream of one subscriber, or of all of them and of later ones until restarted."""
+        if subscriber is None:
+            self.closed = True
+        for sub in [subscriber] if subscriber is not None else list(self.subscribers):
+            sub.closed = True
+            self.unsubscribe(sub)
+            if sub.queue.full():
+                sub._clear()
+            sub.queue.put_nowait(None)
+
+    async def stream(self, subscriber: Subscriber) -> AsyncIterator[bytes]:
+        """The events of `subscriber` until it is closed, for a `StreamingResponse`."""
+        try:
+            for event in subscriber.backlog:
+                yield event
+            subscriber.backlog = []
+            while (event := await subscriber.queue.get()) is not None:
+                yield event
+        finally:
+            self.unsubscribe(subscriber)
+
+    async def listen(
+        self, last_event_id: str | None = None, producer: Callable[["BroadcastHub"], Awaitable[None]] | None = None
+    ) -> AsyncIterator[bytes]:
+        """Subscribe once the response starts sending, start `producer` if given, and stream the events.
+
+        A client gone before its response started is never subscribed, so it
+        cannot keep a producer going that runs while the hub has subscribers.
+        """
+        subscriber = self.subscribe(last_event_id)
+        try:
+            if producer is not None:
+                self.ensure_running(producer)
+            async for event in self.stream(subscriber):
+                yield event
+        finally:
+            self.unsubscribe(subscriber)
+
+    def ensure_running(self, producer: Callable[["BroadcastHub"], Awaitable[None]]) -> None:
+        """Start `producer(hub)` with the heartbeats unless they are already running."""
+        if self._task is None or self._task.done():
+            self.closed = False
+            self._task = asyncio.create_task(self._run(producer))
+
+    def stop(self) -> None:
+        """Cancel the producer and end every stream."""
+        if self._task is not None:
+            self._task.cancel()
+        self.close()
+
+    async def _run(self, producer: Callable[["BroadcastHub"], Awaitable[None]]) -> None:
+        heartbeats = asyncio.create_task(self._heartbeats())
+        try:
+            await producer(self)
+        finally:
+            heartbeats.cancel()
+
+    async def _heartbeats(self) -> None:
+        while True:
+            await asyncio.sleep(max(self._last_publish + self.heartbeat - time.monotonic(), 0))
+            if time.monotonic() - self._last_publish < self.heartbeat:
+                continue
+            self._last_publish = time.monotonic()
+            self.stats.heartbeats += 1
+            for subscriber in list(self.subscribers):
+                # a subscriber with a backlog is not idle, it does not need one
+                if subscriber.queue.empty():
+                    subscriber.queue.put_nowait(HEARTBEAT)
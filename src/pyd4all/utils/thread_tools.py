@@ -0,0 +1,155 @@
+"""Sizing and metrics of the thread pool sync handlers run in, with cheap handlers optionally run inline."""
+
+import inspect
+import math
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from functools import partial, wraps
+from typing import Any
+
+import anyio
+import anyio.to_thread
+from anyio import CapacityLimiter
+from anyio.lowlevel import RunVar
+from fastapi.routing import APIRoute
+
+from pyd4all.config import settings
+from pyd4all.utils.response_tools import route_signature
+
+_unlimited_limiter: RunVar[CapacityLimiter] = RunVar("_unlimited_limiter")
+
+
+def _unlimited() -> CapacityLimiter:
+    # threads for calls that already hold a token of the default limiter
+    try:
+        return _unlimited_limiter.get()
+    except LookupError:
+        limiter = CapacityLimiter(math.inf)
+        _unlimited_limiter.set(limiter)
+        return limiter
+
+
+def cheap(fn: Callable[..., Any]) -> Callable[..., Any]:
+    """Mark a sync handler as cheap enough to run on the event loop when inline handlers are enabled.
+
+    Only mark handlers that do no I/O and finish in well under a millisecond:
+    while one runs inline, no other request is served.
+    """
+    fn.run_inline = True
+    return fn
+
+
+@dataclass
+class ThreadPoolMetrics:
+    """Counters of the sync calls made through a `ThreadPool`.
+
+    A call's wait is the time from it being made to a thread starting it:
+    waiting for a free thread plus the hop to it.
+    """
+
+    offloaded: int = 0
+    inline: int = 0
+    saturated: int = 0
+    wait_seconds: float = 0.0
+    max_wait_seconds: float = 0.0
+    peak_busy: int = 0
+
+    @property
+    def mean_wait_seconds(self) -> float:
+        return self.wait_seconds / self.offloaded if self.offloaded else 0.0
+
+    def as_dict(self) -> dict[str, float]:
+        return {**asdict(self), "mean_wait_seconds": self.mean_wait_seconds}
+
+
+class ThreadPool:
+    """The threads of anyio's default limiter, which Starlette and FastAPI run sync code in, sized to `size`.
+
+    `wrap` turns a sync handler into an async one that runs it in a thread
+    and counts how long it waited for one, or, with `inline` on and the
+    handler marked `cheap`, calls it directly on the event loop.
+    """
+
+    def __init__(self, size: int = 40, inline: bool = False) -> None:
+        self.size = size
+        self.inline = inline
+        self.metrics = ThreadPoolMetrics()
+
+    def limiter(self) -> CapacityLimiter:
+        """The default thread limiter of the running event loop, sized to `size`."""
+        limiter = anyio.to_thread.current_default_thread_limiter()
+        if limiter.total_tokens != self.size:
+            limiter.total_tokens = self.size
+        return limiter
+
+    def stats(self) -> dict[str, float]:
+        """The metrics with the current occupancy; call it from the event loop."""
+        limiter = self.limiter()
+        statistics = limiter.statistics()
+        return {
+            **self.metrics.as_dict(),
+            "size": self.size,
+            "busy": statistics.borrowed_tokens,
+            "waiting": statistics.tasks_waiting,
+        }
+
+    async def run(self, fn: Callable[[], Any]) -> Any:
+        """Call `fn` in a thread once one is free, counting how long that took."""
+        limiter = self.limiter()
+        requested = time.perf_counter()
+        started = 0.0
+
+        def call() -> Any:
+            nonlocal started
+            started = time.perf_counter()
+            return fn()
+
+        # the token is taken here rather than by `run_sync`, to see whether the pool was full
+        try:
+            limiter.acquire_nowait()
+        except anyio.WouldBlock:
+            self.metrics.saturated += 1
+            await limiter.acquire()
+        try:
+            self.metrics.peak_busy = max(self.metrics.peak_busy, limiter.borrowed_tokens)
+            return await anyio.to_thread.run_sync(call, limiter=_unlimited())
+        finally:
+            limiter.release()
+            # recorded on the event loop, so the counters are never updated from two threads
+            if started:
+                wait = started - requested
+                self.metrics.offloaded += 1
+                self.metrics.wait_seconds += wait
+                self.metrics.max_wait_seconds = max(self.metrics.max_wait_seconds, wait)
+
+    def wrap(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        """An async version of the sync handler `fn`; async handlers are returned as they are."""
+        if inspect.iscoroutinefunction(fn) or inspect.isasyncgenfunction(fn) or inspect.isgeneratorfunction(fn):
+            return fn
+
+        if self.inline and getattr(fn, "run_inline", False):
+
+            @wraps(fn)
+            async def wrapper(*args: Any, **kwargs: Any) -> Any:
+                self.metrics.inline += 1
+                return fn(*args, **kwargs)
+
+        else:
+
+            @wraps(fn)
+            async def wrapper(*args: Any, **kwargs: Any) -> Any:
+                return await self.run(partial(fn, *args, **kwargs))
+
+        wrapper.__signature__ = route_signature(fn)
+        return wrapper
+
+
+thread_pool = ThreadPool(settings.thread_pool_size, inline=settings.inline_sync_handlers)
+
+
+class ThreadPoolRoute(APIRoute):
+    """Route running a sync endpoint through `thread_pool`; use it as the `route_class` of a router."""
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+        super().__init__(path, thread_pool.wrap(endpoint), **kwargs)
@@ -0,0 +1,247 @@
+"""Multipart uploads parsed as they stream in, with size limits enforced before anything is buffered."""
+
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+import typing
+from collections.abc import AsyncIterator, Mapping
+from dataclasses import dataclass
+from pathlib import Path
+
+import pydantic
+from fastapi import Depends, HTTPException, Request, UploadFile
+from fastapi.params import Depends as DependsParam
+from fastui.forms import FormFile, unflatten
+from starlette.datastructures import FormData, Headers
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+CHUNK_SIZE = 64 * 1024
+# leading bytes of the image formats browsers display
+IMAGE_SIGNATURES = {
+    b"\x89PNG\r\n\x1a\n": "png",
+    b"\xff\xd8\xff": "jpeg",
+    b"GIF87a": "gif",
+    b"GIF89a": "gif",
+    b"BM": "bmp",
+}
+
+
+class UploadTooLarge(MultiPartException):
+    """A file, or the whole body when `field` is `None`, is over its limit."""
+
+    def __init__(self, message: str, field: str | None = None) -> None:
+        super().__init__(message)
+        self.field = field
+
+
+def _form_files(annotation: typing.Any) -> list[FormFile]:
+    if typing.get_origin(annotation) is typing.Annotated:
+        inner, *metadata = typing.get_args(annotation)
+        return [m for m in metadata if isinstance(m, FormFile)] + _form_files(inner)
+    return [file for arg in typing.get_args(annotation) for file in _form_files(arg)]
+
+
+def file_limits(model: type[pydantic.BaseModel]) -> dict[str, int | None]:
+    """The `FormFile(max_size=...)` of every file field of `model`, by form field name."""
+    limits = {}
+    for name, field in model.model_fields.items():
+        files = [m for m in field.metadata if isinstance(m, FormFile)] + _form_files(field.annotation)
+        if files:
+            limits[field.alias or name] = files[0].max_size
+    return limits
+
+
+class LimitedMultiPartParser(MultiPartParser):
+    """Multipart parser that stops reading as soon as a file or the body is over its limit.
+
+    Files are written to unnamed temporary files on disk chunk by chunk, from
+    a thread, instead of being spooled in memory first. `file_limits` holds
+    the limit of each file field; fields without one get `max_file_size`.
+    """
+
+    def __init__(
+        self,
+        headers: Headers,
+        stream: AsyncIterator[bytes],
+        *,
+        file_limits: Mapping[str, int | None],
+        max_file_size: int | None,
+        max_body_size: int,
+        max_files: int,
+        max_fields: int,
+        upload_dir: Path | None = None,
+    ) -> None:
+        super().__init__(headers, self._limited(stream), max_files=max_files, max_fields=max_fields)
+        self.file_limits = file_limits
+        self.default_file_limit = max_file_size
+        self.max_body_size = max_body_size
+        self.upload_dir = upload_dir
+        self._current_size = 0
+
+    async def _limited(self, stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+        received = 0
+        async for chunk in stream:
+            received += len(chunk)
+            if received > self.max_body_size:
+                raise UploadTooLarge(f"Request body is larger than {self.max_body_size} bytes.")
+            yield chunk
+
+    def on_headers_finished(self) -> None:
+        super().on_headers_finished()
+        part = self._current_part
+        self._current_size = 0
+        if part.file is not None:
+            spooled = self._files_to_close_on_error.pop()
+            spooled.close()
+            # a real file, so `UploadFile` writes each chunk from the thread pool
+            part.file.file = tempfile.TemporaryFile(dir=self.upload_dir)
+            self._files_to_close_on_error.append(part.file.file)
+
+    def on_part_data(self, data: bytes, start: int, end: int) -> None:
+        part = self._current_part
+        if part.file is not None:
+            self._current_size += end - start
+            limit = self.file_limits.get(part.field_name)
+            if limit is None:
+                limit = self.default_file_limit
+            if limit is not None and self._current_size > limit:
+                raise UploadTooLarge(
+                    f'File "{part.file.filename}" is larger than the maximum of {limit} bytes.', part.field_name
+                )
+        super().on_part_data(data, start, end)
+
+
+def upload_form(
+    model: type[pydantic.BaseModel],
+    *,
+    max_body_size: int = 10 * 1024 * 1024,
+    max_file_size: int | None = 1024 * 1024,
+    max_files: int = 16,
+    max_fields: int = 100,
+    upload_dir: Path | None = None,
+) -> DependsParam:
+    """Like `fastui.forms.fastui_form`, with the upload limits enforced while the body is read.
+
+    A request whose `Content-Length` is already over `max_body_size` is
+    rejected with a 413 before any of it is read, and so is one whose body
+    turns out to be. A file over the `FormFile(max_size=...)` of its field,
+    or `max_file_size` when it has none, is a 422 form error on that field.
+    The uploaded files stay open until the response is sent.
+    """
+    limits = file_limits(model)
+
+    async def run_upload_form(request: Request) -> AsyncIterator[pydantic.BaseModel]:
+        content_length = request.headers.get("content-length", "")
+        if content_length.isdigit() and int(content_length) > max_body_size:
+            raise HTTPException(status_code=413, detail=f"Request body is larger than {max_body_size} bytes.")
+        form_data = FormData()
+        try:
+            if request.headers.get("content-type", "").startswith("multipart/form-data"):
+                parser = LimitedMultiPartParser(
+                    request.headers,
+                    request.stream(),
+                    file_limits=limits,
+                    max_file_size=max_file_size,
+                    max_body_size=max_body_size,
+                    max_files=max_files,
+                    max_fields=max_fields,
+                    upload_dir=upload_dir,
+                )
+                form_data = await parser.parse()
+            else:
+                form_data = await request.form(max_files=max_files, max_fields=max_fields)
+        except UploadTooLarge as exc:
+            if exc.field is None:
+                raise HTTPException(status_code=413, detail=exc.message) from exc
+            error = {"type": "file_too_big", "loc": [exc.field], "msg": exc.message}
+            raise HTTPException(status_code=422, detail={"form": [error]}) from exc
+        except MultiPartException as exc:
+            raise HTTPException(status_code=400, detail=exc.message) from exc
+        try:
+            try:
+                form = model.model_validate(unflatten(form_data))
+            except pydantic.ValidationError as e:
+                raise HTTPException(
+                    status_code=422,
+                    detail={"form": e.errors(include_input=False, include_url=False, include_context=False)},
+                ) from e
+            yield form
+        finally:
+            await form_data.close()
+
+    return Depends(run_upload_form)
+
+
+@dataclass
+class StoredUpload:
+    filename: str | None
+    path: Path
+    size: int
+    sha256: str
+    image_type: str | None
+
+
+def image_type(head: bytes) -> str | None:
+    """The image format `head`, the first bytes of a file, starts with.
+
+    >>> image_type(b"GIF89a..."), image_type(b"<svg")
+    ('gif', None)
+    """
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return next((kind for signature, kind in IMAGE_SIGNATURES.items() if head.startswith(signature)), None)
+
+
+def store_upload(upload: UploadFile, directory: Path) -> StoredUpload:
+    """Copy an upload into `directory` in chunks, named by the SHA-256 of its content.
+
+    The suffix is that of the sniffed image type, never one from the
+    client's file name, so a stored file cannot claim to be HTML or a script.
+
+    This blocks, run it in a thread; hashing and file I/O release the GIL,
+    so several uploads are stored in parallel.
+    """
+    source = upload.file
+    source.seek(0)
+    head = source.read(16)
+    source.seek(0)
+    digest = hashlib.sha256()
+    directory.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as target:
+        size = 0
+        while chunk := source.read(CHUNK_SIZE):
+            digest.update(chunk)
+            target.write(chunk)
+            size += len(chunk)
+    kind = image_type(head)
+    path = directory / (digest.hexdigest() + (f".{kind}" if kind else ""))
+    os.replace(target.name, path)
+    return StoredUpload(upload.filename, path, size, digest.hexdigest(), kind)
+
+
+async def store_uploads(uploads: list[UploadFile], directory: Path) -> list[StoredUpload]:
+    """Store every non-empty upload with `store_upload`, all at once in the thread pool."""
+    return await asyncio.gather(
+        *(asyncio.to_thread(store_upload, upload, directory) for upload in uploads if upload.size)
+    )
+
+
+def expire_uploads(directory: Path, max_age: float) -> int:
+    """Delete the files of `directory` not written for `max_age` seconds, returning how many were.
+
+    This blocks, run it in a thread. Storing the same content again renews
+    its file, and temporary files of stores that never finished go too.
+    """
+    cutoff = time.time() - max_age
+    expired = 0
+    for path in directory.glob("*") if directory.is_dir() else []:
+        try:
+            if path.is_file() and path.stat().st_mtime < cutoff:
+                path.unlink()
+                expired += 1
+        except FileNotFoundError:
+            # expired by another process at the same time
+            continue
+    return expired
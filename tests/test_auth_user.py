@@ -0,0 +1,63 @@
+"""Test the verified-token cache behind the demo authentication."""
+
+import jwt
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from pyd4all.examples.demo.auth import router
+from pyd4all.examples.demo.auth_user import User, VerifiedTokenCache, token_cache
+
+app = FastAPI()
+app.include_router(router, prefix="/api/auth")
+client = TestClient(app)
+
+
+@pytest.fixture
+def cache(monkeypatch: pytest.MonkeyPatch) -> VerifiedTokenCache:
+    fresh = VerifiedTokenCache(maxsize=2)
+    monkeypatch.setattr("pyd4all.examples.demo.auth_user.token_cache", fresh)
+    return fresh
+
+
+def test_repeat_requests_skip_verification(cache: VerifiedTokenCache, mocker) -> None:
+    """Test that only the first request with a token decodes it."""
+    decode = mocker.spy(jwt, "decode")
+    token = User(email="a@example.com", extra={}).encode_token()
+    users = [User.from_request_opt(f"Bearer {token}") for _ in range(4)]
+    assert users[0] == User(email="a@example.com", extra={})
+    assert all(user is users[0] for user in users)
+    assert decode.call_count == 1
+    assert (cache.stats.hits, cache.stats.misses, cache.stats.hit_ratio) == (3, 1, 0.75)
+
+
+def test_entries_expire_at_exp(cache: VerifiedTokenCache) -> None:
+    """Test that a cached token stops working once its exp has passed."""
+    token = User(email="b@example.com", extra={}).encode_token()
+    assert User.from_request_opt(f"Bearer {token}") is not None
+    exp = jwt.decode(token, options={"verify_signature": False})["exp"]
+    cache.clock = lambda: exp + 1
+    assert cache.get(token) is None
+    assert cache.stats.expired == 1
+    assert len(cache) == 0
+
+
+def test_lru_bound_and_invalid_tokens(cache: VerifiedTokenCache) -> None:
+    """Test that the cache stays bounded and never stores tokens that fail verification."""
+    for i in range(3):
+        User.from_request_opt(f"Bearer {User(email=f'{i}@example.com', extra={}).encode_token()}")
+    assert len(cache) == 2
+    with pytest.raises(Exception, match="Invalid token"):
+        User.from_request_opt("Bearer not-a-token")
+    assert len(cache) == 2
+
+
+def test_logout_invalidates_cached_token() -> None:
+    """Test that logging out removes the token from the cache."""
+    token = User(email="c@example.com", extra={}).encode_token()
+    assert User.from_request_opt(f"Bearer {token}") is not None
+    invalidated = token_cache.stats.invalidated
+    response = client.post("/api/auth/logout", headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+    assert token_cache.stats.invalidated == invalidated + 1
+    assert token_cache.get(token) is None
@@ -0,0 +1,100 @@
+"""Test batched lookups and the bulk users endpoint."""
+
+import asyncio
+import importlib
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from pyd4all.http.api.v1.users import index as users
+from pyd4all.utils.batch_tools import BatchLoader
+
+user_by_id = importlib.import_module("pyd4all.http.api.v1.users.[user_id]")
+
+
+@pytest.mark.asyncio
+async def test_concurrent_loads_share_one_fetch() -> None:
+    """Test that loads of one tick are deduplicated, split by batch size and fetched together."""
+    fetched: list[list[int]] = []
+
+    async def fetch(keys: list[int]) -> dict[int, str]:
+        fetched.append(keys)
+        return {key: str(key) for key in keys if key != 0}
+
+    loader = BatchLoader(fetch, max_batch_size=3)
+    values = await asyncio.gather(loader.load(1), loader.load(2), loader.load_many([2, 3, 0]), loader.load(4))
+    assert values == ["1", "2", ["2", "3", None], "4"]
+    assert fetched == [[1, 2, 3], [0, 4]]
+    assert await loader.load(5) == "5"
+    assert loader.stats.as_dict() == {"loads": 7, "fetches": 3, "keys": 6}
+
+
+@pytest.mark.asyncio
+async def test_fetch_errors_reach_every_load() -> None:
+    """Test that a failed fetch raises in each load of the batch."""
+
+    async def fetch(keys: list[int]) -> dict[int, str]:
+        raise ConnectionError("backend down")
+
+    loader = BatchLoader(fetch)
+    results = await asyncio.gather(loader.load(1), loader.load(2), return_exceptions=True)
+    assert [type(result) for result in results] == [ConnectionError, ConnectionError]
+
+
+@pytest.mark.asyncio
+async def test_cancelled_load_does_not_cancel_the_others() -> None:
+    """Test that a load cancelled while its batch is fetched leaves the loads sharing its key waiting."""
+    release = asyncio.Event()
+
+    async def fetch(keys: list[int]) -> dict[int, str]:
+        await release.wait()
+        return {key: str(key) for key in keys}
+
+    loader = BatchLoader(fetch)
+    cancelled = asyncio.create_task(loader.load(1))
+    many = asyncio.create_task(loader.load_many([1, 2]))
+    single = asyncio.create_task(loader.load(1))
+    await asyncio.sleep(0.01)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    release.set()
+    assert await many == ["1", "2"]
+    assert await single == "1"
+    assert cancelled.cancelled()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_fetch_cancels_its_loads() -> None:
+    """Test that the loads of a batch whose fetch is cancelled are cancelled too, not left waiting."""
+    started = asyncio.Event()
+
+    async def fetch(keys: list[int]) -> dict[int, str]:
+        started.set()
+        await asyncio.sleep(10)
+        return {}
+
+    loader = BatchLoader(fetch)
+    loads = asyncio.gather(loader.load(1), loader.load_many([1, 2]), return_exceptions=True)
+    await started.wait()
+    for task in loader._fetching:
+        task.cancel()
+    results = await asyncio.wait_for(loads, 1)
+    assert [type(result) for result in results] == [asyncio.CancelledError, asyncio.CancelledError]
+
+
+@pytest.mark.asyncio
+async def test_users_endpoints_batch_their_lookups(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test the `?ids=` endpoint and that concurrent single-user requests are fetched together."""
+    monkeypatch.setattr(users, "fake_user_db", [{"id": 2, "name": "Jack", "email": "jack@example.com"}])
+    app = FastAPI()
+    app.include_router(users.router, prefix="/api/v1/users")
+    app.include_router(user_by_id.router, prefix="/api/v1/users/{user_id}")
+    fetches = users.user_loader.stats.fetches
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        bulk = await client.get("/api/v1/users", params={"ids": "2,1"})
+        assert [user["name"] for user in bulk.json()] == ["Jack", "John Doe"]
+        assert (await client.get("/api/v1/users", params={"ids": "1,x"})).status_code == httpx.codes.UNPROCESSABLE_ENTITY
+        responses = await asyncio.gather(*(client.get(f"/api/v1/users/{i}") for i in range(1, 51)))
+    assert responses[1].json() == {"user_id": 2, "name": "Jack", "email": "jack@example.com"}
+    assert users.user_loader.stats.fetches - fetches < 50 // 10
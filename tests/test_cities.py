@@ -0,0 +1,225 @@
+"""Test the cities dataset behind the table demo."""
+
+import json
+from pathlib import Path
+
+import httpx
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from pyd4all.examples.demo.cities import (
+    CITIES_FILE,
+    City,
+    CityTable,
+    GeoIndex,
+    compile_snapshot,
+    haversine_km,
+    load_cities,
+)
+from pyd4all.examples.demo.tables import (
+    RankedCity,
+    cities_by_admin_region,
+    cities_by_iso3,
+    cities_lookup,
+    cities_near,
+    cities_search,
+    cities_view,
+    city_view,
+    country_totals,
+    regions_of,
+    reload_cities,
+    router,
+    top_cities,
+)
+
+app = FastAPI()
+app.include_router(router, prefix="/api/table")
+
+
+def test_rows_match_source() -> None:
+    """Test that materialized rows equal the validated JSON records."""
+    expected = {record["id"]: City.model_validate(record) for record in json.loads(CITIES_FILE.read_bytes())}
+    cities = load_cities()
+    assert len(cities) == len(expected)
+    assert list(cities["population"]) == sorted(cities["population"], reverse=True)
+    rows = cities.rows(range(len(cities)))
+    assert all(row == expected[row.id] for row in rows)
+    assert any(row.capital is None for row in rows)
+
+
+def test_cities_view_filters_by_country() -> None:
+    """Test that the page only holds cities of the filtered country."""
+    page = cities_view.__wrapped__(page=1, country="GBR")
+    table = next(component for component in page[2].components if component.type == "Table")
+    pagination = page[2].components[-1]
+    assert 0 < len(table.data) <= 50
+    assert {city.iso3 for city in table.data} == {"GBR"}
+    assert pagination.total == int((load_cities()["iso3"] == b"GBR").sum())
+
+
+def test_indexes_match_full_scan() -> None:
+    """Test that every index holds the rows a full scan would find, in population order."""
+    cities = load_cities()
+    for iso3, row_ids in cities_by_iso3().items():
+        assert list(row_ids) == [i for i in range(len(cities)) if cities["iso3"][i].decode() == iso3]
+    region = cities_by_admin_region()[("USA", "Texas")]
+    assert {city.admin_name for city in cities.rows(region)} == {"Texas"}
+    assert sum(map(len, cities_by_admin_region().values())) == len(cities)
+
+
+def test_cities_view_filters_by_name_and_region() -> None:
+    """Test that a country name and an admin region narrow the page."""
+    page = cities_view.__wrapped__(page=1, country="United States", region="Texas")
+    table = next(component for component in page[2].components if component.type == "Table")
+    assert {(city.iso3, city.admin_name) for city in table.data} == {("USA", "Texas")}
+    assert page[2].components[-1].total == len(cities_by_admin_region()[("USA", "Texas")])
+
+
+def test_cities_search() -> None:
+    """Test that name search ranks prefixes by population and tolerates typos."""
+
+    def labels(q: str, limit: int = 20) -> list[str]:
+        return [option["label"] for option in cities_search(q=q, limit=limit).options]
+
+    assert labels("new")[:2] == ["New York, United States", "New Orleans, United States"]
+    assert labels("janeiro", 1) == ["Rio de Janeiro, Brazil"]
+    assert labels("krakow", 1) == ["Kraków, Poland"]
+    assert labels("tokio", 1) == ["Tokyo, Japan"]
+    assert len(labels("", 5)) == 5
+    [option] = cities_search(q="new york", limit=1).options
+    assert load_cities().row(cities_lookup()[int(option["value"])]).city == "New York"
+    client = TestClient(app)
+    for limit in (0, -1, 101):
+        response = client.get("/api/table/cities/search", params={"q": "new", "limit": limit})
+        assert response.status_code == httpx.codes.UNPROCESSABLE_ENTITY
+
+
+def test_geo_index_matches_brute_force() -> None:
+    """Test nearest and bounding-box queries against a full scan, including the poles and 180°."""
+    cities = load_cities()
+    index = GeoIndex(cities)
+    lat, lng = np.asarray(cities["lat"]), np.asarray(cities["lng"])
+    rng = np.random.default_rng(42)
+    random_points = zip(
+        rng.uniform(-90, 90, 100), rng.uniform(-180, 180, 100), rng.integers(1, 30, 100).tolist(), strict=True
+    )
+    for point_lat, point_lng, k in [(89.9, 0, 5), (0, 179.9, 10), *random_points]:
+        rows, distances = index.nearest(point_lat, point_lng, k)
+        expected = np.sort(haversine_km(point_lat, point_lng, lat, lng))[:k]
+        assert np.allclose(distances, expected)
+        assert len(set(rows.tolist())) == len(rows)
+    for min_lat, max_lat, min_lng, max_lng in [(30, 60, 170, -100), (-10, 10, -179, 179), (35, 36, 139, 140)]:
+        in_lng = (lng >= min_lng) & (lng <= max_lng) if min_lng <= max_lng else (lng >= min_lng) | (lng <= max_lng)
+        expected = np.flatnonzero((lat >= min_lat) & (lat <= max_lat) & in_lng)
+        assert np.array_equal(index.within(min_lat, max_lat, min_lng, max_lng), expected)
+
+
+def test_cities_near() -> None:
+    """Test that the closest city to a city's own coordinates is that city."""
+    london = cities_near(lat=51.5072, lng=-0.1275, k=3)
+    assert london[0].city == "London"
+    assert [city.distance_km for city in london] == sorted(city.distance_km for city in london)
+
+
+def test_cities_view_sorts_filtered_pages() -> None:
+    """Test that sorting composes with the country filter and pagination."""
+
+    def page_of(**params) -> list[City]:
+        page = cities_view.__wrapped__(**params)
+        return next(component for component in page[2].components if component.type == "Table").data
+
+    japan = load_cities().rows(cities_by_iso3()["JPN"])
+    by_lat = sorted(japan, key=lambda city: city.lat)
+    assert page_of(country="JPN", sort="lat") == by_lat[:50]
+    assert page_of(country="JPN", sort="lat", page=2) == by_lat[50:100]
+    assert page_of(country="JPN", sort="lat", order="desc")[0] == by_lat[-1]
+    names = [city.city for city in page_of(sort="city")]
+    assert names[0] == "Aba"
+    assert page_of() == page_of(sort="population", order="desc") == load_cities().rows(range(50))
+
+
+def test_city_view() -> None:
+    """Test that a city is found by its id."""
+    city = load_cities().row(0)
+    assert cities_lookup()[city.id] == 0
+    assert city_view.__wrapped__(city.id)[2].components[-1].data == city
+
+
+def test_group_totals_match_scan() -> None:
+    """Test that vectorized country and region totals equal a plain loop over the rows."""
+    rows = load_cities().rows(range(len(load_cities())))
+    by_country: dict[str, list[float]] = {}
+    for city in rows:
+        by_country.setdefault(city.iso3, []).append(city.population)
+    totals = country_totals()
+    assert {t.iso3: (t.cities, t.population) for t in totals} == {
+        iso3: (len(pops), sum(pops)) for iso3, pops in by_country.items()
+    }
+    assert [t.population for t in totals] == sorted((t.population for t in totals), reverse=True)
+    texas = next(r for r in regions_of("United States") if r.admin_name == "Texas")
+    assert texas.cities == sum(1 for city in rows if city.iso3 == "USA" and city.admin_name == "Texas")
+    assert sum(r.cities for r in regions_of(None)) == len(rows)
+
+
+def test_top_cities_per_country() -> None:
+    """Test that top-N per country keeps the N most populous cities of each country."""
+    top = top_cities(2)
+    for iso3, row_ids in cities_by_iso3().items():
+        expected = load_cities().rows(row_ids[:2])
+        assert [city for city in top if city.iso3 == iso3] == [
+            RankedCity(**city.model_dump(), rank=rank) for rank, city in enumerate(expected, 1)
+        ]
+    assert [city.rank for city in top_cities(3, "JPN")] == [1, 2, 3]
+
+
+def test_reload_unchanged_keeps_caches() -> None:
+    """Test that reloading identical data keeps the derived indexes."""
+    index = cities_by_iso3()
+    assert not reload_cities()
+    assert cities_by_iso3() is index
+
+
+def test_reload_endpoint_rebuilds_changed_data(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that reloading changed data drops the derived indexes and cached pages."""
+    client = TestClient(app)
+    assert "Renamed" not in client.get("/api/table/cities").text
+    columns = dict(load_cities().columns)
+    columns["city"] = columns["city"].copy()
+    columns["city"][0] = b"Renamed"
+    index = cities_by_iso3()
+    monkeypatch.setattr(CityTable, "from_snapshot", classmethod(lambda cls, *args: CityTable(columns)))
+    try:
+        assert client.post("/api/table/cities/reload").json() == {"changed": True}
+        assert cities_by_iso3() is not index
+        assert "Renamed" in client.get("/api/table/cities").text
+    finally:
+        monkeypatch.undo()
+        assert reload_cities()
+    assert "Renamed" not in client.get("/api/table/cities").text
+
+
+def test_snapshot_round_trip(tmp_path: Path) -> None:
+    """Test that a compiled snapshot maps back to the same columns, read-only."""
+    compiled = compile_snapshot(target=tmp_path / "cities.bin")
+    mapped = CityTable.from_snapshot(tmp_path / "cities.bin")
+    assert mapped is not None
+    for name, column in compiled.columns.items():
+        assert np.array_equal(mapped[name], column)
+        assert not mapped[name].flags.writeable
+    assert mapped.rows([0, 1999]) == compiled.rows([0, 1999])
+
+
+def test_snapshot_falls_back_when_stale_or_broken(tmp_path: Path) -> None:
+    """Test that a snapshot of another source, or a damaged one, is ignored."""
+    source = tmp_path / "cities.json"
+    source.write_bytes(CITIES_FILE.read_bytes())
+    snapshot = tmp_path / "cities.bin"
+    compile_snapshot(source, snapshot)
+    assert CityTable.from_snapshot(snapshot, source) is not None
+    source.write_bytes(CITIES_FILE.read_bytes() + b"\n")
+    assert CityTable.from_snapshot(snapshot, source) is None
+    snapshot.write_bytes(snapshot.read_bytes()[:100])
+    assert CityTable.from_snapshot(snapshot, CITIES_FILE) is None
+    assert CityTable.from_snapshot(tmp_path / "missing.bin") is None
@@ -1,5 +1,7 @@
 """Test pydantic-all-in-one CLI."""
 
+from pathlib import Path
+
 from typer.testing import CliRunner
 
 from pyd4all.main import app
@@ -13,3 +15,11 @@ def test_fire() -> None:
     result = runner.invoke(app, ["--name", name])
     assert result.exit_code == 2
     # assert name in result.stdout
+
+
+def test_data_compile(tmp_path: Path) -> None:
+    """Test that the data compile command writes the cities snapshot."""
+    target = tmp_path / "cities.bin"
+    result = runner.invoke(app, ["data", "compile", "--target", str(target)])
+    assert result.exit_code == 0
+    assert target.stat().st_size > 0
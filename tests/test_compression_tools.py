@@ -0,0 +1,122 @@
+"""Test the compression middleware on a bare app."""
+
+import asyncio
+import zlib
+
+import brotli
+import httpx
+import pytest
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from fastapi.testclient import TestClient
+
+from pyd4all.utils.compression_tools import CompressedCache, CompressionMiddleware
+from pyd4all.utils.response_tools import ResponseCache
+
+EVENTS = [f"data: {{'count': {i}, 'text': 'event number {i}'}}\n\n".encode() for i in range(5)]
+page_cache = ResponseCache()
+
+app = FastAPI()
+cache = CompressedCache()
+app.add_middleware(CompressionMiddleware, minimum_size=100, cache=cache)
+
+
+@app.get("/small")
+async def small() -> Response:
+    return PlainTextResponse("short")
+
+
+@app.get("/page")
+async def page(request: Request) -> Response:
+    entry = page_cache.lookup("page") or page_cache.store("page", b'[{"type":"Text","text":"row"}]' * 50)
+    return page_cache.respond(request, entry)
+
+
+@app.get("/parquet")
+async def parquet() -> Response:
+    return Response(b"PAR1" * 100, media_type="application/vnd.apache.parquet")
+
+
+@app.get("/events")
+async def events() -> StreamingResponse:
+    async def generate():
+        for event in EVENTS:
+            yield event
+
+    return StreamingResponse(generate(), media_type="text/event-stream")
+
+
+client = TestClient(app)
+
+
+def test_minimum_size_and_types() -> None:
+    """Test that small and already compressed responses are sent as they are."""
+    for path in ("/small", "/parquet"):
+        response = client.get(path, headers={"Accept-Encoding": "br, gzip"})
+        assert "content-encoding" not in response.headers
+    response = client.get("/page", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+
+
+def test_static_body_is_compressed_once_with_a_weak_etag() -> None:
+    """Test that a body with a strong ETag is compressed once per coding and still revalidates."""
+    plain = client.get("/page", headers={"Accept-Encoding": "identity"})
+    hits = cache.hits
+    for _ in range(3):
+        response = client.get("/page", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.headers["etag"] == f"W/{plain.headers['etag']}"
+        assert int(response.headers["content-length"]) < len(plain.content)
+        assert response.content == plain.content
+    assert cache.hits == hits + 2
+    not_modified = client.get(
+        "/page", headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["etag"]}
+    )
+    assert not_modified.status_code == httpx.codes.NOT_MODIFIED
+    assert not_modified.headers["etag"] == response.headers["etag"]
+    assert not_modified.headers["vary"] == "Accept-Encoding"
+
+
+async def stream_events(coding: str) -> list[dict]:
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "path": "/events",
+        "raw_path": b"/events",
+        "query_string": b"",
+        "headers": [(b"accept-encoding", coding.encode())],
+    }
+    messages = []
+
+    async def receive() -> dict:
+        await asyncio.sleep(1)
+        return {"type": "http.disconnect"}
+
+    async def send(message: dict) -> None:
+        messages.append(message)
+
+    await app(scope, receive, send)
+    return messages
+
+
+@pytest.mark.asyncio
+async def test_stream_is_flushed_per_event() -> None:
+    """Test that each compressed chunk of an event stream decodes to exactly one event."""
+    for coding, decode in (("gzip", zlib.decompressobj(31).decompress), ("br", brotli.Decompressor().process)):
+        start, *bodies = await stream_events(coding)
+        headers = dict(start["headers"])
+        assert headers[b"content-encoding"] == coding.encode()
+        assert b"content-length" not in headers
+        chunks = [decode(message["body"]) for message in bodies]
+        assert chunks[: len(EVENTS)] == EVENTS
+        assert b"".join(chunks) == b"".join(EVENTS)
+
+
+def test_zstd() -> None:
+    """Test zstd, when the optional zstandard package is installed."""
+    zstandard = pytest.importorskip("zstandard")
+    plain = client.get("/page", headers={"Accept-Encoding": "identity"})
+    with client.stream("GET", "/page", headers={"Accept-Encoding": "zstd"}) as response:
+        assert response.headers["content-encoding"] == "zstd"
+        assert zstandard.ZstdDecompressor().decompress(b"".join(response.iter_raw())) == plain.content
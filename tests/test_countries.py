@@ -0,0 +1,42 @@
+"""Test the offline country search behind the select forms."""
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from pyd4all.examples.demo.countries import COUNTRY_REGIONS, country_index
+from pyd4all.examples.demo.forms import router
+from pyd4all.examples.demo.tables import country_totals
+
+app = FastAPI()
+app.include_router(router, prefix="/api/forms")
+client = TestClient(app)
+
+
+def test_every_country_has_a_region() -> None:
+    """Test that the region table covers every country of the dataset."""
+    assert {country.iso3 for country in country_index().countries} <= COUNTRY_REGIONS.keys()
+
+
+def test_countries_rank_by_population() -> None:
+    """Test that the rank follows the population of a country's cities."""
+    assert [c.iso3 for c in country_index().countries] == [t.iso3 for t in country_totals()]
+    assert country_index().countries[0].rank == 1
+
+
+def test_search_matches_word_prefix_and_iso3() -> None:
+    """Test that names match by any word start, accent-insensitive, and codes match too."""
+    index = country_index()
+    assert [c.iso3 for c in index.search("uni")] == ["ARE", "GBR", "USA"]
+    assert [c.iso3 for c in index.search("kinshasa")] == ["COD"]
+    assert [c.name for c in index.search("cote")] == ["Côte d'Ivoire"]
+    assert [c.name for c in index.search("gbr")] == ["United Kingdom"]
+    assert index.search("xyz") == []
+
+
+def test_search_view_groups_by_region() -> None:
+    """Test that an empty query lists the 20 most populous countries grouped by region."""
+    options = client.get("/api/forms/search", params={"q": ""}).json()["options"]
+    countries = [option for group in options for option in group["options"]]
+    assert len(countries) == 20
+    assert {"value": "CHN", "label": "China"} in next(g for g in options if g["label"] == "Asia")["options"]
+    assert client.get("/api/forms/search", params={"q": "zzz"}).json() == {"options": []}
@@ -0,0 +1,172 @@
+"""Test the caching, coalescing transport against a local stub server."""
+
+import asyncio
+import threading
+import time
+from collections import Counter
+
+import httpx
+import pytest
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from pyd4all.utils.http_tools import CachingTransport
+
+hits: Counter[str] = Counter()
+release = threading.Event()
+
+
+async def cached(request: Request) -> Response:
+    hits[request.url.path] += 1
+    return PlainTextResponse(str(hits[request.url.path]), headers={"Cache-Control": request.query_params["cc"]})
+
+
+async def validated(request: Request) -> Response:
+    hits[request.url.path] += 1
+    if request.headers.get("if-none-match") == '"v1"':
+        return Response(status_code=304, headers={"ETag": '"v1"', "Cache-Control": "no-cache"})
+    return PlainTextResponse("body", headers={"ETag": '"v1"', "Cache-Control": "no-cache"})
+
+
+async def slow(request: Request) -> Response:
+    hits[request.url.path] += 1
+    await asyncio.sleep(0.2)
+    return PlainTextResponse("slow", headers={"Cache-Control": request.query_params.get("cc", "max-age=60")})
+
+
+async def streamed(request: Request) -> Response:
+    async def body():
+        yield b"first"
+        # the rest only comes once the client has seen the first chunk
+        for _ in range(300):
+            if release.is_set():
+                break
+            await asyncio.sleep(0.01)
+        yield b"rest"
+
+    return StreamingResponse(body(), headers={"Cache-Control": request.query_params["cc"]})
+
+
+@pytest.fixture(scope="module")
+def stub_url():
+    app = Starlette(routes=[Route("/cached", cached), Route("/validated", validated), Route("/slow", slow), Route("/stream", streamed)])
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join()
+
+
+class Clock:
+    now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_max_age_and_stale_while_revalidate(stub_url: str) -> None:
+    """Test that fresh responses are served locally and stale ones refreshed in the background."""
+    hits.clear()
+    clock = Clock()
+    transport = CachingTransport(clock=clock)
+    async with httpx.AsyncClient(transport=transport, base_url=stub_url) as client:
+        params = {"cc": "max-age=10, stale-while-revalidate=30"}
+        assert (await client.get("/cached", params=params)).text == "1"
+        assert (await client.get("/cached", params=params)).text == "1"
+        clock.now += 20
+        stale = await client.get("/cached", params=params)
+        assert (stale.text, stale.headers["age"]) == ("1", "20")
+        await asyncio.gather(*transport._background)
+        assert (await client.get("/cached", params=params)).text == "2"
+        clock.now += 100
+        assert (await client.get("/cached", params=params)).text == "3"
+    assert transport.metrics.as_dict() | {"pool_wait_seconds": 0} == {
+        "hits": 2,
+        "stale_hits": 1,
+        "misses": 2,
+        "revalidated": 0,
+        "coalesced": 0,
+        "bypassed": 0,
+        "streamed": 0,
+        "pool_waits": 0,
+        "pool_wait_seconds": 0,
+        "hit_ratio": 0.6,
+    }
+
+
+@pytest.mark.asyncio
+async def test_no_store_private_and_authorized_requests_are_not_cached(stub_url: str) -> None:
+    """Test that the cache stays out of responses it must not share."""
+    hits.clear()
+    async with httpx.AsyncClient(transport=CachingTransport(), base_url=stub_url) as client:
+        for cc in ("no-store", "private, max-age=60"):
+            await client.get("/cached", params={"cc": cc})
+            await client.get("/cached", params={"cc": cc})
+        await client.get("/cached", params={"cc": "max-age=60"}, headers={"Authorization": "token x"})
+        await client.get("/cached", params={"cc": "max-age=60"}, headers={"Authorization": "token y"})
+    assert hits["/cached"] == 6
+
+
+@pytest.mark.asyncio
+async def test_revalidation_with_etag(stub_url: str) -> None:
+    """Test that a no-cache response is revalidated and a 304 reuses the stored body."""
+    hits.clear()
+    transport = CachingTransport()
+    async with httpx.AsyncClient(transport=transport, base_url=stub_url) as client:
+        first = await client.get("/validated")
+        second = await client.get("/validated")
+    assert first.text == second.text == "body"
+    assert second.status_code == 200
+    assert (hits["/validated"], transport.metrics.revalidated) == (2, 1)
+
+
+@pytest.mark.asyncio
+async def test_identical_gets_are_coalesced(stub_url: str) -> None:
+    """Test that concurrent identical GETs share one request."""
+    hits.clear()
+    transport = CachingTransport(max_per_host=1)
+    async with httpx.AsyncClient(transport=transport, base_url=stub_url) as client:
+        responses = await asyncio.gather(*(client.get("/slow") for _ in range(10)))
+        assert {response.text for response in responses} == {"slow"}
+        assert (hits["/slow"], transport.metrics.coalesced) == (1, 9)
+        await asyncio.gather(client.get("/slow", params={"a": 1}), client.get("/slow", params={"b": 1}))
+    assert transport.metrics.pool_waits == 1
+    assert transport.metrics.pool_wait_seconds >= 0.1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_the_others(stub_url: str) -> None:
+    """Test that a coalesced fetch goes on for the other callers when the one that started it is cancelled."""
+    hits.clear()
+    async with httpx.AsyncClient(transport=CachingTransport(), base_url=stub_url) as client:
+        first = asyncio.create_task(client.get("/slow"))
+        await asyncio.sleep(0.05)
+        second = asyncio.create_task(client.get("/slow"))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        assert (await second).text == "slow"
+    assert first.cancelled()
+    assert hits["/slow"] == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("cc", ["no-store", "max-age=60"])
+async def test_uncacheable_and_large_responses_stream(stub_url: str, cc: str) -> None:
+    """Test that a response that is not cacheable, or over `max_body`, streams instead of being buffered."""
+    release.clear()
+    transport = CachingTransport(max_body=3)
+    async with httpx.AsyncClient(transport=transport, base_url=stub_url) as client:
+        async with client.stream("GET", "/stream", params={"cc": cc}) as response:
+            chunks = response.aiter_raw()
+            assert await asyncio.wait_for(anext(chunks), 2) == b"first"
+            release.set()
+            assert b"".join([chunk async for chunk in chunks]) == b"rest"
+    assert (transport.metrics.streamed, len(transport._entries)) == (1, 0)
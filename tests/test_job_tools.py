@@ -0,0 +1,142 @@
+"""Test the SQLite-backed job queue and its demo status endpoint."""
+
+import asyncio
+import time
+from pathlib import Path
+from typing import Any
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from pyd4all.examples.demo import jobs
+from pyd4all.utils.job_tools import JobQueue
+
+
+@pytest.mark.asyncio
+async def test_retries_then_done_or_failed(tmp_path: Path) -> None:
+    """Test that a failing job is retried with backoff until it succeeds or runs out of attempts."""
+    queue = JobQueue(tmp_path / "jobs.sqlite3", poll_interval=0.01)
+    calls: list[int] = []
+
+    @queue.task(max_attempts=3, backoff=0.01)
+    async def flaky(n: int) -> int:
+        calls.append(n)
+        if len(calls) < 3:
+            raise ValueError("not yet")
+        return n * 2
+
+    @queue.task(max_attempts=2, backoff=0.01)
+    def broken() -> None:
+        raise RuntimeError("always")
+
+    await queue.start(workers=2)
+    flaky_job = await queue.enqueue(flaky, 21)
+    broken_job = await queue.enqueue(broken.job_name)
+    await queue.join()
+    done, failed = await queue.get(flaky_job.id), await queue.get(broken_job.id)
+    await queue.stop()
+    assert (done.status, done.attempts, done.result, done.error) == ("done", 3, 42, None)
+    assert (failed.status, failed.attempts, failed.error) == ("failed", 2, "RuntimeError: always")
+    assert calls == [21, 21, 21]
+
+
+@pytest.mark.asyncio
+async def test_jobs_survive_a_restart(tmp_path: Path) -> None:
+    """Test that queued jobs and jobs whose lease expired are run, and those of a live process are not."""
+    path = tmp_path / "jobs.sqlite3"
+    first = JobQueue(path)
+
+    @first.task("record")
+    async def record_first(value: str) -> str:
+        return value
+
+    queued = await first.enqueue("record", "queued")
+    crashed = await first.enqueue("record", "crashed")
+    live = await first.enqueue("record", "live")
+    lease = "UPDATE jobs SET status = 'running', locked_by = 'other', locked_until = ? WHERE id = ?"
+    await first._execute(lease, (time.time() - 1, crashed.id))
+    await first._execute(lease, (time.time() + 60, live.id))
+    await first.stop()
+
+    second = JobQueue(path, poll_interval=0.01)
+    second.task("record")(record_first)
+    await second.start(workers=1)
+    await second.join()
+    results = [await second.get(job.id) for job in (queued, crashed, live)]
+    assert await second.counts() == {"done": 2, "running": 1}
+    await second.stop()
+    assert [(job.status, job.result) for job in results] == [
+        ("done", "queued"),
+        ("done", "crashed"),
+        ("running", None),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_stop_requeues_the_jobs_it_cancels(tmp_path: Path) -> None:
+    """Test that a job cancelled by a bounded stop is queued again, and its lease renewed while it ran."""
+    queue = JobQueue(tmp_path / "jobs.sqlite3", poll_interval=0.01, lease=0.06)
+    started = asyncio.Event()
+
+    @queue.task()
+    async def slow() -> None:
+        started.set()
+        await asyncio.sleep(10)
+
+    await queue.start(workers=1)
+    job = await queue.enqueue(slow)
+    await started.wait()
+    await asyncio.sleep(0.1)
+    [(locked_until,)] = await queue._execute("SELECT locked_until FROM jobs WHERE id = ?", (job.id,))
+    assert locked_until > time.time()
+    with pytest.raises(TimeoutError):
+        async with asyncio.timeout(0.05):
+            await queue.stop()
+    reopened = JobQueue(queue.path)
+    assert (await reopened.get(job.id)).status == "queued"
+    await reopened.stop()
+
+
+@pytest.mark.asyncio
+async def test_errors_do_not_stop_the_queue(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that a statement failing outside SQLite, or a worker failing to record a job, stops nothing."""
+    queue = JobQueue(tmp_path / "jobs.sqlite3", poll_interval=0.01, lease=0.05)
+    queue.task("double")(lambda n: n * 2)
+    with pytest.raises(OverflowError):
+        await queue.get(2**70)
+    finish = queue._finish
+    failures = [RuntimeError("disk gone")]
+
+    async def flaky_finish(*args: Any, **kwargs: Any) -> None:
+        if failures:
+            raise failures.pop()
+        await finish(*args, **kwargs)
+
+    monkeypatch.setattr(queue, "_finish", flaky_finish)
+    await queue.start(workers=1)
+    job = await queue.enqueue("double", 21)
+    await asyncio.wait_for(queue.join(), 5)
+    done = await queue.get(job.id)
+    await queue.stop()
+    assert (done.status, done.result, done.attempts) == ("done", 42, 2)
+
+
+def test_status_endpoint_and_page(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test polling a job's status and rendering the jobs page."""
+    queue = JobQueue(tmp_path / "jobs.sqlite3")
+    queue.task("noop")(lambda: None)
+    monkeypatch.setattr(jobs, "job_queue", queue)
+    app = FastAPI()
+    app.include_router(jobs.router, prefix="/api/jobs")
+    client = TestClient(app)
+    with client:
+        job = client.portal.call(queue.enqueue, "noop")
+        status = client.get(f"/api/jobs/{job.id}/status")
+        assert status.json()["status"] == "queued"
+        assert client.get("/api/jobs/999/status").status_code == httpx.codes.NOT_FOUND
+        assert client.get(f"/api/jobs/{2**70}/status").status_code == httpx.codes.UNPROCESSABLE_ENTITY
+        page = client.get("/api/jobs")
+        assert '"text":"1 queued, 0 running, 0 done, 0 failed"' in page.text
+        client.portal.call(queue.stop)
@@ -0,0 +1,117 @@
+"""Test the serialized FastUI responses, their cache and the precompressed landing page."""
+
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from fastui import AnyComponent, FastUI, prebuilt_html
+from fastui import components as c
+
+from pyd4all.examples.demo.app import app as landing_app
+from pyd4all.examples.demo.tables import (
+    cities_view,
+    country_totals_view,
+    router,
+    table_cache,
+    users_view,
+)
+from pyd4all.utils.response_tools import ResponseCache, etag_matches, fastui_json, fastui_response
+
+app = FastAPI()
+app.include_router(router, prefix="/api/table")
+client = TestClient(app)
+
+
+def test_cached_body_matches_fastapi_serialization() -> None:
+    """Test that cached bytes equal what the route returned before it was cached."""
+    response = client.get("/api/table/cities", params={"country": "GBR", "page": 2})
+    assert httpx.codes.is_success(response.status_code)
+    assert response.content == fastui_json(cities_view.__wrapped__(page=2, country="GBR"))
+    assert response.headers["content-type"] == "application/json"
+
+
+def test_if_none_match_returns_not_modified() -> None:
+    """Test that a repeated request with the ETag gets an empty 304."""
+    first = client.get("/api/table/cities/1826645935")
+    etag = first.headers["etag"]
+    hits = table_cache.hits
+    second = client.get("/api/table/cities/1826645935", headers={"If-None-Match": f'W/"other", {etag}'})
+    assert second.status_code == httpx.codes.NOT_MODIFIED
+    assert second.headers["etag"] == etag
+    assert not second.content
+    assert table_cache.hits == hits + 1
+    assert client.get("/api/table/cities/1826645935", headers={"If-None-Match": '"other"'}).content == first.content
+
+
+def test_etag_varies_with_query() -> None:
+    """Test that different pages are cached and tagged separately."""
+    etags = {client.get("/api/table/cities", params={"page": page}).headers["etag"] for page in (1, 2, 3)}
+    assert len(etags) == 3
+
+
+def test_lru_eviction() -> None:
+    """Test that the least recently used entry is evicted first."""
+    cache = ResponseCache(maxsize=2)
+    for key in "abc":
+        cache.store(key, key.encode())
+        cache.lookup("a")
+    assert cache.lookup("b") is None
+    assert len(cache) == 2
+    assert etag_matches("*", cache.lookup("c").etag)
+
+
+def test_openapi_keeps_fastui_schema() -> None:
+    """Test that the cached routes still document the FastUI response model."""
+    schema = client.get("/openapi.json").json()
+    operation = schema["paths"]["/api/table/cities"]["get"]
+    assert {parameter["name"] for parameter in operation["parameters"]} == {"page", "country", "region", "sort", "order"}
+    assert "FastUI" in str(operation["responses"]["200"])
+
+
+def test_prebuilt_layout_splices_to_the_same_json() -> None:
+    """Test that pages with the prebuilt navbar, footer and tabs serialize like a fresh `FastUI` model."""
+    for page in (
+        cities_view.__wrapped__(page=1, country=None),
+        country_totals_view.__wrapped__(page=1),
+        users_view.__wrapped__(),
+        [c.Page(components=users_view.__wrapped__(), class_name="+ mt-4")],
+    ):
+        assert fastui_json(page) == FastUI(root=page).model_dump_json(by_alias=True, exclude_none=True).encode()
+
+
+def test_fastui_response_matches_response_model_validation() -> None:
+    """Test that a `fastui_response` route sends the bytes and documents the schema of a validated one."""
+    fastui_app = FastAPI()
+
+    def page(country: str | None = None) -> list[AnyComponent]:
+        return users_view.__wrapped__() + cities_view.__wrapped__(page=1, country=country)
+
+    fastui_app.get("/validated", response_model=FastUI, response_model_exclude_none=True)(page)
+    fastui_app.get("/direct", response_model=FastUI, response_model_exclude_none=True)(fastui_response(page))
+    fastui_client = TestClient(fastui_app)
+    for params in ({}, {"country": "GBR"}):
+        validated = fastui_client.get("/validated", params=params)
+        direct = fastui_client.get("/direct", params=params)
+        assert direct.content == validated.content
+        assert direct.headers["content-type"] == validated.headers["content-type"]
+    paths = fastui_client.get("/openapi.json").json()["paths"]
+    assert paths["/direct"]["get"]["responses"] == paths["/validated"]["get"]["responses"]
+    assert paths["/direct"]["get"]["parameters"] == paths["/validated"]["get"]["parameters"]
+
+
+def test_landing_html_is_negotiated_and_revalidated() -> None:
+    """Test that the SPA landing page is sent precompressed when accepted, and 304 with a matching ETag."""
+    landing_client = TestClient(landing_app)
+    plain = landing_client.get("/any/path", headers={"Accept-Encoding": "identity"})
+    assert plain.text == prebuilt_html(title="FastUI Demo")
+    assert "content-encoding" not in plain.headers
+    for accept_encoding, coding in (("gzip, br", "br"), ("gzip", "gzip"), ("br;q=0.1, gzip", "gzip")):
+        response = landing_client.get("/other", headers={"Accept-Encoding": accept_encoding})
+        assert response.headers["content-encoding"] == coding
+        assert response.headers["vary"] == "Accept-Encoding"
+        assert response.content == plain.content
+        assert response.headers["etag"] != plain.headers["etag"]
+        revalidated = landing_client.get(
+            "/other", headers={"Accept-Encoding": accept_encoding, "If-None-Match": response.headers["etag"]}
+        )
+        assert revalidated.status_code == httpx.codes.NOT_MODIFIED
+        assert revalidated.content == b""
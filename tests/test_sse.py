@@ -0,0 +1,102 @@
+"""Test the server-sent event streams of the demo."""
+
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from pyd4all.examples.demo import sse
+from pyd4all.examples.demo.sse import (
+    broadcast_hubs,
+    canned_ai_delta_generator,
+    canned_ai_response_generator,
+    evict_idle_streams,
+    router,
+    sse_broadcast,
+)
+from pyd4all.utils.sse_tools import BroadcastHub
+
+app = FastAPI()
+app.include_router(router)
+
+
+def parse(event: str) -> tuple[str, str]:
+    fields = dict(line.split(": ", 1) for line in event.strip().split("\n"))
+    return fields.get("event", "message"), fields["data"]
+
+
+def markdown(data: str) -> str:
+    [component] = json.loads(data)
+    return component["text"]
+
+
+@pytest.mark.asyncio
+async def test_deltas_rebuild_the_snapshots() -> None:
+    """Test that applying deltas gives the text of every snapshot, and the final full text."""
+    full = [markdown(data) async for event in canned_ai_response_generator(delay=False) for _, data in [parse(event)]]
+    text, deltas, snapshots = "", 0, []
+    async for event in canned_ai_delta_generator(delay=False, snapshot_every=10):
+        kind, data = parse(event)
+        if kind == "delta":
+            delta = json.loads(data)
+            assert delta["offset"] == len(text)
+            text += delta["text"]
+            deltas += 1
+        else:
+            assert markdown(data) == text
+            snapshots.append(deltas)
+    assert text == full[-1]
+    assert snapshots == [*range(10, deltas + 1, 10), deltas]
+
+
+@pytest.mark.asyncio
+async def test_delta_mode_sends_fewer_bytes() -> None:
+    """Test that the delta stream is a fraction of the size of the snapshot stream."""
+    snapshot = sum([len(event) async for event in canned_ai_response_generator(delay=False)])
+    delta = sum([len(event) async for event in canned_ai_delta_generator(delay=False)])
+    assert delta * 5 < snapshot
+
+
+def test_reconnect_replays_missed_events(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that Last-Event-ID resumes a stream, and a finished stream answers 204."""
+    hub = BroadcastHub(replay_bytes=1024, stream_id="resume")
+    for i in range(3):
+        hub.publish(f"data: {i}\n\n".encode())
+    hub.close()
+    monkeypatch.setattr(sse, "sse_streams", {hub.stream_id: hub})
+    client = TestClient(app)
+    response = client.get("/sse", headers={"Last-Event-ID": "resume-1"})
+    assert response.text == "id: resume-2\ndata: 1\n\nid: resume-3\ndata: 2\n\n"
+    assert client.get("/sse", headers={"Last-Event-ID": "resume-3"}).status_code == 204
+
+
+def test_only_idle_streams_are_evicted(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that the longest idle streams are evicted first, and streams with a client never."""
+    hubs = {name: BroadcastHub(stream_id=name) for name in ("old", "live", "recent")}
+    monkeypatch.setattr(sse, "sse_streams", dict(hubs))
+    monkeypatch.setattr(sse, "RESUMABLE_STREAMS", 2)
+    hubs["live"].subscribe()
+    evict_idle_streams()
+    assert list(sse.sse_streams) == ["live", "recent"]
+    assert hubs["old"].closed
+    monkeypatch.setattr(sse, "STREAM_IDLE_TTL", 0)
+    evict_idle_streams()
+    assert list(sse.sse_streams) == ["live"]
+
+
+@pytest.mark.asyncio
+async def test_broadcast_subscribes_only_while_streaming(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test that a broadcast response that never started leaves no subscriber or producer behind."""
+    hub = BroadcastHub()
+    monkeypatch.setitem(broadcast_hubs, "delta", hub)
+    response = await sse_broadcast("delta")
+    assert not hub.subscribers
+    assert hub._task is None
+    body = response.body_iterator
+    assert (await anext(body)).startswith(b"event: delta")
+    assert len(hub.subscribers) == 1
+    await body.aclose()
+    assert not hub.subscribers
+    await asyncio.wait_for(hub._task, 1)
@@ -0,0 +1,112 @@
+"""Test the SSE broadcast hub, including a load test with thousands of in-process clients."""
+
+import asyncio
+import time
+
+import pytest
+
+from pyd4all.utils.sse_tools import HEARTBEAT, BroadcastHub
+
+
+async def consume(hub: BroadcastHub, delay: float = 0.0) -> list[bytes]:
+    events = []
+    async for event in hub.stream(hub.subscribe()):
+        events.append(event)
+        await asyncio.sleep(delay)
+    return events
+
+
+@pytest.mark.asyncio
+async def test_fan_out_to_thousands_with_slow_consumers() -> None:
+    """Test that fast clients get every event while slow ones skip ahead to the latest state."""
+    hub = BroadcastHub(maxsize=8)
+    fast = [asyncio.create_task(consume(hub)) for _ in range(3000)]
+    slow = [asyncio.create_task(consume(hub, delay=0.01)) for _ in range(50)]
+    await asyncio.sleep(0)
+    events = [f"data: {i}\n\n".encode() for i in range(100)]
+    start = time.perf_counter()
+    for event in events:
+        hub.publish(event)
+        await asyncio.sleep(0)
+    hub.close()
+    results = await asyncio.gather(*fast, *slow)
+    elapsed = time.perf_counter() - start
+    assert all(result == events for result in results[: len(fast)])
+    for result in results[len(fast) :]:
+        assert result[-1] == events[-1]
+        assert len(result) < len(events)
+    assert hub.stats.delivered + hub.stats.skipped == len(events) * (len(fast) + len(slow))
+    assert hub.stats.skipped > 0
+    assert not hub.subscribers
+    # 300k deliveries; a generous bound so the test only catches a per-client encode or copy
+    assert elapsed < 10
+
+
+@pytest.mark.asyncio
+async def test_drop_slow_consumer() -> None:
+    """Test that with the drop policy a full subscriber is disconnected, and the others are not."""
+    hub = BroadcastHub(maxsize=2, on_overflow="drop")
+    stuck = hub.subscribe()
+    reader = asyncio.create_task(consume(hub))
+    await asyncio.sleep(0)
+    for i in range(3):
+        hub.publish(str(i).encode())
+        await asyncio.sleep(0)
+    assert stuck.closed
+    assert [event async for event in hub.stream(stuck)] == []
+    hub.close()
+    assert await reader == [b"0", b"1", b"2"]
+    assert hub.stats.dropped == 1
+
+
+@pytest.mark.asyncio
+async def test_snapshot_is_encoded_once_and_sent_to_new_subscribers() -> None:
+    """Test that a lazy snapshot runs once however many subscribers need it."""
+    hub = BroadcastHub(maxsize=1)
+    subscribers = [hub.subscribe() for _ in range(5)]
+    hub.publish(b"delta 1", snapshot=lambda: b"state 1")
+    calls = []
+    hub.publish(b"delta 2", snapshot=lambda: calls.append(1) or b"state 2")
+    assert calls == [1]
+    assert all(sub.queue.get_nowait() == b"state 2" for sub in subscribers)
+    assert hub.subscribe().backlog == [b"state 2"]
+
+
+@pytest.mark.asyncio
+async def test_heartbeat_when_idle() -> None:
+    """Test that idle subscribers receive a comment line while the producer is quiet."""
+    hub = BroadcastHub(heartbeat=0.02)
+    subscriber = hub.subscribe()
+
+    async def quiet_producer(hub: BroadcastHub) -> None:
+        await asyncio.sleep(0.1)
+        hub.close()
+
+    hub.ensure_running(quiet_producer)
+    events = [event async for event in hub.stream(subscriber)]
+    assert events and set(events) == {HEARTBEAT}
+
+
+def test_replay_after_last_event_id() -> None:
+    """Test that a reconnect gets only the missed events, or a snapshot when they are gone."""
+    hub = BroadcastHub(replay_bytes=4 * len(b"id: s-1\ndata: 1\n\n"), stream_id="s")
+    for i in range(1, 7):
+        hub.publish(f"data: {i}\n\n".encode())
+    assert hub.subscribe("s-3").backlog == [f"id: s-{i}\ndata: {i}\n\n".encode() for i in (4, 5, 6)]
+    assert hub.subscribe("s-6").backlog == []
+    snapshot = [b"id: s-6\ndata: 6\n\n"]
+    for last_event_id in ("s-1", "other-3", "s-9", "s-x", None):
+        assert hub.subscribe(last_event_id).backlog == snapshot
+    hub.publish(b"data: " + b"x" * 100 + b"\n\n")
+    assert len(hub.subscribe("s-6").backlog) == 1
+    assert hub.subscribe("s-5").backlog == hub.subscribe().backlog
+
+
+def test_idle_seconds() -> None:
+    """Test that the idle time counts from the last subscriber leaving."""
+    hub = BroadcastHub()
+    first, second = hub.subscribe(), hub.subscribe()
+    hub.unsubscribe(first)
+    assert hub.idle_seconds == 0
+    hub.close(second)
+    assert 0 < hub.idle_seconds < 1
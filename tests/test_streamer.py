@@ -0,0 +1,96 @@
+"""Test the in-process stream processing helpers."""
+
+import pytest
+
+from pyd4all.streamer import Pipeline, SlidingWindow, TumblingWindow, User, registration_message
+
+
+async def numbers(n: int):
+    for i in range(n):
+        yield i
+
+
+@pytest.mark.asyncio
+async def test_pipeline_stages() -> None:
+    """Test that stages compose in order and count their own output."""
+
+    async def double(i: int) -> int:
+        return i * 2
+
+    pipeline = Pipeline().map(double, name="double").filter(lambda i: i % 4 == 0).window(3, step=2)
+    windows = [w async for w in pipeline(numbers(10))]
+    assert windows == [(0, 4, 8), (8, 12, 16)]
+    assert pipeline.stats["double"].items == 10
+    assert pipeline.stats["1:filter"].items == 5
+    assert pipeline.stats["2:window"].items == 2
+
+
+@pytest.mark.asyncio
+async def test_pipeline_fan_out() -> None:
+    """Test that every branch sees every item and the outputs are merged."""
+    pipeline = Pipeline().fan_out(
+        Pipeline().map(lambda i: ("a", i)),
+        Pipeline().filter(lambda i: i > 2).map(lambda i: ("b", i)),
+    )
+    merged = [item async for item in pipeline(numbers(5))]
+    assert sorted(merged) == [("a", 0), ("a", 1), ("a", 2), ("a", 3), ("a", 4), ("b", 3), ("b", 4)]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_run_publishes_final_stage_only() -> None:
+    """Test that only the output of the final stage reaches the sink."""
+    published = []
+
+    async def sink(message: dict) -> None:
+        published.append(message)
+
+    async def users():
+        yield User(user_id=1, user="alice")
+        yield User(user_id=2, user="bob")
+
+    pipeline = Pipeline().filter(lambda u: u.user_id > 1).map(registration_message)
+    assert await pipeline.run(users(), sink) == 1
+    assert published == [{"message": "User: 2 - bob registered."}]
+    assert "1:map: 1 items" in pipeline.report()
+
+
+def test_pipeline_rejects_duplicate_names() -> None:
+    """Test that stage names stay unique so their stats do not collide."""
+    pipeline = Pipeline().map(str, name="step")
+    with pytest.raises(ValueError, match="Duplicate"):
+        pipeline.map(str, name="step")
+
+
+def test_tumbling_window() -> None:
+    """Test that tumbling windows emit one aggregate per closed window."""
+    window = TumblingWindow(size=10, clock=lambda: 0.0)
+    for at in (1, 2, 9.9):
+        assert window.add(at=at) == []
+    [closed] = window.add(at=10)
+    assert (closed.window_start, closed.window_end, closed.count, closed.rate) == (0, 10, 3, 0.3)
+    assert window.flush().count == 1
+
+
+def test_sliding_window_state_is_bounded() -> None:
+    """Test that a long gap closes at most one window per bucket."""
+    window = SlidingWindow(size=60, slide=10, clock=lambda: 0.0)
+    window.add(n=1_000_000, at=5)
+    closed = window.advance(now=10_000)
+    assert len(closed) == 6
+    assert [a.count for a in closed] == [1_000_000] * 6
+    assert window.flush().count == 0
+    assert len(window._counts) == 6
+
+
+def test_sliding_window_rejects_uneven_slide() -> None:
+    """Test that the window size must be a multiple of the slide."""
+    with pytest.raises(ValueError, match="multiple"):
+        SlidingWindow(size=60, slide=7)
+
+
+@pytest.mark.asyncio
+async def test_pipeline_aggregate() -> None:
+    """Test that the aggregate stage flushes the open window at the end."""
+    pipeline = Pipeline().aggregate(TumblingWindow(size=60, clock=lambda: 0.0))
+    [aggregate] = [a async for a in pipeline(numbers(5))]
+    assert aggregate.count == 5
@@ -0,0 +1,61 @@
+"""Test the sized, metered thread pool of sync handlers."""
+
+import asyncio
+import threading
+import time
+
+import anyio.to_thread
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from pyd4all.utils.thread_tools import ThreadPool, ThreadPoolRoute, cheap, thread_pool
+
+
+@pytest.mark.asyncio
+async def test_saturation_and_wait_are_counted() -> None:
+    """Test that the default limiter is resized and calls finding every thread busy are counted."""
+    pool = ThreadPool(size=2)
+
+    def slow() -> int:
+        time.sleep(0.05)
+        return threading.get_ident()
+
+    idents = await asyncio.gather(*(pool.wrap(slow)() for _ in range(4)))
+    assert anyio.to_thread.current_default_thread_limiter().total_tokens == 2
+    assert threading.get_ident() not in idents
+    stats = pool.stats()
+    assert (stats["offloaded"], stats["saturated"], stats["peak_busy"], stats["busy"]) == (4, 2, 2, 0)
+    assert stats["max_wait_seconds"] >= 0.04
+
+
+@pytest.mark.asyncio
+async def test_cheap_handlers_run_inline_only_when_enabled() -> None:
+    """Test that a handler marked cheap runs on the event loop thread with inline handlers on."""
+
+    @cheap
+    def handler(x: int) -> tuple[int, int]:
+        return x, threading.get_ident()
+
+    inline, offloaded = ThreadPool(inline=True), ThreadPool(inline=False)
+    assert await inline.wrap(handler)(1) == (1, threading.get_ident())
+    assert (await offloaded.wrap(handler)(2))[1] != threading.get_ident()
+    assert (inline.metrics.inline, inline.metrics.offloaded, offloaded.metrics.offloaded) == (1, 0, 1)
+
+
+def test_route_class_keeps_the_endpoint_signature() -> None:
+    """Test that routes of a `ThreadPoolRoute` router keep their parameters and go through the pool."""
+    router = APIRouter(route_class=ThreadPoolRoute)
+
+    @router.get("/double/{n}")
+    def double(n: int, scale: int = 2) -> dict[str, int]:
+        return {"n": n * scale}
+
+    app = FastAPI()
+    app.include_router(router, prefix="/api")
+    client = TestClient(app)
+    offloaded = thread_pool.metrics.offloaded
+    assert client.get("/api/double/3", params={"scale": 3}).json() == {"n": 9}
+    assert thread_pool.metrics.offloaded == offloaded + 1
+    parameters = client.get("/openapi.json").json()["paths"]["/api/double/{n}"]["get"]["parameters"]
+    assert [p["name"] for p in parameters] == ["n", "scale"]
@@ -0,0 +1,148 @@
+"""Test size-limited multipart uploads and parallel storage."""
+
+import os
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+from typing import Annotated
+
+import httpx
+import pytest
+from fastapi import FastAPI, UploadFile
+from fastapi.testclient import TestClient
+from fastui.forms import FormFile
+from pydantic import BaseModel
+from starlette.datastructures import Headers
+
+from pyd4all.utils.upload_tools import (
+    LimitedMultiPartParser,
+    UploadTooLarge,
+    expire_uploads,
+    file_limits,
+    store_uploads,
+    upload_form,
+)
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(500)
+
+
+class Upload(BaseModel):
+    name: str
+    avatar: Annotated[UploadFile, FormFile(accept="image/*", max_size=1000)]
+    photos: Annotated[list[UploadFile], FormFile(accept="image/*")] | None = None
+
+
+app = FastAPI()
+received: dict = {}
+
+
+@app.post("/upload")
+async def upload(form: Annotated[Upload, upload_form(Upload, max_body_size=5000, max_file_size=2000)]) -> dict:
+    received["avatar"] = form.avatar
+    stored = await store_uploads([form.avatar, *(form.photos or [])], received["directory"])
+    return {"stored": [(item.size, item.image_type) for item in stored]}
+
+
+client = TestClient(app)
+
+
+def test_file_limits_from_form_file() -> None:
+    """Test that per-field limits are read from `FormFile`, also inside optional lists."""
+    assert file_limits(Upload) == {"avatar": 1000, "photos": None}
+
+
+def test_accepted_files_are_on_disk_and_stored(tmp_path: Path) -> None:
+    """Test that accepted files go to disk, not to an in-memory spool, and are stored by content."""
+    received["directory"] = tmp_path
+    files = [("avatar", ("a.png", PNG, "image/png")), ("photos", ("b.gif", b"GIF89a" + bytes(900), "image/gif"))]
+    response = client.post("/upload", data={"name": "x"}, files=files)
+    assert response.json() == {"stored": [[len(PNG), "png"], [906, "gif"]]}
+    assert not isinstance(received["avatar"].file, SpooledTemporaryFile)
+    assert sorted(path.suffix for path in tmp_path.iterdir()) == [".gif", ".png"]
+
+
+def test_stored_names_ignore_the_client_and_expire(tmp_path: Path) -> None:
+    """Test that a file that is no known image gets no suffix, and that old files are deleted."""
+    received["directory"] = tmp_path
+    files = [("avatar", ("a.png", PNG, "image/png")), ("photos", ("page.html", b"<script>", "image/png"))]
+    response = client.post("/upload", data={"name": "x"}, files=files)
+    assert response.json() == {"stored": [[len(PNG), "png"], [8, None]]}
+    old, new = sorted(tmp_path.iterdir(), key=lambda path: path.suffix)
+    assert old.suffix == ""
+    os.utime(old, (0, 0))
+    assert expire_uploads(tmp_path, 3600) == 1
+    assert list(tmp_path.iterdir()) == [new]
+    assert expire_uploads(tmp_path / "missing", 3600) == 0
+
+
+def test_limits() -> None:
+    """Test that a file over its field limit is a form error and a large body a 413."""
+    files = {"avatar": ("a.png", PNG * 3, "image/png")}
+    response = client.post("/upload", data={"name": "x"}, files=files)
+    assert response.status_code == httpx.codes.UNPROCESSABLE_ENTITY
+    assert response.json()["detail"]["form"][0]["loc"] == ["avatar"]
+    photos = [("photos", ("b.png", PNG * 4, "image/png"))]
+    response = client.post("/upload", data={"name": "x"}, files=[("avatar", ("a.png", PNG, "image/png")), *photos])
+    assert response.status_code == httpx.codes.UNPROCESSABLE_ENTITY
+    files = [("photos", (f"{i}.png", PNG, "image/png")) for i in range(12)]
+    response = client.post("/upload", data={"name": "x"}, files=files)
+    assert response.status_code == httpx.codes.REQUEST_ENTITY_TOO_LARGE
+
+
+@pytest.mark.asyncio
+async def test_parser_stops_reading_at_the_limit() -> None:
+    """Test that parsing stops at the chunk going over a limit, without reading the rest of the body."""
+    boundary = "b0undary"
+    head = f'--{boundary}\r\nContent-Disposition: form-data; name="avatar"; filename="a.png"\r\n\r\n'.encode()
+    chunks_read = 0
+
+    async def body():
+        nonlocal chunks_read
+        for chunk in [head, *[PNG] * 100]:
+            chunks_read += 1
+            yield chunk
+
+    parser = LimitedMultiPartParser(
+        Headers({"content-type": f"multipart/form-data; boundary={boundary}"}),
+        body(),
+        file_limits={"avatar": 1000},
+        max_file_size=None,
+        max_body_size=1 << 20,
+        max_files=1,
+        max_fields=1,
+    )
+    with pytest.raises(UploadTooLarge) as exc_info:
+        await parser.parse()
+    assert exc_info.value.field == "avatar"
+    assert chunks_read == 3
+
+
+@pytest.mark.asyncio
+async def test_starlette_parser_internals() -> None:
+    """Test the private parts of Starlette's parser that `LimitedMultiPartParser` relies on.
+
+    It swaps the spooled file made in `on_headers_finished` for one on disk
+    through `_current_part` and the last of `_files_to_close_on_error`; a
+    Starlette release changing either fails here instead of leaking files.
+    """
+    boundary = "b0undary"
+    head = f'--{boundary}\r\nContent-Disposition: form-data; name="avatar"; filename="a.png"\r\n\r\n'.encode()
+
+    async def body():
+        yield head + PNG + f"\r\n--{boundary}--\r\n".encode()
+
+    parser = LimitedMultiPartParser(
+        Headers({"content-type": f"multipart/form-data; boundary={boundary}"}),
+        body(),
+        file_limits={},
+        max_file_size=None,
+        max_body_size=1 << 20,
+        max_files=1,
+        max_fields=1,
+    )
+    form = await parser.parse()
+    avatar = form["avatar"]
+    assert parser._current_part.file is avatar
+    assert parser._files_to_close_on_error == [avatar.file]
+    assert not isinstance(avatar.file, SpooledTemporaryFile)
+    assert await avatar.read() == PNG
+    await form.close()